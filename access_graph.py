@@ -0,0 +1,590 @@
+"""
+access_graph.py
+One snapshot of who can reach what in the org: users, teams, repos and the
+permission edges between them, held as integer-indexed numpy arrays.
+
+  team membership   user -> team
+  team grants       team -> repo  (role)
+  direct grants     user -> repo  (role, affiliation=direct collaborators)
+  org owners        admin on every repo
+
+One crawl builds it (team grants come from the shared team_repo_index, which
+refreshes incrementally; team members are listed concurrently, direct
+collaborators come from batched GraphQL via collaborator_crawl). After that every access question is a local lookup:
+
+  g = load_graph(token, org)                   # reuses a fresh snapshot if there is one
+  g.permission("alice", "my-repo")             # -> "write" / "" (no access)
+  g.repos_for_user("alice")                    # -> {repo: role}
+  g.users_for_repo("my-repo")                  # -> {login: role}
+  g.teams_for_repo("my-repo") / g.direct_for_repo("my-repo")
+  g.teams_for_user("alice") / g.repos_for_team("my-team")
+  g.repos_with_only_direct() / g.repos_without_access()
+  g.effective_pairs() / g.effective_matrix()   # the whole org at once, vectorised
+  g.diff(older_graph)                          # effective access changes between snapshots
+
+Effective permission is resolved the way GitHub does it: parent-team grants
+flow down to child teams, child-team members count as parent-team members,
+org members get at least the org's default repository permission, owners
+get admin. The team hierarchy is resolved once per load for every team and
+member together.
+
+Edges are stored sorted into CSR form (indptr + columns) both ways round, so a
+query slices a few arrays instead of scanning the edge lists.
+
+Snapshot: data/access_graph.npz (env ACCESS_GRAPH_FILE), rebuilt when older
+than ACCESS_GRAPH_MAX_AGE_HOURS (default 12). A crawl in which any listing
+failed raises instead of producing a snapshot, so nothing partial is saved.
+
+CLI:
+  python access_graph.py build
+  python access_graph.py perm <login> <repo>
+  python access_graph.py effective [--csv out.csv]
+  python access_graph.py diff <old.npz> [<new.npz>] [--csv out.csv]
+"""
+
+import os
+import csv
+import pathlib
+import logging
+import argparse
+import time
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from collaborator_crawl import crawl_collaborators
+from team_repo_index import API_BASE, PER_PAGE, load_team_index, make_session
+
+GRAPH_FILE = pathlib.Path(os.getenv("ACCESS_GRAPH_FILE", "./data/access_graph.npz"))
+MAX_AGE_HOURS = float(os.getenv("ACCESS_GRAPH_MAX_AGE_HOURS", "12"))
+MAX_WORKERS = int(os.getenv("ACCESS_GRAPH_WORKERS", "16"))
+
+# rank = position; 0 means no access
+ROLES = ["", "read", "triage", "write", "maintain", "admin"]
+RANK = {r: i for i, r in enumerate(ROLES)}
+# custom repository roles, ranked as their base role: "name=base,name2=base2"
+CUSTOM_ROLES = {
+    k.strip().lower(): RANK.get(v.strip().lower(), 1)
+    for k, v in (p.split("=", 1) for p in os.getenv("ACCESS_GRAPH_CUSTOM_ROLES", "").split(",") if "=" in p)
+}
+
+log = logging.getLogger("access-graph")
+
+
+def rank_of(role: Optional[str]) -> int:
+    role = (role or "").lower()
+    if role in RANK:
+        return RANK[role]
+    # an unknown custom role is at least read
+    return CUSTOM_ROLES.get(role, 1)
+
+
+class _Adjacency:
+    """CSR view of an edge list: row i's columns and ranks are one slice."""
+
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, ranks: np.ndarray, n_rows: int):
+        order = np.lexsort((cols, rows))
+        self.cols = cols[order]
+        self.ranks = ranks[order]
+        self.indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=self.indptr[1:])
+
+    def row(self, i: int):
+        s, e = self.indptr[i], self.indptr[i + 1]
+        return self.cols[s:e], self.ranks[s:e]
+
+    def rows(self, idx: np.ndarray):
+        if len(idx) == 0:
+            return self.cols[:0], self.ranks[:0]
+        parts = [self.row(i) for i in idx]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+
+def _join(rows: np.ndarray, mids: np.ndarray, adj: _Adjacency):
+    """Edges (row, mid) joined with adj's row `mid` -> (row, col, rank) for every pairing, no Python loop."""
+    starts = adj.indptr[mids]
+    counts = adj.indptr[mids + 1] - starts
+    offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    idx = np.repeat(starts, counts) + offsets
+    return np.repeat(rows, counts), adj.cols[idx], adj.ranks[idx]
+
+
+def _max_by_pair(rows: np.ndarray, cols: np.ndarray, ranks: np.ndarray, n_cols: int):
+    """Collapse duplicate (row, col) pairs to their highest rank."""
+    if len(rows) == 0:
+        return rows.astype(np.int32), cols.astype(np.int32), ranks.astype(np.int8)
+    key = rows.astype(np.int64) * n_cols + cols
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    best = np.maximum.reduceat(ranks[order], starts)
+    key = key[starts]
+    return (key // n_cols).astype(np.int32), (key % n_cols).astype(np.int32), best.astype(np.int8)
+
+
+def _ancestors(parent: np.ndarray):
+    """(team, ancestor) pairs: every team with itself and each team above it."""
+    teams = np.arange(len(parent), dtype=np.int32)
+    out_t, out_a = [teams], [teams]
+    cur = parent.astype(np.int32)
+    alive = cur >= 0
+    for _ in range(len(parent)):  # bounded, so a parent cycle cannot spin forever
+        if not alive.any():
+            break
+        out_t.append(teams[alive])
+        out_a.append(cur[alive])
+        cur = np.where(alive, parent[np.maximum(cur, 0)], -1).astype(np.int32)
+        alive = cur >= 0
+    return np.concatenate(out_t), np.concatenate(out_a)
+
+
+class AccessGraph:
+    """
+    Vocabulary:  users[i], teams[j], repos[k] (lower-cased logins / slugs / repo names)
+    Edges:       member_u/member_t, grant_t/grant_r/grant_rank, direct_u/direct_r/direct_rank
+    Per node:    user_owner, user_member (org owner / org member flags), team_names,
+                 team_parent (index or -1)
+    Org:         base_rank (the org's default repository permission, for members)
+
+    Effective access follows GitHub's rules: a member of a child team is a
+    member of every team above it, a team inherits every grant of the teams
+    above it, org members get at least the base permission on every repo,
+    owners get admin everywhere. The highest role from any path wins.
+    """
+
+    ARRAYS = ("users", "teams", "repos", "team_names", "team_parent", "user_owner", "user_member",
+              "base_rank", "member_u", "member_t", "grant_t", "grant_r", "grant_rank",
+              "direct_u", "direct_r", "direct_rank")
+
+    def __init__(self, org: str, built_at: Optional[str] = None, **arrays):
+        self.org = org
+        self.built_at = built_at
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self._index()
+
+    def _index(self):
+        # plain str lists for building results (numpy indexing would hand back np.str_)
+        self._users, self._teams, self._repos = self.users.tolist(), self.teams.tolist(), self.repos.tolist()
+        self.user_ids = {u: i for i, u in enumerate(self._users)}
+        self.team_ids = {t: i for i, t in enumerate(self._teams)}
+        self.repo_ids = {r: i for i, r in enumerate(self._repos)}
+        self.base = int(self.base_rank)
+        nu, nt, nr = len(self.users), len(self.teams), len(self.repos)
+
+        # grants as configured on each team
+        self.team_grants = _Adjacency(self.grant_t, self.grant_r, self.grant_rank, nt)
+        self.repo_grants = _Adjacency(self.grant_r, self.grant_t, self.grant_rank, nr)
+        self.user_direct = _Adjacency(self.direct_u, self.direct_r, self.direct_rank, nu)
+        self.repo_direct = _Adjacency(self.direct_r, self.direct_u, self.direct_rank, nr)
+
+        # resolve the team hierarchy once, for every team and member at the same time
+        anc_t, anc_a = _ancestors(self.team_parent)
+        team_up = _Adjacency(anc_t, anc_a, np.ones(len(anc_t), dtype=np.int8), nt)
+        mu, mt, _ = _join(self.member_u, self.member_t, team_up)
+        self._mu, self._mt, ones = _max_by_pair(mu, mt, np.ones(len(mu), dtype=np.int8), nt)
+        self.user_teams = _Adjacency(self._mu, self._mt, ones, nu)
+        self.team_users = _Adjacency(self._mt, self._mu, ones, nt)
+        gt, gr, gk = _max_by_pair(*_join(anc_t, anc_a, self.team_grants), nr)
+        self.team_repos = _Adjacency(gt, gr, gk, nt)
+        self.repo_teams = _Adjacency(gr, gt, gk, nr)
+
+    # ------- persistence -------
+    def save(self, path: pathlib.Path = GRAPH_FILE):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(fh, org=np.array(self.org), built_at=np.array(self.built_at or ""),
+                                **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: pathlib.Path = GRAPH_FILE) -> "AccessGraph":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data["org"]), str(data["built_at"]) or None,
+                       **{name: data[name] for name in cls.ARRAYS})
+
+    @property
+    def age(self) -> Optional[timedelta]:
+        if not self.built_at:
+            return None
+        return datetime.now(timezone.utc) - datetime.fromisoformat(self.built_at)
+
+    # ------- lookups -------
+    def _user(self, login: str) -> Optional[int]:
+        return self.user_ids.get(login.lower())
+
+    def _repo(self, repo: str) -> Optional[int]:
+        return self.repo_ids.get(repo.split("/")[-1].lower())
+
+    def _floor(self, users) -> np.ndarray:
+        """What the user(s) get on every repo anyway: the base permission for org members."""
+        return np.where(self.user_member[users], self.base, 0).astype(np.int8)
+
+    def _ranks_for_user(self, u: int) -> np.ndarray:
+        """Effective rank of user u on every repo (vector over repos)."""
+        if self.user_owner[u]:
+            return np.full(len(self.repos), RANK["admin"], dtype=np.int8)
+        ranks = np.full(len(self.repos), self._floor(u), dtype=np.int8)
+        cols, rk = self.team_repos.rows(self.user_teams.row(u)[0])
+        np.maximum.at(ranks, cols, rk)
+        cols, rk = self.user_direct.row(u)
+        np.maximum.at(ranks, cols, rk)
+        return ranks
+
+    def permission(self, login: str, repo: str) -> str:
+        """Highest role the user has on the repo through any path; "" if none."""
+        u, r = self._user(login), self._repo(repo)
+        if u is None or r is None:
+            return ""
+        if self.user_owner[u]:
+            return "admin"
+        best = int(self._floor(u))
+        teams, rk = self.repo_teams.row(r)
+        hit = np.isin(teams, self.user_teams.row(u)[0], assume_unique=True)
+        if hit.any():
+            best = max(best, int(rk[hit].max()))
+        users, rk = self.repo_direct.row(r)
+        pos = np.searchsorted(users, u)
+        if pos < len(users) and users[pos] == u:
+            best = max(best, int(rk[pos]))
+        return ROLES[best]
+
+    def can_reach(self, login: str, repo: str) -> bool:
+        return bool(self.permission(login, repo))
+
+    def repos_for_user(self, login: str, include_base: bool = False) -> Dict[str, str]:
+        """{repo: effective role}; only repos above the org base permission unless include_base."""
+        u = self._user(login)
+        if u is None:
+            return {}
+        ranks = self._ranks_for_user(u)
+        floor = 0 if include_base or self.user_owner[u] else self._floor(u)
+        hit = np.flatnonzero(ranks > floor)
+        return {self._repos[k]: ROLES[ranks[k]] for k in hit}
+
+    def users_for_repo(self, repo: str, include_owners: bool = False,
+                       include_base: bool = False) -> Dict[str, str]:
+        """
+        Effective role per user on the repo. Org owners are left out unless asked;
+        members whose role there is just the org base permission are left out
+        unless include_base.
+        """
+        r = self._repo(repo)
+        if r is None:
+            return {}
+        ranks = np.zeros(len(self.users), dtype=np.int8)
+        teams, team_rk = self.repo_teams.row(r)
+        for t, rk in zip(teams, team_rk):
+            np.maximum.at(ranks, self.team_users.row(t)[0], rk)
+        users, rk = self.repo_direct.row(r)
+        np.maximum.at(ranks, users, rk)
+        floor = self._floor(slice(None))
+        np.maximum(ranks, floor, out=ranks)
+        if not include_base:
+            ranks[ranks <= floor] = 0
+        ranks[self.user_owner] = RANK["admin"] if include_owners else 0
+        hit = np.flatnonzero(ranks)
+        return {self._users[i]: ROLES[ranks[i]] for i in hit}
+
+    def teams_for_repo(self, repo: str, inherited: bool = False) -> Dict[str, str]:
+        """Teams granted on the repo; with inherited, also child teams that get it from a parent."""
+        r = self._repo(repo)
+        if r is None:
+            return {}
+        teams, rk = (self.repo_teams if inherited else self.repo_grants).row(r)
+        return {self._teams[t]: ROLES[k] for t, k in zip(teams, rk)}
+
+    def direct_for_repo(self, repo: str, include_owners: bool = False) -> Dict[str, str]:
+        r = self._repo(repo)
+        if r is None:
+            return {}
+        users, rk = self.repo_direct.row(r)
+        return {self._users[u]: ROLES[k] for u, k in zip(users, rk)
+                if include_owners or not self.user_owner[u]}
+
+    def repos_for_team(self, slug: str) -> Dict[str, str]:
+        """{repo: role} the team's members get through it, grants inherited from parent teams included."""
+        t = self.team_ids.get(slug.lower())
+        if t is None:
+            return {}
+        repos, rk = self.team_repos.row(t)
+        return {self._repos[r]: ROLES[k] for r, k in zip(repos, rk)}
+
+    def teams_for_user(self, login: str) -> List[str]:
+        """Teams the user is in, directly or through a child team."""
+        u = self._user(login)
+        if u is None:
+            return []
+        return [self._teams[t] for t in self.user_teams.row(u)[0]]
+
+    def team_name(self, slug: str) -> str:
+        t = self.team_ids.get(slug.lower())
+        return str(self.team_names[t]) if t is not None else slug
+
+    def owners(self) -> List[str]:
+        return self.users[self.user_owner].tolist()
+
+    def repos_with_only_direct(self) -> List[str]:
+        """Repos reachable through direct collaborators but through no team."""
+        mask = (self.repo_direct.degree() > 0) & (self.repo_grants.degree() == 0)
+        return self.repos[mask].tolist()
+
+    def repos_without_access(self) -> List[str]:
+        """Repos with neither a team grant nor a direct collaborator (owners and base permission aside)."""
+        mask = (self.repo_direct.degree() == 0) & (self.repo_grants.degree() == 0)
+        return self.repos[mask].tolist()
+
+    # ------- whole-org resolution -------
+    def effective_pairs(self):
+        """
+        (user, repo, rank) index arrays for every user x repo pair whose effective
+        role is above what the user gets anyway (org base permission for members).
+        Vectorised over the whole org; org owners are left out (admin everywhere).
+        """
+        nr = len(self.repos)
+        tu, tr, tk = _join(self._mu, self._mt, self.team_repos)
+        u, r, k = _max_by_pair(np.concatenate([tu, self.direct_u]), np.concatenate([tr, self.direct_r]),
+                               np.concatenate([tk, self.direct_rank]), nr)
+        keep = (k > self._floor(u)) & ~self.user_owner[u]
+        return u[keep], r[keep], k[keep]
+
+    def effective_matrix(self) -> np.ndarray:
+        """Dense users x repos int8 matrix of effective ranks (index into ROLES)."""
+        matrix = np.zeros((len(self.users), len(self.repos)), dtype=np.int8)
+        matrix[self.user_member] = self.base
+        u, r, k = self.effective_pairs()
+        matrix[u, r] = k
+        matrix[self.user_owner] = RANK["admin"]
+        return matrix
+
+    # ------- diffing -------
+    def _edge_keys(self):
+        return (
+            {(self._users[u], self._teams[t]) for u, t in zip(self.member_u, self.member_t)},
+            {(self._teams[t], self._repos[r], int(k)) for t, r, k in zip(self.grant_t, self.grant_r, self.grant_rank)}
+            | {(self._teams[t], "parent:" + (self._teams[p] if p >= 0 else ""), 0)
+               for t, p in enumerate(self.team_parent)},
+            {(self._users[u], self._repos[r], int(k)) for u, r, k in zip(self.direct_u, self.direct_r, self.direct_rank)},
+            set(self.owners()),
+            set(self.users[self.user_member].tolist()),
+        )
+
+    def diff(self, before: "AccessGraph") -> List[Dict[str, str]]:
+        """
+        Effective access changes from `before` to this snapshot:
+        [{"login", "repo", "before", "after"}]. Only users touched by a changed
+        edge (membership, team grant or parent, direct grant, owner or member
+        flag) are recomputed -- everyone, if the org base permission changed.
+        """
+        old_m, old_g, old_d, old_o, old_mem = before._edge_keys()
+        new_m, new_g, new_d, new_o, new_mem = self._edge_keys()
+        touched = {login for login, _ in old_m ^ new_m}
+        if before.base != self.base:
+            touched |= old_mem | new_mem
+        touched |= {login for login, _, _ in old_d ^ new_d}
+        touched |= (old_o ^ new_o) | (old_mem ^ new_mem)
+        changed_teams = {slug for slug, _, _ in old_g ^ new_g}
+        for g in (before, self):
+            for slug in changed_teams:
+                t = g.team_ids.get(slug)
+                if t is not None:
+                    # effective members: the team's own and those of every team below it
+                    touched.update(g.users[g.team_users.row(t)[0]].tolist())
+
+        rows = []
+        for login in sorted(touched):
+            old = before.repos_for_user(login, include_base=True)
+            new = self.repos_for_user(login, include_base=True)
+            for repo in sorted(set(old) | set(new)):
+                if old.get(repo, "") != new.get(repo, ""):
+                    rows.append({"login": login, "repo": repo,
+                                 "before": old.get(repo, ""), "after": new.get(repo, "")})
+        return rows
+
+
+# ------- crawl -------
+def _get_all(session, url: str, params: Optional[Dict] = None) -> List[Dict]:
+    out = []
+    params = dict(params or {}, per_page=PER_PAGE)
+    while url:
+        r = session.get(url, params=params, timeout=60)
+        r.raise_for_status()
+        out.extend(r.json())
+        url = r.links.get("next", {}).get("url")
+        params = None
+    return out
+
+
+def _fan_out(fn, keys, what: str) -> Dict[str, List[Dict]]:
+    """
+    Run fn(key) for every key in a thread pool. Failed keys are logged and,
+    once every key has run, raise: a listing with holes is not a snapshot.
+    """
+    out, failed = {}, []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(fn, k): k for k in keys}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                out[key] = fut.result()
+            except Exception as e:
+                failed.append(key)
+                log.warning("%s %s: %s", what, key, e)
+    if failed:
+        raise RuntimeError(f"{what}: {len(failed)} of {len(futures)} failed ({', '.join(sorted(failed)[:10])})")
+    return out
+
+
+def build_graph(token: str, org: str) -> AccessGraph:
+    """Crawl the org; raises if any team, member listing or repo could not be read."""
+    session = make_session(token, pool_size=MAX_WORKERS)
+    org_url = f"{API_BASE}/orgs/{org}"
+
+    team_index = load_team_index(token, org)
+    if team_index.sweep_failures:
+        raise RuntimeError(f"Team repos: {len(team_index.sweep_failures)} team(s) could not be listed "
+                           f"({', '.join(team_index.sweep_failures[:10])})")
+    r = session.get(org_url, timeout=60)
+    r.raise_for_status()
+    # "none" / "read" / "write" / "admin"; every org member gets at least this on every repo
+    base_role = r.json().get("default_repository_permission") or "none"
+    owners = {m["login"].lower() for m in _get_all(session, f"{org_url}/members", {"role": "admin"})}
+    members = {m["login"].lower() for m in _get_all(session, f"{org_url}/members")}
+    repo_names = [r["name"].lower() for r in _get_all(session, f"{org_url}/repos", {"type": "all"})]
+    log.info("Org %s: %d members (%d owners), %d repos, %d teams, base permission %s.",
+             org, len(members), len(owners), len(repo_names), len(team_index.teams), base_role)
+
+    team_members = _fan_out(lambda slug: _get_all(session, f"{org_url}/teams/{slug}/members"),
+                            list(team_index.teams), "Team members")
+    collaborators = crawl_collaborators(session, org, repo_names, strict=True)
+
+    # vocabulary
+    users = set(members) | owners
+    for listing in list(team_members.values()) + list(collaborators.values()):
+        users.update(m["login"].lower() for m in listing)
+    users = np.array(sorted(users))
+    teams = np.array(sorted(team_index.teams))
+    repos = np.array(sorted(set(repo_names) | set(team_index.repos)))
+    uid = {u: i for i, u in enumerate(users.tolist())}
+    tid = {t: i for i, t in enumerate(teams.tolist())}
+    rid = {r: i for i, r in enumerate(repos.tolist())}
+
+    member_u, member_t = [], []
+    for slug, listing in team_members.items():
+        for m in listing:
+            member_u.append(uid[m["login"].lower()])
+            member_t.append(tid[slug])
+
+    grant_t, grant_r, grant_rank = [], [], []
+    for slug, team in team_index.teams.items():
+        for repo, role in team["repos"].items():
+            grant_t.append(tid[slug])
+            grant_r.append(rid[repo])
+            grant_rank.append(rank_of(role))
+
+    direct_u, direct_r, direct_rank = [], [], []
+    for repo, listing in collaborators.items():
+        for c in listing:
+            direct_u.append(uid[c["login"].lower()])
+            direct_r.append(rid[repo])
+            direct_rank.append(rank_of(c.get("role_name")))
+
+    team_parent = np.array([tid.get(team_index.teams[t].get("parent") or "", -1) for t in teams.tolist()],
+                           dtype=np.int32)
+    graph = AccessGraph(
+        org, datetime.now(timezone.utc).isoformat(),
+        users=users, teams=teams, repos=repos,
+        team_names=np.array([team_index.teams[t].get("name") or t for t in teams.tolist()]),
+        team_parent=team_parent,
+        user_owner=np.isin(users, np.array(sorted(owners))),
+        user_member=np.isin(users, np.array(sorted(members | owners))),
+        base_rank=np.array(RANK.get(base_role, 0), dtype=np.int8),
+        member_u=np.array(member_u, dtype=np.int32), member_t=np.array(member_t, dtype=np.int32),
+        grant_t=np.array(grant_t, dtype=np.int32), grant_r=np.array(grant_r, dtype=np.int32),
+        grant_rank=np.array(grant_rank, dtype=np.int8),
+        direct_u=np.array(direct_u, dtype=np.int32), direct_r=np.array(direct_r, dtype=np.int32),
+        direct_rank=np.array(direct_rank, dtype=np.int8),
+    )
+    log.info("Access graph built: %d users, %d teams, %d repos, %d memberships, %d team grants, %d direct grants.",
+             len(users), len(teams), len(repos), len(member_u), len(grant_t), len(direct_u))
+    return graph
+
+
+def load_graph(token: str, org: str, path: pathlib.Path = GRAPH_FILE,
+               max_age_hours: float = MAX_AGE_HOURS) -> AccessGraph:
+    """The saved snapshot if it is for this org and fresh enough, else a new crawl (saved)."""
+    path = pathlib.Path(path)
+    if path.exists():
+        try:
+            graph = AccessGraph.load(path)
+            if graph.org.lower() == org.lower() and graph.age is not None \
+                    and graph.age < timedelta(hours=max_age_hours):
+                log.info("Using access graph %s (built %s).", path, graph.built_at)
+                return graph
+        except Exception as e:
+            log.warning("Could not read access graph %s (%s); rebuilding.", path, e)
+    graph = build_graph(token, org)
+    graph.save(path)
+    return graph
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build")
+    s = sub.add_parser("perm")
+    s.add_argument("login")
+    s.add_argument("repo")
+    s = sub.add_parser("effective")
+    s.add_argument("--csv", default="./data/effective_permissions.csv")
+    s = sub.add_parser("diff")
+    s.add_argument("old")
+    s.add_argument("new", nargs="?", default=str(GRAPH_FILE))
+    s.add_argument("--csv")
+    args = p.parse_args(argv)
+
+    token = os.getenv("GITHUB_PAT") or os.getenv("GITHUB_TOKEN", "")
+    org = os.getenv("GH_ORG", "JHDevOps")
+    if args.cmd == "build":
+        build_graph(token, org).save(GRAPH_FILE)
+        log.info("Saved %s", GRAPH_FILE)
+    elif args.cmd == "perm":
+        graph = load_graph(token, org)
+        print(graph.permission(args.login, args.repo) or "none")
+    elif args.cmd == "effective":
+        graph = load_graph(token, org)
+        started = time.perf_counter()
+        u, r, k = graph.effective_pairs()
+        log.info("Resolved %d users x %d repos in %.2fs: %d pair(s) above the base permission (%s).",
+                 len(graph.users), len(graph.repos), time.perf_counter() - started, len(u),
+                 ROLES[graph.base] or "none")
+        pathlib.Path(args.csv).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.csv, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["login", "repo", "role"])
+            writer.writerows(zip(graph.users[u].tolist(), graph.repos[r].tolist(), (ROLES[x] for x in k)))
+        log.info("Saved %s", args.csv)
+    else:
+        rows = AccessGraph.load(pathlib.Path(args.new)).diff(AccessGraph.load(pathlib.Path(args.old)))
+        for r in rows:
+            print(f"{r['login']:<30} {r['repo']:<50} {r['before'] or '-':>9} -> {r['after'] or '-'}")
+        if args.csv:
+            with open(args.csv, "w", newline="", encoding="utf-8") as fh:
+                writer = csv.DictWriter(fh, fieldnames=["login", "repo", "before", "after"])
+                writer.writeheader()
+                writer.writerows(rows)
+        log.info("%d effective access change(s).", len(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,36 @@
-import time
 import logging
 from typing import Dict, List, Optional, Tuple
 import requests
-import jwt  
 import os
+import csv
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from githubapp_index import AmbiguousInstallation, load_index
+from githubapp_placement import pick_app_for_new_repo, load_usage
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+from gh_throttle import RateLimiter
+
+ratelimit_telemetry.install()
 
 
 USER_PAT = os.getenv('GITHUB_PAT') 
-APP_SLUG = os.getenv('githubapp') 
+APP_SLUG = os.getenv('githubapp')  # or "auto": pick the installation with most API headroom
 ACTION = os.getenv('action')  
 REPO_FULLNAME = os.getenv('repo_name') 
 
 TEAM_ACL_READ = os.getenv('team_acl_read', '').lower()
 
+# Batch mode: one entry per line, "<add|remove> <owner/repo> [app-slug]".
+# A bare "owner/repo" uses the `action` / `githubapp` parameters above.
+REPO_LIST = os.getenv('repo_list', '')
+REPO_LIST_FILE = os.getenv('repo_list_file', '')
+BATCH_WORKERS = int(os.getenv('batch_workers', '8'))
+BATCH_RESULTS_CSV = pathlib.Path(os.getenv('batch_results_csv', './data/app_batch_results.csv'))
+LIMITER = RateLimiter(per_second=float(os.getenv('batch_requests_per_second', '5')))
+
 BASE_URL = "https://api.github.com"
 
 APPS: Dict[str, Dict[str, str]] = {
@@ -55,6 +73,9 @@ APPS: Dict[str, Dict[str, str]] = {
 
 READ_TEAM_SLUG = "jh_devops_pipeline_team_acl"
 
+APP_INDEX = None  # repo -> (app, installation) index, loaded in run()
+USAGE = None      # recent /rate_limit usage per installation, for githubapp=auto
+
 log = logging.getLogger("gh-app-repos")
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -64,7 +85,7 @@ class GitHubError(Exception):
     pass
 
 def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
-    resp = requests.request(method, url, headers=headers, **kwargs)
+    resp = request(method, url, headers=headers, **kwargs)
     if 200 <= resp.status_code < 300:
         return resp
     try:
@@ -74,9 +95,7 @@ def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
     raise GitHubError(f"{method} {url} -> {resp.status_code}: {body}")
 
 def generate_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 600, "iss": app_id}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def get_app(jwt_token: str) -> Dict:
     url = f"{BASE_URL}/app"
@@ -89,10 +108,7 @@ def get_installations(jwt_token: str) -> List[Dict]:
     return gh_request("GET", url, headers).json()
 
 def get_installation_token(jwt_token: str, installation_id: int) -> str:
-    url = f"{BASE_URL}/app/installations/{installation_id}/access_tokens"
-    headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
-    r = gh_request("POST", url, headers)
-    return r.json()["token"]
+    return BROKER.installation_token(installation_id, jwt_token)
 
 def installation_has_repo_with_inst_token(inst_token: str, repo_id: int) -> bool:
     headers = {"Authorization": f"Bearer {inst_token}", "Accept": "application/vnd.github+json"}
@@ -151,25 +167,35 @@ def pick_installation(installs: List[Dict], repo_owner: str) -> int:
     log.error("Could not auto-pick installation. Installations for this app:")
     for i in installs:
         log.error("  id=%s owner=%s", i["id"], i["account"]["login"])
-    raise SystemExit("Disambiguation needed: multiple installations and none/too many match repo owner.")
+    # GitHubError, not SystemExit: batch workers must be able to fail just this entry
+    raise GitHubError("Disambiguation needed: multiple installations and none/too many match repo owner.")
 
 def find_repo_in_any_app(repo_id: int) -> Optional[Tuple[str, int]]:
-    
-    for slug, cfg in APPS.items():
-        try:
-            jwt_token = generate_jwt(cfg["id"], cfg["private_key"])
-            
-            _ = get_app(jwt_token)
-            installs = get_installations(jwt_token)
-            for inst in installs:
-                inst_id = inst["id"]
-                if installation_has_repo(jwt_token, inst_id, repo_id):
-                    return slug, inst_id
-        except Exception as e:
-            
-            log.debug("Skipping app %s during global check: %s", slug, e)
-            continue
-    return None
+    # local index lookup (refreshed incrementally) instead of scanning every app
+    try:
+        return APP_INDEX.lookup(repo_id)
+    except AmbiguousInstallation as e:
+        # in several apps already: picking one would hide the drift
+        raise GitHubError(f"Ambiguous: {e}")
+
+
+def find_repo_live(repo_id: int, owner: str) -> Optional[Tuple[str, int]]:
+    """
+    Ask GitHub which configured app installation on `owner` holds the repo.
+    Only used when the index says a repo to remove is in no app: the index
+    misses same-count swaps made outside these scripts.
+    """
+    installs = [(i["app_slug"], int(i["installation_id"])) for i in list(APP_INDEX.installations.values())
+                if i["app_slug"] in APPS and (i.get("account") or "").lower() == owner.lower()]
+    found = []
+    for slug, inst_id in installs:
+        cfg = APPS[slug]
+        LIMITER.wait()
+        if installation_has_repo(generate_jwt(cfg["id"], cfg["private_key"]), inst_id, repo_id):
+            found.append((slug, inst_id))
+    if len(found) > 1:
+        raise GitHubError(f"Ambiguous: repo {repo_id} is in {len(found)} app installations ({found})")
+    return found[0] if found else None
 
 
 def grant_team_repo_access_read(pat: str, org: str, repo: str, team_slug: str):
@@ -193,7 +219,7 @@ def run():
         raise SystemExit("ACTION must be 'add' or 'remove'")
 
     
-    if ACTION == "add" and APP_SLUG not in APPS:
+    if ACTION == "add" and APP_SLUG not in APPS and APP_SLUG != "auto":
         raise SystemExit(f"Unknown APP_SLUG '{APP_SLUG}'. Choose one of: {list(APPS.keys())}")
 
     if not USER_PAT or USER_PAT.startswith("ghp_your_PAT_here"):
@@ -206,6 +232,9 @@ def run():
     repo_id = repo_id_with_pat(USER_PAT, REPO_FULLNAME)
     log.info("Repo id for %s is %s", REPO_FULLNAME, repo_id)
 
+    global APP_INDEX
+    APP_INDEX = load_index(APPS)
+
     
     found = find_repo_in_any_app(repo_id)
 
@@ -220,7 +249,19 @@ def run():
     installation_id_override = None
     effective_app_slug = APP_SLUG
 
+    if ACTION == "add" and APP_SLUG == "auto":
+        placed = pick_app_for_new_repo(APP_INDEX, repo_owner, allowed_slugs=APPS.keys())
+        if not placed:
+            raise SystemExit(f"githubapp=auto but no indexed installation on '{repo_owner}'.")
+        effective_app_slug, installation_id_override = placed
+
     if ACTION == "remove":
+        if not found:
+            found = find_repo_live(repo_id, repo_owner)
+            if found:
+                log.warning("Index had no app for %s, but it is in '%s' (installation %s); index updated.",
+                            REPO_FULLNAME, *found)
+                APP_INDEX.record_add(repo_id, REPO_FULLNAME, *found)
         if not found:
             log.info("Repo %s is not part of any configured GitHub App installation. Nothing to remove.", REPO_FULLNAME)
             return
@@ -254,7 +295,7 @@ def run():
     owner = [i for i in installs if i["id"] == installation_id][0]["account"]["login"]
     log.info("Chosen installation %s on owner '%s'", installation_id, owner)
 
-    is_member = installation_has_repo(jwt_token, installation_id, repo_id)
+    is_member = found is not None and found == (effective_app_slug, installation_id)
     if ACTION == "add" and is_member:
         log.info("Repo %s is already part of this app installation %s. Skipping.", REPO_FULLNAME, installation_id)
         return
@@ -266,14 +307,176 @@ def run():
              "Adding" if ACTION == "add" else "Removing", REPO_FULLNAME, installation_id)
     if ACTION == "add":
         add_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+        APP_INDEX.record_add(repo_id, REPO_FULLNAME, effective_app_slug, installation_id)
+        APP_INDEX.save()
         if TEAM_ACL_READ == "yes":
             grant_team_repo_access_read(USER_PAT, repo_owner, REPO_FULLNAME.split("/", 1)[1], READ_TEAM_SLUG)
         else:
             log.info("Skipping team READ access because team_acl_read is '%s'", TEAM_ACL_READ)
     else:
         remove_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+        APP_INDEX.record_remove(repo_id, effective_app_slug, installation_id)
+        APP_INDEX.save()
 
     log.info("Done.")
 
 
-run()
+def parse_batch_entries() -> List[Tuple[str, str, Optional[str]]]:
+    lines = REPO_LIST.splitlines()
+    if REPO_LIST_FILE:
+        lines += pathlib.Path(REPO_LIST_FILE).read_text(encoding="utf-8").splitlines()
+
+    entries = []
+    for raw in lines:
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.replace(",", " ").split()
+        if parts[0].lower() in ("add", "remove"):
+            action, parts = parts[0].lower(), parts[1:]
+        else:
+            action = ACTION
+        if not parts or "/" not in parts[0] or action not in ("add", "remove"):
+            raise SystemExit(f"Bad batch entry '{raw}'. Expected '<add|remove> owner/repo [app-slug]'.")
+        app_slug = parts[1] if len(parts) > 1 else APP_SLUG
+        if action == "add" and app_slug not in APPS and app_slug != "auto":
+            raise SystemExit(f"Unknown app '{app_slug}' in batch entry '{raw}'.")
+        entries.append((action, parts[0], app_slug))
+    return entries
+
+
+def resolve_installation(slug: str, owner: str) -> int:
+    inst_id = APP_INDEX.installation_for_owner(slug, owner)
+    if inst_id:
+        return inst_id
+    cfg = APPS[slug]
+    LIMITER.wait()
+    return pick_installation(get_installations(generate_jwt(cfg["id"], cfg["private_key"])), owner)
+
+
+def process_batch_entry(action: str, full_name: str, app_slug: Optional[str], index_lock: threading.Lock) -> Dict:
+    row = {"repo": full_name, "action": action, "app": app_slug or "", "installation": "",
+           "status": "", "detail": ""}
+    owner, repo = full_name.split("/", 1)
+
+    LIMITER.wait()
+    repo_id = repo_id_with_pat(USER_PAT, full_name)
+    found = find_repo_in_any_app(repo_id)
+
+    if action == "add":
+        if found:
+            row.update(app=found[0], installation=found[1], status="skipped",
+                       detail="already in an app")
+            return row
+        if app_slug == "auto":
+            # pick under the lock: record_add bumps repo counts, so a batch spreads out
+            with index_lock:
+                placed = pick_app_for_new_repo(APP_INDEX, owner, allowed_slugs=APPS.keys(), usage=USAGE)
+                if not placed:
+                    raise GitHubError(f"no indexed installation on '{owner}' for githubapp=auto")
+                app_slug, installation_id = placed
+                APP_INDEX.record_add(repo_id, full_name, app_slug, installation_id)
+            row["app"] = app_slug
+        else:
+            installation_id = resolve_installation(app_slug, owner)
+        row["installation"] = installation_id
+        LIMITER.wait()
+        try:
+            add_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+        except Exception:
+            with index_lock:
+                APP_INDEX.record_remove(repo_id, app_slug, installation_id)
+            raise
+        with index_lock:
+            APP_INDEX.record_add(repo_id, full_name, app_slug, installation_id)
+        if TEAM_ACL_READ == "yes":
+            LIMITER.wait()
+            grant_team_repo_access_read(USER_PAT, owner, repo, READ_TEAM_SLUG)
+            row["detail"] = f"team {READ_TEAM_SLUG} READ granted"
+        row["status"] = "added"
+        return row
+
+    if not found:
+        found = find_repo_live(repo_id, owner)
+        if not found:
+            row.update(status="skipped", detail="not in any configured app")
+            return row
+        with index_lock:
+            APP_INDEX.record_add(repo_id, full_name, *found)
+        row["detail"] = "index was stale; confirmed live"
+    slug, installation_id = found
+    row.update(app=slug, installation=installation_id)
+    LIMITER.wait()
+    remove_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+    with index_lock:
+        APP_INDEX.record_remove(repo_id, slug, installation_id)
+    row["status"] = "removed"
+    return row
+
+
+def process_repo_entries(items: List[Tuple[str, str, Optional[str]]], index_lock: threading.Lock) -> List[Dict]:
+    rows = []
+    for action, name, slug in items:
+        try:
+            rows.append(process_batch_entry(action, name, slug, index_lock))
+        except Exception as e:
+            rows.append({"repo": name, "action": action, "app": slug or "", "installation": "",
+                         "status": "failed", "detail": str(e)[:300]})
+    return rows
+
+
+def run_batch():
+    if not USER_PAT or USER_PAT.startswith("ghp_your_PAT_here"):
+        raise SystemExit("Set USER_PAT at the top (needs to be an org admin PAT).")
+
+    entries = parse_batch_entries()
+    if not entries:
+        raise SystemExit("Batch mode selected but no repos were given.")
+    log.info("Batch mode: %d entries, %d workers.", len(entries), BATCH_WORKERS)
+
+    global APP_INDEX, USAGE
+    APP_INDEX = load_index(APPS)
+    USAGE = load_usage()
+
+    # entries for the same repo run one after another in one worker, in input order,
+    # so a second add sees the first one in the index instead of racing it
+    by_repo: Dict[str, List[Tuple[str, str, Optional[str]]]] = {}
+    for entry in entries:
+        by_repo.setdefault(entry[1].lower(), []).append(entry)
+
+    index_lock = threading.Lock()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            futures = [pool.submit(process_repo_entries, items, index_lock) for items in by_repo.values()]
+            for fut in as_completed(futures):
+                for row in fut.result():
+                    log.info("%-8s %-45s %s", row["status"], row["repo"], row["detail"])
+                    results.append(row)
+    finally:
+        # whatever happened, keep the adds/removes already made in the index
+        APP_INDEX.save()
+
+    results.sort(key=lambda r: r["repo"].lower())
+    BATCH_RESULTS_CSV.parent.mkdir(parents=True, exist_ok=True)
+    with open(BATCH_RESULTS_CSV, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=["repo", "action", "app", "installation", "status", "detail"])
+        writer.writeheader()
+        writer.writerows(results)
+
+    log.info("==== BATCH RESULT ====")
+    log.info("%-45s %-7s %-26s %-12s %s", "repo", "action", "app", "installation", "status")
+    for r in results:
+        log.info("%-45s %-7s %-26s %-12s %s", r["repo"], r["action"], r["app"], r["installation"], r["status"])
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    log.info("Totals: %s  (table saved to %s)", counts, BATCH_RESULTS_CSV)
+    if counts.get("failed"):
+        raise SystemExit(1)
+
+
+if REPO_LIST.strip() or REPO_LIST_FILE:
+    run_batch()
+else:
+    run()
@@ -0,0 +1,335 @@
+# audit_log_store.py
+# Local, append-only copy of the org audit log with indexed lookups.
+#
+# Instead of a rate-limited `phrase` search per question (last_git_login_user.py
+# made up to three per user), the audit log is streamed once into SQLite and
+# every later run only fetches what is new:
+#
+#   store = AuditLogStore()
+#   store.ingest(session, org)                  # pages forward from the saved cursor
+#   store.ingest(session, org, include="all")   # web + git events (own cursor)
+#   store.events(actor="alice", action="user.login", limit=1)     # newest first
+#   store.events(repo="JHDevOps/my-repo", since=datetime(...))
+#   store.latest("alice", ["user.login", "user.failed_login"])
+#   store.last_seen(["user.login"])             # {actor: newest timestamp}, one indexed query
+#
+# Ingest pages oldest -> newest (order=asc, per_page=100, cursor paging with
+# `after`). Each page is written together with its cursor in one transaction,
+# so an interrupted run resumes at the page it was on. A finished run keeps the
+# cursor of the last page; the next run re-reads that page (duplicates are
+# ignored by _document_id) and continues. If GitHub no longer accepts the
+# cursor, ingest restarts from the newest stored timestamp (created:>=date).
+#
+# The first ingest for an org only goes back AUDIT_LOG_RETENTION_DAYS (default
+# 180, GitHub's own retention for web events), and every ingest ends by
+# pruning stored events older than that, so the file does not grow forever.
+#
+# Tables
+#   events     : one row per audit event (document_id primary key), indexed by
+#                (actor, ts), (action, ts) and (repo, ts); raw JSON kept as-is
+#   checkpoint : per org and include, the last cursor and the newest event timestamp
+#
+# File: data/audit_log.sqlite (env AUDIT_LOG_DB). AUDIT_LOG_INCLUDE is
+# web / git / all (default web: git events are high-volume and only needed
+# for clone/push questions). Needs a token with read:audit_log.
+
+import os
+import json
+import sqlite3
+import pathlib
+import logging
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
+API_BASE = "https://api.github.com"
+AUDIT_LOG_DB = pathlib.Path(os.getenv("AUDIT_LOG_DB", "./data/audit_log.sqlite"))
+INCLUDE = os.getenv("AUDIT_LOG_INCLUDE", "web")
+RETENTION_DAYS = int(os.getenv("AUDIT_LOG_RETENTION_DAYS", "180"))
+PER_PAGE = 100
+
+log = logging.getLogger("audit-log")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    document_id TEXT    PRIMARY KEY,
+    org         TEXT    NOT NULL,
+    ts          INTEGER NOT NULL,          -- @timestamp, epoch milliseconds
+    actor       TEXT,                      -- lower-cased login
+    action      TEXT    NOT NULL,
+    repo        TEXT,                      -- lower-cased owner/name
+    raw         TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_actor ON events (actor, ts);
+CREATE INDEX IF NOT EXISTS events_by_action ON events (action, ts);
+CREATE INDEX IF NOT EXISTS events_by_repo ON events (repo, ts);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    org         TEXT    NOT NULL,
+    include     TEXT    NOT NULL,          -- web / git / all: each has its own cursor
+    cursor      TEXT,
+    newest_ts   INTEGER,
+    updated_at  TEXT,
+    PRIMARY KEY (org, include)
+);
+"""
+
+
+def parse_github_time(value) -> Optional[datetime]:
+    """ISO 8601 string, epoch seconds or epoch milliseconds -> aware UTC datetime."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        # >= 10^12 is milliseconds
+        return datetime.fromtimestamp(value / 1000.0 if value >= 1_000_000_000_000 else value, tz=timezone.utc)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except Exception:
+            return None
+    return None
+
+
+def _ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _row(org: str, ev: Dict):
+    dt = parse_github_time(ev.get("@timestamp") or ev.get("created_at") or ev.get("timestamp"))
+    doc_id = ev.get("_document_id") or ev.get("document_id")
+    if dt is None or not doc_id:
+        return None
+    repo = ev.get("repo") or ev.get("repository")
+    return (doc_id, org.lower(), _ms(dt), (ev.get("actor") or "").lower() or None,
+            ev.get("action") or "", repo.lower() if isinstance(repo, str) else None,
+            json.dumps(ev, separators=(",", ":")))
+
+
+def _after(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    return (parse_qs(urlparse(url).query).get("after") or [None])[0]
+
+
+def make_session(token: str) -> requests.Session:
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    })
+    return session
+
+
+class AuditLogStore:
+    def __init__(self, path: pathlib.Path = AUDIT_LOG_DB):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        cols = [r["name"] for r in self.conn.execute("PRAGMA table_info(checkpoint)")]
+        if cols and "include" not in cols:
+            # checkpoints from before include was part of the key were all "all"
+            with self.conn:
+                self.conn.execute("ALTER TABLE checkpoint RENAME TO checkpoint_old")
+                self.conn.executescript(SCHEMA)
+                self.conn.execute("INSERT INTO checkpoint SELECT org, 'all', cursor, newest_ts, updated_at "
+                                  "FROM checkpoint_old")
+                self.conn.execute("DROP TABLE checkpoint_old")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        # fold the WAL back so the single .sqlite file is a complete artifact
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    # ------- checkpoint -------
+    def checkpoint(self, org: str, include: str = INCLUDE) -> Dict:
+        row = self.conn.execute("SELECT cursor, newest_ts FROM checkpoint WHERE org=? AND include=?",
+                                (org.lower(), include)).fetchone()
+        return {"cursor": row["cursor"], "newest_ts": row["newest_ts"]} if row else {"cursor": None, "newest_ts": None}
+
+    def _write_page(self, org: str, include: str, events: Iterable[Dict], cursor: Optional[str]) -> int:
+        rows = [r for r in (_row(org, ev) for ev in events) if r is not None]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO events (document_id, org, ts, actor, action, repo, raw) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            added = self.conn.total_changes - before
+            self.conn.execute("""
+                INSERT INTO checkpoint (org, include, cursor, newest_ts, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (org, include) DO UPDATE SET
+                    cursor = excluded.cursor,
+                    newest_ts = MAX(COALESCE(newest_ts, 0), COALESCE(excluded.newest_ts, 0)),
+                    updated_at = excluded.updated_at
+            """, (org.lower(), include, cursor, max((r[2] for r in rows), default=None),
+                  datetime.now(timezone.utc).isoformat()))
+        return added
+
+    # ------- ingest -------
+    def ingest(self, session: requests.Session, org: str, max_pages: Optional[int] = None,
+               include: str = INCLUDE, retention_days: Optional[int] = RETENTION_DAYS) -> int:
+        """
+        Fetch events newer than the checkpoint; returns how many new events were
+        stored. Without a checkpoint only the last `retention_days` are read,
+        and afterwards events older than that are pruned (None keeps everything).
+        """
+        state = self.checkpoint(org, include)
+        url = f"{API_BASE}/orgs/{org}/audit-log"
+        params = {"include": include, "order": "asc", "per_page": PER_PAGE}
+        if state["cursor"]:
+            params["after"] = state["cursor"]
+        elif state["newest_ts"]:
+            params["phrase"] = "created:>=" + parse_github_time(state["newest_ts"]).strftime("%Y-%m-%d")
+        elif retention_days:
+            since = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            params["phrase"] = "created:>=" + since.strftime("%Y-%m-%d")
+
+        cursor, added, pages = state["cursor"], 0, 0
+        while url:
+            r = session.get(url, params=params, timeout=60)
+            if r.status_code in (400, 422) and params and "after" in params:
+                # cursor expired or rejected: restart from the newest stored day instead
+                log.warning("Audit log cursor rejected (%s); resuming by date.", r.status_code)
+                params = {"include": include, "order": "asc", "per_page": PER_PAGE}
+                if state["newest_ts"]:
+                    params["phrase"] = "created:>=" + parse_github_time(state["newest_ts"]).strftime("%Y-%m-%d")
+                cursor = None
+                continue
+            r.raise_for_status()
+            # the cursor that fetched this page is kept until a later page exists
+            added += self._write_page(org, include, r.json(), cursor)
+            pages += 1
+            next_url = r.links.get("next", {}).get("url")
+            if next_url:
+                cursor = _after(next_url) or cursor
+            url, params = next_url, None
+            if max_pages and pages >= max_pages:
+                break
+            if pages % 50 == 0:
+                log.info("Audit log: %d page(s), %d new event(s) so far.", pages, added)
+        log.info("Audit log for %s (%s): %d page(s) read, %d new event(s) stored.", org, include, pages, added)
+        if retention_days:
+            self.prune(datetime.now(timezone.utc) - timedelta(days=retention_days))
+        return added
+
+    def prune(self, before: datetime) -> int:
+        """Delete stored events older than `before`; returns how many were removed."""
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM events WHERE ts < ?", (_ms(before),)).rowcount
+        if removed:
+            log.info("Pruned %d event(s) older than %s.", removed, before.strftime("%Y-%m-%d"))
+        return removed
+
+    # ------- query -------
+    def events(self, actor: Optional[str] = None, action: Union[str, List[str], None] = None,
+               repo: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               org: Optional[str] = None, limit: Optional[int] = None, newest_first: bool = True) -> List[Dict]:
+        """
+        Stored events matching every given filter. `action` is an exact action,
+        a list of them, or a prefix ending in "." (e.g. "repo."). `repo` is
+        owner/name. Each result is the raw event dict.
+        """
+        where, args = [], []
+        if actor:
+            where.append("actor = ?")
+            args.append(actor.lower())
+        if isinstance(action, str) and action.endswith("."):
+            # range scan on the action index, same as LIKE 'prefix%' without the collation caveats
+            where.append("action >= ? AND action < ?")
+            args += [action, action[:-1] + "/"]
+        elif isinstance(action, str):
+            where.append("action = ?")
+            args.append(action)
+        elif action:
+            where.append(f"action IN ({','.join('?' * len(action))})")
+            args += list(action)
+        if repo:
+            where.append("repo = ?")
+            args.append(repo.lower())
+        if since:
+            where.append("ts >= ?")
+            args.append(_ms(since))
+        if until:
+            where.append("ts < ?")
+            args.append(_ms(until))
+        if org:
+            where.append("org = ?")
+            args.append(org.lower())
+        sql = "SELECT raw FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts " + ("DESC" if newest_first else "ASC")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [json.loads(row["raw"]) for row in self.conn.execute(sql, args)]
+
+    def latest(self, actor: str, actions: Union[str, List[str]]) -> Optional[Dict]:
+        """Newest event by `actor` for the first action (in order) that has one."""
+        for action in ([actions] if isinstance(actions, str) else actions):
+            found = self.events(actor=actor, action=action, limit=1)
+            if found:
+                return found[0]
+        return None
+
+    def last_seen(self, actions: Union[str, List[str], None] = None) -> Dict[str, datetime]:
+        """{actor: newest event time} over all actors, optionally for some actions only."""
+        sql, args = "SELECT actor, MAX(ts) AS ts FROM events WHERE actor IS NOT NULL", []
+        if isinstance(actions, str):
+            actions = [actions]
+        if actions:
+            sql += f" AND action IN ({','.join('?' * len(actions))})"
+            args = list(actions)
+        sql += " GROUP BY actor"
+        return {row["actor"]: parse_github_time(row["ts"]) for row in self.conn.execute(sql, args)}
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    p = argparse.ArgumentParser(description="Org audit log: incremental ingest and local queries.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("ingest")
+    s.add_argument("--max-pages", type=int)
+    s.add_argument("--include", choices=["web", "git", "all"], default=INCLUDE)
+    s.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                   help="first-ingest lookback and prune age; 0 keeps everything")
+    s = sub.add_parser("query")
+    s.add_argument("--actor")
+    s.add_argument("--action")
+    s.add_argument("--repo")
+    s.add_argument("--limit", type=int, default=20)
+    args = p.parse_args(argv)
+
+    org = os.getenv("GH_ORG", "JHDevOps")
+    store = AuditLogStore()
+    try:
+        if args.cmd == "ingest":
+            token = os.getenv("GITHUB_PAT") or os.getenv("GITHUB_TOKEN", "")
+            store.ingest(make_session(token), org, max_pages=args.max_pages, include=args.include,
+                         retention_days=args.retention_days or None)
+            log.info("%d event(s) stored in %s", store.count(), store.path)
+        else:
+            for ev in store.events(actor=args.actor, action=args.action, repo=args.repo,
+                                   org=org, limit=args.limit):
+                dt = parse_github_time(ev.get("@timestamp") or ev.get("created_at"))
+                print(f"{dt.isoformat() if dt else '-':<33} {ev.get('actor') or '-':<25} "
+                      f"{ev.get('action'):<40} {ev.get('repo') or ''}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 import json, requests
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ========= HARD-CODED CONFIG =========
 TOKEN = "ghp_xxxxx..."                 # PAT with admin:repo_hook or repo admin rights
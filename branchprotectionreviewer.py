@@ -4,6 +4,9 @@ import os
 import sys
 from typing import Optional, Tuple, List
 import requests
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # -------------------- CONFIG --------------------
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "REPLACE_WITH_YOUR_PAT")  # or set env var
@@ -1,43 +1,25 @@
 import pandas as pd
-import requests
+
+from access_graph import load_graph
 
 # === CONFIGURATION ===
 EXCEL_FILE = 'repos.xlsx'
 ORG = 'JHDevOps'
 GITHUB_TOKEN = 'your_pat_token_here'  # Replace this with your actual PAT
 
-# === HEADERS ===
-headers = {
-    "Authorization": f"token {GITHUB_TOKEN}",
-    "Accept": "application/vnd.github+json"
-}
-
 # === Load repo list from Excel (start from row 2) ===
 df = pd.read_excel(EXCEL_FILE, engine='openpyxl')
 repos = df.iloc[1:, 0].dropna().tolist()  # Assuming repo names are in the first column
 
 no_access_repos = []
 
+# collaborators and team access come from the shared access graph snapshot
+# instead of calls per repo
+graph = load_graph(GITHUB_TOKEN, ORG)
+
 def has_any_access(repo):
-    # 1. Check outside collaborators
-    collab_url = f"https://api.github.com/repos/{ORG}/{repo}/collaborators"
-    r = requests.get(collab_url, headers=headers)
-    if r.status_code == 200 and r.json():
-        return True
-
-    # 2. Check repo teams
-    teams_url = f"https://api.github.com/repos/{ORG}/{repo}/teams"
-    r = requests.get(teams_url, headers=headers)
-    if r.status_code == 200 and r.json():
-        return True
-
-    # 3. Check direct collaborators
-    perm_url = f"https://api.github.com/repos/{ORG}/{repo}/permissions"
-    r = requests.get(perm_url, headers=headers)
-    if r.status_code == 200 and r.json():
-        return True
-
-    return False
+    # any direct collaborator (org owners don't count) or any team grant
+    return bool(graph.direct_for_repo(repo) or graph.teams_for_repo(repo))
 
 for repo in repos:
     print(f"Checking access for repo: {repo}")
@@ -1,5 +1,6 @@
 import pandas as pd
-import requests
+
+from access_graph import load_graph
 
 # ==== CONFIGURATION ====
 EXCEL_FILE = 'inactive_repos_graphql.xlsx'
@@ -11,62 +12,17 @@ ALLOWED_TEAMS = {
     'jh_devsecops_cdo_release_engineers_acl'
 }
 
-headers = {
-    "Authorization": f"token {GITHUB_TOKEN}",
-    "Accept": "application/vnd.github+json"
-}
-
 # ==== Load Excel and normalize repo names ====
 df = pd.read_excel(EXCEL_FILE, engine='openpyxl')
 repos = [r.strip().lower() for r in df.iloc[1:, 0].dropna().tolist()]
 
-# ==== Get full list of teams in org ====
-def get_all_teams():
-    teams = []
-    page = 1
-    while True:
-        url = f"https://api.github.com/orgs/{ORG}/teams?page={page}&per_page=100"
-        r = requests.get(url, headers=headers)
-        if r.status_code != 200 or not r.json():
-            break
-        teams.extend(r.json())
-        page += 1
-    return teams
-
-# ==== Build map of which teams have access to which repos ====
-def get_team_repos(team_slug):
-    repos = []
-    page = 1
-    while True:
-        url = f"https://api.github.com/orgs/{ORG}/teams/{team_slug}/repos?page={page}&per_page=100"
-        r = requests.get(url, headers=headers)
-        if r.status_code != 200:
-            break
-        batch = r.json()
-        if not batch:
-            break
-        repos.extend(repo['name'].lower() for repo in batch)
-        page += 1
-    return set(repos)
-
-# ==== Build a repo -> teams map (only for repos in Excel) ====
-team_repo_map = {}
-all_teams = get_all_teams()
-
-for team in all_teams:
-    slug = team['slug'].lower()
-    repos_with_team = get_team_repos(slug)
-    for repo in repos:
-        if repo in repos_with_team:
-            team_repo_map.setdefault(repo, set()).add(slug)
+# ==== repo -> teams and collaborators from the shared access graph snapshot ====
+graph = load_graph(GITHUB_TOKEN, ORG)
+team_repo_map = {repo: set(graph.teams_for_repo(repo)) for repo in repos}
 
-# ==== Get collaborators for a repo ====
+# ==== Get direct collaborators for a repo (org owners don't count) ====
 def get_collaborators(repo):
-    url = f"https://api.github.com/repos/{ORG}/{repo}/collaborators?affiliation=all"
-    r = requests.get(url, headers=headers)
-    if r.status_code == 200:
-        return [user['login'] for user in r.json()]
-    return []
+    return list(graph.direct_for_repo(repo))
 
 # ==== Final check ====
 final_repos = []
@@ -0,0 +1,111 @@
+# collaborator_crawl.py
+# Direct collaborators (with their permission) for many repos at once, over GraphQL.
+#
+# The REST way is one paged /repos/{owner}/{repo}/collaborators?affiliation=direct
+# listing per repo. Here one GraphQL request carries GRAPHQL_BATCH repos as aliases:
+#
+#   r0: repository(owner: "org", name: "a") {
+#     collaborators(affiliation: DIRECT, first: 100) {
+#       pageInfo { hasNextPage endCursor }
+#       edges { permission node { login } }
+#     }
+#   }
+#   r1: repository(owner: "org", name: "b") { ... }
+#
+# Repos with more than one page of collaborators are followed up with their own
+# cursors -- also aliased, so each follow-up round is one request for all of them.
+# A batch that times out on GitHub's side (502/504) is split in half and retried.
+#
+# Result shape matches the REST listing, so callers can swap it in:
+#   {"repo": [{"login": "alice", "role_name": "write"}, ...]}
+# Repos that do not exist (or the token cannot see) are left out and logged;
+# with strict=True any such repo fails the whole crawl instead.
+
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
+API_BASE = "https://api.github.com"
+GRAPHQL_BATCH = int(os.getenv("COLLAB_GRAPHQL_BATCH", "50"))
+GRAPHQL_WORKERS = int(os.getenv("COLLAB_GRAPHQL_WORKERS", "4"))
+PAGE_SIZE = 100
+
+log = logging.getLogger("collaborator-crawl")
+
+
+def _field(i: int, owner: str, repo: str, cursor: Optional[str]) -> str:
+    after = f", after: {json.dumps(cursor)}" if cursor else ""
+    return (f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{ "
+            f"collaborators(affiliation: DIRECT, first: {PAGE_SIZE}{after}) {{ "
+            f"pageInfo {{ hasNextPage endCursor }} edges {{ permission node {{ login }} }} }} }}")
+
+
+def _query(session, chunk: List[Tuple[str, str, Optional[str]]]) -> Dict[int, Optional[Dict]]:
+    """One aliased request; {position in chunk: collaborators connection or None}."""
+    r = session.post(f"{API_BASE}/graphql", timeout=120, json={
+        "query": "query {\n" + "\n".join(_field(i, o, n, c) for i, (o, n, c) in enumerate(chunk)) + "\n}"})
+    if r.status_code in (502, 504) and len(chunk) > 1:
+        half = len(chunk) // 2
+        log.info("GraphQL batch of %d timed out; splitting.", len(chunk))
+        left = _query(session, chunk[:half])
+        right = _query(session, chunk[half:])
+        return {**left, **{half + i: v for i, v in right.items()}}
+    r.raise_for_status()
+    body = r.json()
+    data = body.get("data")
+    if data is None:
+        raise RuntimeError(f"GraphQL collaborator query failed: {body.get('errors')}")
+    # partial errors (missing repo, no admin rights on one repo) leave that alias null
+    for err in body.get("errors") or []:
+        log.debug("GraphQL: %s", err.get("message"))
+    return {i: (data.get(f"r{i}") or {}).get("collaborators") for i in range(len(chunk))}
+
+
+def crawl_collaborators(session, owner: str, repos: List[str], batch: int = GRAPHQL_BATCH,
+                        workers: int = GRAPHQL_WORKERS, strict: bool = False) -> Dict[str, List[Dict]]:
+    """
+    {repo: [{"login", "role_name"}]} of direct collaborators for every repo in
+    `repos`. strict=True raises if any repo (or a later page of one) came back
+    unreadable, rather than returning without it.
+    """
+    out: Dict[str, List[Dict]] = {}
+    pending: List[Tuple[str, Optional[str]]] = [(repo, None) for repo in repos]
+    batches_sent, missing = 0, []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending:
+            chunks = [pending[i:i + batch] for i in range(0, len(pending), batch)]
+            results = pool.map(lambda ch: _query(session, [(owner, repo, cursor) for repo, cursor in ch]), chunks)
+            batches_sent += len(chunks)
+            follow_up = []
+            for chunk, conns in zip(chunks, results):
+                for i, (repo, cursor) in enumerate(chunk):
+                    conn = conns.get(i)
+                    if conn is None:
+                        missing.append(repo)
+                        log.warning("Collaborators of %s/%s not readable%s.", owner, repo,
+                                    " (missing repo or no access)" if cursor is None else " past the first page")
+                        out.pop(repo, None)   # never hand out a truncated listing
+                        continue
+                    out.setdefault(repo, []).extend(
+                        {"login": e["node"]["login"], "role_name": (e.get("permission") or "").lower()}
+                        for e in conn["edges"] if e.get("node"))
+                    if conn["pageInfo"]["hasNextPage"]:
+                        follow_up.append((repo, conn["pageInfo"]["endCursor"]))
+            if follow_up:
+                log.info("%d repo(s) have more than %d direct collaborators; following cursors.",
+                         len(follow_up), PAGE_SIZE)
+            pending = follow_up
+
+    log.info("Direct collaborators for %d repo(s) in %d GraphQL batch(es) (%d unreadable).",
+             len(out), batches_sent, len(missing))
+    if strict and missing:
+        raise RuntimeError(f"Collaborators of {len(missing)} repo(s) not readable "
+                           f"({', '.join(sorted(missing)[:10])})")
+    return out
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 import base64, json, requests
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ====== CONFIG (hard-code here) ======
 TOKEN   = "ghp_xxxxxxx"          # your PAT with repo scope
@@ -1,5 +1,8 @@
 import requests
 import json
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ==== CONFIGURE THESE ====
 PAT = "YOUR_PAT_HERE"
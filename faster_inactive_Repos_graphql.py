@@ -3,8 +3,13 @@ import time
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+from fnmatch import fnmatch
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
 
 TOKEN = ''  # <<< put your PAT here
 ORG_NAME = "JHDevOps"
@@ -17,6 +22,14 @@ REST_API_ROOT = "https://api.github.com"
 # how many concurrent repo checks in Pass 1
 MAX_WORKERS = int(os.getenv("MAX_WORKERS", "5"))
 
+# MODE=inactive (default) -> inactive repo report
+# MODE=stale-branches     -> stale branch plan (+ bulk delete when STALE_DRY_RUN=false)
+MODE = os.getenv("MODE", "inactive").strip().lower()
+STALE_DAYS = int(os.getenv("STALE_DAYS", "365"))
+STALE_DRY_RUN = os.getenv("STALE_DRY_RUN", "true").strip().lower() != "false"
+# deleteRef mutations sent per GraphQL request (aliased)
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "50"))
+
 headers_graphql = {
     "Authorization": f"bearer {TOKEN}",
     "Content-Type": "application/json"
@@ -147,6 +160,173 @@ def check_repo_all_branches_old(repo_name):
     return True
 
 
+def get_branch_refs(repo_name):
+    """
+    Same ref walk as check_repo_all_branches_old, but keeps every branch:
+    returns (default_branch, protection_patterns, branches) where branches
+    is a list of {"id", "name", "committed"} (committed may be None).
+    Returns (None, [], []) if the repo can't be read.
+    """
+    has_next_page = True
+    end_cursor = None
+    default_branch = None
+    patterns = []
+    branches = []
+
+    query = """
+    query($org: String!, $repo: String!, $cursor: String) {
+      repository(owner: $org, name: $repo) {
+        defaultBranchRef {
+          name
+        }
+        branchProtectionRules(first: 100) {
+          nodes {
+            pattern
+          }
+        }
+        refs(refPrefix: "refs/heads/", first: 100, after: $cursor) {
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+          nodes {
+            id
+            name
+            target {
+              ... on Commit {
+                committedDate
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+
+    while has_next_page:
+        variables = {"org": ORG_NAME, "repo": repo_name, "cursor": end_cursor}
+        result = run_graphql_query(query, variables)
+
+        repo_data = (result.get("data") or {}).get("repository")
+        if not repo_data:
+            return None, [], []
+
+        if end_cursor is None:
+            default_branch = (repo_data.get("defaultBranchRef") or {}).get("name")
+            patterns = [
+                n["pattern"]
+                for n in repo_data["branchProtectionRules"]["nodes"]
+                if n.get("pattern")
+            ]
+
+        refs = repo_data["refs"]
+        for branch in refs["nodes"]:
+            date_str = (branch.get("target") or {}).get("committedDate")
+            committed = (
+                datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ") if date_str else None
+            )
+            branches.append({"id": branch["id"], "name": branch["name"], "committed": committed})
+
+        has_next_page = refs["pageInfo"]["hasNextPage"]
+        end_cursor = refs["pageInfo"]["endCursor"]
+
+    return default_branch, patterns, branches
+
+
+def find_stale_branches(repo_name, stale_cutoff):
+    """
+    Return the branches of repo_name whose last commit is older than
+    stale_cutoff, skipping the default branch and anything matched by a
+    branch protection rule pattern.
+    """
+    default_branch, patterns, branches = get_branch_refs(repo_name)
+    stale = []
+    for b in branches:
+        if b["committed"] is None or b["committed"] >= stale_cutoff:
+            continue
+        if b["name"] == default_branch:
+            continue
+        if any(fnmatch(b["name"], p) for p in patterns):
+            continue
+        stale.append(b)
+    return stale
+
+
+def delete_refs(ref_ids):
+    """
+    Delete refs in bulk: one GraphQL request carries up to DELETE_BATCH_SIZE
+    aliased deleteRef mutations. Returns the set of ref ids that failed.
+    """
+    failed = set()
+    for start in range(0, len(ref_ids), DELETE_BATCH_SIZE):
+        chunk = ref_ids[start:start + DELETE_BATCH_SIZE]
+        params = ", ".join(f"$r{i}: ID!" for i in range(len(chunk)))
+        body = "\n".join(
+            f"  d{i}: deleteRef(input: {{refId: $r{i}}}) {{ clientMutationId }}"
+            for i in range(len(chunk))
+        )
+        mutation = f"mutation({params}) {{\n{body}\n}}"
+        variables = {f"r{i}": ref_id for i, ref_id in enumerate(chunk)}
+        result = run_graphql_query(mutation, variables)
+
+        # a failed alias comes back as an error whose path is ["d<i>"]
+        for err in result.get("errors") or []:
+            path = err.get("path") or []
+            alias = str(path[0]) if path else ""
+            if alias[1:].isdigit() and int(alias[1:]) < len(chunk):
+                failed.add(chunk[int(alias[1:])])
+            else:
+                print(f"  deleteRef error: {err.get('message')}")
+                failed.update(chunk)
+    return failed
+
+
+def stale_branch_mode(all_repos):
+    stale_cutoff = datetime.utcnow() - timedelta(days=STALE_DAYS)
+    print(f"\nStale-branch mode: branches with last commit before {stale_cutoff:%Y-%m-%d} "
+          f"({STALE_DAYS} days), dry-run={STALE_DRY_RUN}")
+
+    plan = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        future_to_repo = {
+            executor.submit(find_stale_branches, repo, stale_cutoff): repo
+            for repo in all_repos
+        }
+        for future in as_completed(future_to_repo):
+            repo = future_to_repo[future]
+            try:
+                stale = future.result()
+            except Exception as e:
+                print(f"[STALE] Error checking {repo}: {e}")
+                continue
+            if stale:
+                plan[repo] = stale
+                print(f"[STALE] {repo}: {len(stale)} stale branches")
+
+    records = []
+    for repo in sorted(plan):
+        failed = set()
+        if not STALE_DRY_RUN:
+            failed = delete_refs([b["id"] for b in plan[repo]])
+            print(f"[STALE] {repo}: deleted {len(plan[repo]) - len(failed)}/{len(plan[repo])}")
+        for b in plan[repo]:
+            if STALE_DRY_RUN:
+                status = "planned"
+            else:
+                status = "failed" if b["id"] in failed else "deleted"
+            records.append({
+                "Repository": repo,
+                "Branch": b["name"],
+                "Last Commit": b["committed"].strftime("%Y-%m-%d"),
+                "Status": status,
+            })
+
+    df = pd.DataFrame(records, columns=["Repository", "Branch", "Last Commit", "Status"])
+    df.to_excel("stale_branches_graphql.xlsx", index=False)
+    print(f"\nTotal stale branches: {len(df)} across {len(plan)} repos. "
+          f"Saved to 'stale_branches_graphql.xlsx'")
+
+
 def get_last_commit_default_branch(repo_name):
     """
     Use REST API to grab the last commit on the default branch.
@@ -190,6 +370,10 @@ def main():
     all_repos = get_all_repos()
     print(f"Total NON-archived repos found: {len(all_repos)}")
 
+    if MODE == "stale-branches":
+        stale_branch_mode(all_repos)
+        return
+
     # PASS 1: original detection of inactive repos, but in parallel
     inactive_repos = []
 
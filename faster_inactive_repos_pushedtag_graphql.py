@@ -14,6 +14,9 @@ import pandas as pd
 from datetime import datetime, timedelta
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 TOKEN = ''  # <<< put your PAT here
 ORG_NAME = "JHDevOps"
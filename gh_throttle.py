@@ -0,0 +1,37 @@
+# gh_throttle.py
+# Shared request budget for the concurrent scripts.
+#
+#   LIMITER = RateLimiter(per_second=5)
+#   LIMITER.wait()          # call before every API request, from any thread
+#
+# A plain token bucket: bursts up to `burst` requests, then settles at
+# `per_second`. Keeps thread pools from tripping GitHub's secondary limits.
+
+import time
+import threading
+
+import ratelimit_telemetry
+
+# whatever paces its requests through here also gets its headers harvested
+ratelimit_telemetry.install()
+
+
+class RateLimiter:
+    def __init__(self, per_second: float = 5.0, burst: int = 10):
+        self.per_second = float(per_second)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.per_second)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.per_second
+            time.sleep(delay)
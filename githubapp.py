@@ -1,8 +1,8 @@
-import time
 import logging
 from typing import Dict, List
 import requests
-import jwt  # pip install pyjwt
+
+from githubapp_tokens import BROKER, request
 
 # ---------------------------------------------------------
 # >>>>>> EDIT THESE 4 LINES <<<<<<
@@ -38,7 +38,7 @@ class GitHubError(Exception):
     pass
 
 def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
-    resp = requests.request(method, url, headers=headers, **kwargs)
+    resp = request(method, url, headers=headers, **kwargs)
     if 200 <= resp.status_code < 300:
         return resp
     try:
@@ -48,9 +48,7 @@ def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
     raise GitHubError(f"{method} {url} -> {resp.status_code}: {body}")
 
 def generate_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 600, "iss": app_id}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def get_app(jwt_token: str) -> Dict:
     url = f"{BASE_URL}/app"
@@ -1,8 +1,8 @@
-import time
 import logging
 from typing import Dict, List, Optional, Tuple
 import requests
-import jwt  # pip install pyjwt
+
+from githubapp_tokens import BROKER, request
 
 # ---------------------------------------------------------
 # >>>>>> EDIT THESE 4 LINES <<<<<<
@@ -38,7 +38,7 @@ class GitHubError(Exception):
     pass
 
 def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
-    resp = requests.request(method, url, headers=headers, **kwargs)
+    resp = request(method, url, headers=headers, **kwargs)
     if 200 <= resp.status_code < 300:
         return resp
     try:
@@ -48,9 +48,7 @@ def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
     raise GitHubError(f"{method} {url} -> {resp.status_code}: {body}")
 
 def generate_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 600, "iss": app_id}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def get_app(jwt_token: str) -> Dict:
     url = f"{BASE_URL}/app"
@@ -63,10 +61,7 @@ def get_installations(jwt_token: str) -> List[Dict]:
     return gh_request("GET", url, headers).json()
 
 def get_installation_token(jwt_token: str, installation_id: int) -> str:
-    url = f"{BASE_URL}/app/installations/{installation_id}/access_tokens"
-    headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
-    r = gh_request("POST", url, headers)
-    return r.json()["token"]
+    return BROKER.installation_token(installation_id, jwt_token)
 
 def installation_has_repo_with_inst_token(inst_token: str, repo_id: int) -> bool:
     headers = {"Authorization": f"Bearer {inst_token}", "Accept": "application/vnd.github+json"}
@@ -0,0 +1,372 @@
+# githubapp_index.py
+# Persistent repo -> (GitHub App, installation) index.
+#
+# Replaces the "walk every app -> every installation -> page every repo" scan
+# in find_repo_in_any_app with a local JSON file:
+#   - build(apps)    : one parallel sweep over all apps/installations
+#   - refresh(apps)  : cheap incremental check, re-lists only installations
+#                      whose repo count changed since the last sweep
+#                      (a same-count swap done outside these scripts is only
+#                      picked up by the webhook hook or a full build)
+#   - lookup(repo_id): O(1) local read
+#   - record_add / record_remove after every add/remove we do ourselves
+#   - apply_installation_repositories_event() for the webhook payload
+#
+# Policy in this org is one app per repo, but the index records what is live:
+# each repo id lists every (app, installation) it is in. lookup() raises
+# AmbiguousInstallation for a repo found in more than one, rather than pick one.
+#
+# The file lives at data/repo_app_index.json by default (env APP_INDEX_FILE).
+# In TeamCity, publish it as an artifact and pull it back with an artifact
+# dependency so later builds start from the previous index.
+
+import os
+import json
+import pathlib
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from githubapp_tokens import BROKER, request
+
+BASE_URL = "https://api.github.com"
+INDEX_FILE = pathlib.Path(os.getenv("APP_INDEX_FILE", "./data/repo_app_index.json"))
+MAX_WORKERS = int(os.getenv("APP_INDEX_WORKERS", "8"))
+
+log = logging.getLogger("gh-app-index")
+
+
+class GitHubError(Exception):
+    pass
+
+
+def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
+    resp = request(method, url, headers=headers, timeout=45, **kwargs)
+    if 200 <= resp.status_code < 300:
+        return resp
+    try:
+        body = resp.json()
+    except Exception:
+        body = resp.text
+    raise GitHubError(f"{method} {url} -> {resp.status_code}: {body}")
+
+
+def generate_jwt(app_id: int, private_key_pem: str) -> str:
+    return BROKER.app_jwt(app_id, private_key_pem)
+
+
+def get_installations(jwt_token: str) -> List[Dict]:
+    headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
+    url = f"{BASE_URL}/app/installations?per_page=100"
+    out = []
+    while url:
+        r = gh_request("GET", url, headers)
+        data = r.json()
+        installs = data if isinstance(data, list) else data.get("installations", [])
+        out.extend(installs)
+        url = r.links.get("next", {}).get("url")
+    return out
+
+
+def get_installation_token(jwt_token: str, installation_id: int) -> str:
+    return BROKER.installation_token(installation_id, jwt_token)
+
+
+def installation_repo_count(inst_token: str) -> int:
+    """total_count of /installation/repositories, for the price of one tiny page."""
+    headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
+    url = f"{BASE_URL}/installation/repositories?per_page=1"
+    return int(gh_request("GET", url, headers).json().get("total_count", 0))
+
+
+def list_installation_repos(inst_token: str) -> List[Dict]:
+    headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
+    url = f"{BASE_URL}/installation/repositories?per_page=100"
+    repos = []
+    while url:
+        r = gh_request("GET", url, headers)
+        repos.extend(r.json().get("repositories", []))
+        url = r.links.get("next", {}).get("url")
+    return repos
+
+
+def _app_configs(apps) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    (slug, app_id, private_key_pem) from either config shape used in this repo:
+    {slug: {"id", "private_key"}} or [{"slug", "app_id", "private_key_pem"}].
+    """
+    if isinstance(apps, dict):
+        return [(slug, cfg.get("id"), cfg.get("private_key")) for slug, cfg in apps.items()]
+    return [(a.get("slug"), a.get("app_id"), a.get("private_key_pem")) for a in apps]
+
+
+def iter_apps(apps) -> Iterable[Tuple[str, int, str]]:
+    """Yield (slug, app_id, private_key_pem) of the apps that have both an id and a key."""
+    for slug, app_id, pem in _app_configs(apps):
+        if not app_id or not pem:
+            log.debug("App %s has no id/private key configured; skipping.", slug)
+            continue
+        yield slug, int(app_id), pem
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _inst_key(slug: str, installation_id: int) -> str:
+    return f"{slug}|{installation_id}"
+
+
+class AmbiguousInstallation(Exception):
+    """A repo is in more than one app/installation, so there is no single answer."""
+
+    def __init__(self, repo: str, found: List[Tuple[str, int]]):
+        self.repo = repo
+        self.found = found
+        super().__init__(f"{repo} is in {len(found)} app installations ("
+                         + ", ".join(f"{slug} #{inst_id}" for slug, inst_id in found)
+                         + "); remove it from all but one")
+
+
+class AppInstallationIndex:
+    """
+    repos:         {"<repo_id>": {"full_name", "installations": [{"app_slug", "installation_id"}]}}
+    installations: {"<slug>|<inst_id>": {"app_slug", "installation_id", "account",
+                                          "permissions", "repo_count", "refreshed_at"}}
+    """
+
+    def __init__(self, path: pathlib.Path = INDEX_FILE):
+        self.path = pathlib.Path(path)
+        self.repos: Dict[str, Dict] = {}
+        self.installations: Dict[str, Dict] = {}
+        self.built_at: Optional[str] = None
+        # what the last build/refresh could not list; their entries are stale
+        self.sweep_failures: List[str] = []
+
+    # ------- persistence -------
+    @classmethod
+    def load(cls, path: pathlib.Path = INDEX_FILE) -> "AppInstallationIndex":
+        index = cls(path)
+        if index.path.exists():
+            try:
+                data = json.loads(index.path.read_text(encoding="utf-8"))
+                index.repos = data.get("repos", {})
+                for entry in index.repos.values():
+                    # files written before repos could list several installations
+                    if "installations" not in entry:
+                        entry["installations"] = [{"app_slug": entry.pop("app_slug"),
+                                                   "installation_id": int(entry.pop("installation_id"))}]
+                index.installations = data.get("installations", {})
+                index.built_at = data.get("built_at")
+            except Exception as e:
+                log.warning("Could not read index %s (%s); starting empty.", index.path, e)
+        return index
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({
+            "built_at": self.built_at,
+            "installations": self.installations,
+            "repos": self.repos,
+        }, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.installations
+
+    # ------- queries -------
+    def installations_of(self, repo_id: int) -> List[Tuple[str, int]]:
+        """Every (app_slug, installation_id) the repo is in; empty if none."""
+        entry = self.repos.get(str(repo_id)) or {}
+        return [(i["app_slug"], int(i["installation_id"])) for i in entry.get("installations", [])]
+
+    def lookup(self, repo_id: int) -> Optional[Tuple[str, int]]:
+        """The repo's (app_slug, installation_id); raises AmbiguousInstallation if it is in several."""
+        found = self.installations_of(repo_id)
+        if len(found) > 1:
+            raise AmbiguousInstallation(self.repos[str(repo_id)].get("full_name") or str(repo_id), found)
+        return found[0] if found else None
+
+    def ambiguous(self) -> Dict[str, List[Tuple[str, int]]]:
+        """{repo_id: installations} for every repo that is in more than one installation."""
+        return {rid: self.installations_of(rid) for rid, e in self.repos.items() if len(e["installations"]) > 1}
+
+    def repos_for_installation(self, slug: str, installation_id: int) -> List[str]:
+        return [rid for rid, e in self.repos.items()
+                if any(i["app_slug"] == slug and int(i["installation_id"]) == int(installation_id)
+                       for i in e["installations"])]
+
+    def installation_permissions(self, slug: str, installation_id: int) -> Dict[str, str]:
+        inst = self.installations.get(_inst_key(slug, installation_id)) or {}
+        return inst.get("permissions") or {}
+
+    def installation_for_owner(self, slug: str, owner: str) -> Optional[int]:
+        """Installation id of app `slug` on account `owner`, if the index knows it."""
+        for inst in self.installations.values():
+            if inst["app_slug"] == slug and (inst.get("account") or "").lower() == owner.lower():
+                return int(inst["installation_id"])
+        return None
+
+    # ------- updates -------
+    def _recount(self, slug: str, installation_id: int):
+        inst = self.installations.get(_inst_key(slug, installation_id))
+        if inst is not None:
+            inst["repo_count"] = len(self.repos_for_installation(slug, installation_id))
+
+    def _link(self, repo_id, full_name: Optional[str], slug: str, installation_id: int):
+        entry = self.repos.setdefault(str(repo_id), {"full_name": full_name, "installations": []})
+        entry["full_name"] = full_name or entry.get("full_name")
+        if (slug, int(installation_id)) not in self.installations_of(repo_id):
+            entry["installations"].append({"app_slug": slug, "installation_id": int(installation_id)})
+
+    def _unlink(self, repo_id, slug: Optional[str] = None, installation_id: Optional[int] = None):
+        """Drop one installation from the repo's entry, or all of them when none is given."""
+        entry = self.repos.get(str(repo_id))
+        if not entry:
+            return []
+        gone = [i for i in entry["installations"] if slug is None or
+                (i["app_slug"] == slug and int(i["installation_id"]) == int(installation_id))]
+        entry["installations"] = [i for i in entry["installations"] if i not in gone]
+        if not entry["installations"]:
+            self.repos.pop(str(repo_id), None)
+        return gone
+
+    def record_add(self, repo_id: int, full_name: str, slug: str, installation_id: int):
+        self._link(repo_id, full_name, slug, installation_id)
+        self._recount(slug, installation_id)
+
+    def record_remove(self, repo_id: int, slug: Optional[str] = None, installation_id: Optional[int] = None):
+        """Forget the repo in one installation, or in every one when slug/installation_id are omitted."""
+        for i in self._unlink(repo_id, slug, installation_id):
+            self._recount(i["app_slug"], i["installation_id"])
+
+    def apply_installation_repositories_event(self, payload: Dict, slug: str):
+        """Apply a GitHub `installation_repositories` webhook payload for app `slug`."""
+        inst_id = int(payload["installation"]["id"])
+        for r in payload.get("repositories_added") or []:
+            self.record_add(r["id"], r.get("full_name"), slug, inst_id)
+        for r in payload.get("repositories_removed") or []:
+            self.record_remove(r["id"], slug, inst_id)
+
+    def _replace_installation(self, slug: str, inst: Dict, repos: List[Dict]):
+        inst_id = int(inst["id"])
+        for rid in self.repos_for_installation(slug, inst_id):
+            self._unlink(rid, slug, inst_id)
+        for r in repos:
+            self._link(r["id"], r.get("full_name"), slug, inst_id)
+        self.installations[_inst_key(slug, inst_id)] = {
+            "app_slug": slug,
+            "installation_id": inst_id,
+            "account": (inst.get("account") or {}).get("login"),
+            "permissions": inst.get("permissions") or {},
+            "repo_count": len(repos),
+            "refreshed_at": _now(),
+        }
+
+    # ------- sweeps -------
+    def _sweep(self, apps, full: bool) -> Tuple[int, List[str]]:
+        """
+        List installations of every app (one thread per app), then check every
+        installation concurrently. With full=False an installation is only
+        re-listed if its total_count differs from what the index holds.
+        Returns the number of installations that were (re-)listed and a
+        description of every app or installation that could not be read.
+        """
+        def app_installations(slug, app_id, pem):
+            app_jwt = generate_jwt(app_id, pem)
+            return [(slug, app_jwt, inst) for inst in get_installations(app_jwt)]
+
+        def check_installation(slug, app_jwt, inst):
+            token = get_installation_token(app_jwt, inst["id"])
+            known = self.installations.get(_inst_key(slug, inst["id"]))
+            if not full and known is not None:
+                if installation_repo_count(token) == known.get("repo_count"):
+                    return slug, inst, None
+            return slug, inst, list_installation_repos(token)
+
+        targets = []
+        seen_apps = set()
+        failures: List[str] = []
+        indexed_apps = {i["app_slug"] for i in self.installations.values()}
+        for slug, app_id, pem in _app_configs(apps):
+            # half-configured, or dropped from config while the index still has it:
+            # its entries can be neither refreshed nor trusted
+            if (not app_id or not pem) and (app_id or pem or slug in indexed_apps):
+                log.warning("App %s has no usable id/private key; its index entries are stale.", slug)
+                failures.append(f"app {slug}: id/private key not configured")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = {pool.submit(app_installations, *a): a[0] for a in iter_apps(apps)}
+            for fut in as_completed(futures):
+                try:
+                    targets.extend(fut.result())
+                    seen_apps.add(futures[fut])
+                except Exception as e:
+                    log.warning("App %s: listing installations failed: %s", futures[fut], e)
+                    failures.append(f"app {futures[fut]}: {e}")
+
+        live_keys = {_inst_key(slug, inst["id"]) for slug, _, inst in targets}
+        relisted = 0
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = {pool.submit(check_installation, *t): t for t in targets}
+            for fut in as_completed(futures):
+                try:
+                    slug, inst, repos = fut.result()
+                except Exception as e:
+                    slug, _, inst = futures[fut]
+                    log.warning("Installation %s|%s check failed: %s", slug, inst["id"], e)
+                    failures.append(f"installation {slug}|{inst['id']}: {e}")
+                    continue
+                if repos is not None:
+                    self._replace_installation(slug, inst, repos)
+                    relisted += 1
+                else:
+                    # permissions come free with the installation listing
+                    self.installations[_inst_key(slug, inst["id"])]["permissions"] = inst.get("permissions") or {}
+
+        # drop installations that disappeared from apps we could read
+        for key in list(self.installations):
+            slug, inst_id = key.split("|", 1)
+            if slug in seen_apps and key not in live_keys:
+                for rid in self.repos_for_installation(slug, int(inst_id)):
+                    self._unlink(rid, slug, int(inst_id))
+                self.installations.pop(key, None)
+
+        self.built_at = _now()
+        return relisted, failures
+
+    def build(self, apps) -> "AppInstallationIndex":
+        relisted, self.sweep_failures = self._sweep(apps, full=True)
+        log.info("Index built: %d installations, %d repos.", relisted, len(self.repos))
+        return self
+
+    def refresh(self, apps) -> "AppInstallationIndex":
+        if self.is_empty:
+            return self.build(apps)
+        relisted, self.sweep_failures = self._sweep(apps, full=False)
+        log.info("Index refreshed: %d installation(s) re-listed, %d repos indexed.",
+                 relisted, len(self.repos))
+        return self
+
+
+def load_index(apps, path: pathlib.Path = INDEX_FILE) -> AppInstallationIndex:
+    """Load the persisted index, bring it up to date and save it back."""
+    index = AppInstallationIndex.load(path).refresh(apps)
+    index.save()
+    return index
+
+
+if __name__ == "__main__":
+    # Standalone full rebuild (e.g. nightly): reads appid1..8 / rsakey1..8 from env.
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    apps = {
+        f"jh-teamcity-githubapp-{i}": {"id": os.getenv(f"appid{i}"), "private_key": os.getenv(f"rsakey{i}")}
+        for i in range(1, int(os.getenv("NUM_APPS", "8")) + 1)
+    }
+    idx = AppInstallationIndex(INDEX_FILE).build(apps)
+    idx.save()
+    log.info("Saved %s", INDEX_FILE)
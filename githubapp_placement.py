@@ -0,0 +1,166 @@
+# githubapp_placement.py
+# Load-aware choice of GitHub App installation for new repos, plus a
+# rebalance plan for installations that keep running hot.
+#
+# Inputs (both already produced by other scripts):
+#   - repo counts per installation from the repo->app index (githubapp_index)
+#   - /rate_limit samples collected hourly by githubappload2.py
+#     (usage_sample_store: installation_id, core_used, core_limit, ...)
+#
+# Score per installation (lower is better):
+#   USAGE_WEIGHT * p90(core_used / core_limit over the last WINDOW_DAYS)
+#   + REPO_WEIGHT * (installation repos / largest installation repos)
+#
+# Run standalone to print the scores and write data/app_rebalance_plan.csv.
+
+import os
+import pathlib
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from githubapp_index import AppInstallationIndex, INDEX_FILE
+from usage_sample_store import SampleStore
+
+PLAN_CSV = pathlib.Path(os.getenv("REBALANCE_PLAN_CSV", "./data/app_rebalance_plan.csv"))
+WINDOW_DAYS = int(os.getenv("PLACEMENT_WINDOW_DAYS", "7"))
+USAGE_WEIGHT = float(os.getenv("PLACEMENT_USAGE_WEIGHT", "0.7"))
+REPO_WEIGHT = float(os.getenv("PLACEMENT_REPO_WEIGHT", "0.3"))
+HOT_RATIO = float(os.getenv("PLACEMENT_HOT_RATIO", "0.8"))        # p90 usage above this is "hot"
+TARGET_RATIO = float(os.getenv("PLACEMENT_TARGET_RATIO", "0.6"))  # move repos until projected below this
+
+log = logging.getLogger("gh-app-placement")
+
+
+def load_usage(store: Optional[SampleStore] = None, window_days: int = WINDOW_DAYS) -> pd.DataFrame:
+    """
+    p90 / mean core usage ratio per installation_id over the recent window.
+    Usage is optional: with no readable samples, placement scores on repo count alone.
+    """
+    cols = ["installation_id", "p90_usage", "mean_usage", "samples"]
+    try:
+        store = store or SampleStore()
+        df = store.query(start=datetime.now(timezone.utc) - timedelta(days=window_days))
+        df = df[pd.to_numeric(df["core_limit"], errors="coerce") > 0]
+    except Exception as e:
+        log.warning("Usage samples not readable (%s); scoring on repo count only.", e)
+        return pd.DataFrame(columns=cols)
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    df["ratio"] = pd.to_numeric(df["core_used"], errors="coerce") / pd.to_numeric(df["core_limit"])
+    g = df.groupby("installation_id")["ratio"]
+    out = pd.DataFrame({
+        "p90_usage": g.quantile(0.9),
+        "mean_usage": g.mean(),
+        "samples": g.size(),
+    }).reset_index()
+    out["installation_id"] = out["installation_id"].astype("int64")
+    return out
+
+
+def score_installations(index: AppInstallationIndex, usage: Optional[pd.DataFrame] = None,
+                        owner: Optional[str] = None) -> pd.DataFrame:
+    """One row per indexed installation with its score, best (lowest) first."""
+    rows = [{
+        "app_slug": inst["app_slug"],
+        "installation_id": int(inst["installation_id"]),
+        "account": inst.get("account"),
+        "repo_count": int(inst.get("repo_count") or 0),
+    } for inst in index.installations.values()
+        if owner is None or (inst.get("account") or "").lower() == owner.lower()]
+    df = pd.DataFrame(rows, columns=["app_slug", "installation_id", "account", "repo_count"])
+    if df.empty:
+        return df
+
+    usage = load_usage() if usage is None else usage
+    df = df.merge(usage, on="installation_id", how="left")
+    df["p90_usage"] = df["p90_usage"].fillna(0.0)
+    df["mean_usage"] = df["mean_usage"].fillna(0.0)
+    df["samples"] = df["samples"].fillna(0).astype(int)
+
+    max_repos = max(int(df["repo_count"].max()), 1)
+    df["score"] = USAGE_WEIGHT * df["p90_usage"] + REPO_WEIGHT * df["repo_count"] / max_repos
+    return df.sort_values(["score", "repo_count", "app_slug"]).reset_index(drop=True)
+
+
+def pick_app_for_new_repo(index: AppInstallationIndex, owner: str, allowed_slugs=None,
+                          usage: Optional[pd.DataFrame] = None):
+    """Return (app_slug, installation_id) with the most headroom on `owner`, or None."""
+    scores = score_installations(index, usage, owner=owner)
+    if allowed_slugs is not None:
+        scores = scores[scores["app_slug"].isin(list(allowed_slugs))]
+    if scores.empty:
+        return None
+    best = scores.iloc[0]
+    log.info("Placement: %s (installation %s) score=%.3f p90_usage=%.0f%% repos=%d",
+             best["app_slug"], best["installation_id"], best["score"],
+             best["p90_usage"] * 100, best["repo_count"])
+    return best["app_slug"], int(best["installation_id"])
+
+
+def rebalance_plan(index: AppInstallationIndex, usage: Optional[pd.DataFrame] = None) -> List[Dict]:
+    """
+    Move repos off installations whose p90 usage is above HOT_RATIO until
+    their projected usage is at TARGET_RATIO, onto the coolest installation
+    of the same account. Per-repo cost is approximated as usage / repo_count,
+    so this is a plan to review, not something applied automatically.
+    """
+    scores = score_installations(index, usage)
+    if scores.empty:
+        return []
+
+    projected = {int(r.installation_id): float(r.p90_usage) for r in scores.itertuples()}
+    counts = {int(r.installation_id): int(r.repo_count) for r in scores.itertuples()}
+    per_repo = {i: (projected[i] / counts[i] if counts[i] else 0.0) for i in projected}
+    slug_of = {int(r.installation_id): r.app_slug for r in scores.itertuples()}
+    account_of = {int(r.installation_id): (r.account or "") for r in scores.itertuples()}
+
+    plan = []
+    for hot in scores.sort_values("p90_usage", ascending=False).itertuples():
+        src = int(hot.installation_id)
+        if projected[src] <= HOT_RATIO or not per_repo[src]:
+            continue
+        # smallest repo ids first: stable and easy to review
+        movable = sorted(index.repos_for_installation(slug_of[src], src), key=int)
+        while movable and projected[src] > TARGET_RATIO:
+            targets = [i for i in projected if i != src and account_of[i] == account_of[src]
+                       and projected[i] + per_repo[src] <= TARGET_RATIO]
+            if not targets:
+                break
+            dst = min(targets, key=lambda i: (projected[i], counts[i]))
+            repo_id = movable.pop(0)
+            plan.append({
+                "repo_id": repo_id,
+                "repo": index.repos[repo_id].get("full_name"),
+                "from_app": slug_of[src],
+                "from_installation": src,
+                "to_app": slug_of[dst],
+                "to_installation": dst,
+            })
+            projected[src] -= per_repo[src]
+            projected[dst] += per_repo[src]
+            counts[src] -= 1
+            counts[dst] += 1
+    return plan
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    index = AppInstallationIndex.load(INDEX_FILE)
+    if index.is_empty:
+        raise SystemExit(f"No installation index at {INDEX_FILE}; run githubapp_index.py first.")
+
+    scores = score_installations(index)
+    log.info(scores.to_string(index=False))
+
+    plan = rebalance_plan(index)
+    PLAN_CSV.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(plan, columns=["repo_id", "repo", "from_app", "from_installation",
+                                "to_app", "to_installation"]).to_csv(PLAN_CSV, index=False)
+    log.info(f"Rebalance plan: {len(plan)} repo move(s) → {PLAN_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# githubapp_reconcile.py
+# Reconcile GitHub App installation membership against a declarative file.
+#
+# Desired state (APP_ASSIGNMENTS_FILE, default data/app_assignments.json):
+#   {"jh-teamcity-githubapp-1": ["JHDevOps/repo-a", "JHDevOps/repo-b"],
+#    "jh-teamcity-githubapp-2": ["JHDevOps/repo-c"]}
+# or a CSV with columns repo,app.
+#
+# Apps named in the file are authoritative: every repo they hold that is not
+# listed for them is removed, every listed repo they don't hold is added.
+# A repo listed for one app but living in another (one app per repo) is moved:
+# removed from the old app, then added to the new one. A repo found in several
+# apps at once is removed from every one it is not assigned to. Apps not named
+# in the file are only touched to move a repo out of them.
+#
+# Live state comes from one concurrent sweep of all apps/installations
+# (githubapp_index), so the cost is one sweep plus the delta. Only the delta
+# is written: re-running after a successful apply plans nothing. If any app or
+# installation could not be listed, the plan is written but nothing is applied.
+#
+# Dry run by default; set RECONCILE_APPLY=true to make changes. The plan (and
+# the outcome of each step when applying) goes to data/app_reconcile_plan.csv.
+#
+# Env: GITHUB_PAT (org admin, for PUT/DELETE /user/installations/...),
+#      appid1..8 / rsakey1..8, NUM_APPS.
+
+import os
+import csv
+import json
+import pathlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+from gh_throttle import RateLimiter
+from githubapp_index import AppInstallationIndex, INDEX_FILE, gh_request
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
+BASE_URL = "https://api.github.com"
+USER_PAT = os.getenv("GITHUB_PAT")
+ASSIGNMENTS_FILE = pathlib.Path(os.getenv("APP_ASSIGNMENTS_FILE", "./data/app_assignments.json"))
+PLAN_CSV = pathlib.Path(os.getenv("RECONCILE_PLAN_CSV", "./data/app_reconcile_plan.csv"))
+APPLY = os.getenv("RECONCILE_APPLY", "false").lower() == "true"
+# guard against a truncated/empty assignments file wiping an app
+MAX_REMOVALS = int(os.getenv("RECONCILE_MAX_REMOVALS", "50"))
+WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+LIMITER = RateLimiter(per_second=float(os.getenv("RECONCILE_REQUESTS_PER_SECOND", "5")))
+
+APPS = {
+    f"jh-teamcity-githubapp-{i}": {"id": os.getenv(f"appid{i}"), "private_key": os.getenv(f"rsakey{i}")}
+    for i in range(1, int(os.getenv("NUM_APPS", "8")) + 1)
+}
+
+PLAN_COLUMNS = ["repo", "repo_id", "action", "app", "installation", "status", "detail"]
+
+log = logging.getLogger("gh-app-reconcile")
+
+
+def _pat_headers() -> Dict[str, str]:
+    return {"Authorization": f"token {USER_PAT}", "Accept": "application/vnd.github+json"}
+
+
+def load_assignments(path: pathlib.Path = ASSIGNMENTS_FILE) -> Dict[str, str]:
+    """Desired state as {repo full_name (lower-cased): app_slug}."""
+    path = pathlib.Path(path)
+    pairs: List[Tuple[str, str]] = []
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as fh:
+            pairs = [(r["repo"].strip(), r["app"].strip()) for r in csv.DictReader(fh) if r.get("repo")]
+    else:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        pairs = [(repo.strip(), slug) for slug, repos in data.items() for repo in repos]
+
+    desired: Dict[str, str] = {}
+    for repo, slug in pairs:
+        if slug not in APPS:
+            raise SystemExit(f"Unknown app '{slug}' for {repo} in {path}.")
+        if "/" not in repo:
+            raise SystemExit(f"Bad repo '{repo}' in {path}; expected owner/repo.")
+        prev = desired.setdefault(repo.lower(), slug)
+        if prev != slug:
+            raise SystemExit(f"{repo} is assigned to both {prev} and {slug} in {path}.")
+    return desired
+
+
+def repo_id_with_pat(full_name: str) -> int:
+    LIMITER.wait()
+    return gh_request("GET", f"{BASE_URL}/repos/{full_name}", _pat_headers()).json()["id"]
+
+
+def add_repo(installation_id: int, repo_id: int):
+    LIMITER.wait()
+    gh_request("PUT", f"{BASE_URL}/user/installations/{installation_id}/repositories/{repo_id}", _pat_headers())
+
+
+def remove_repo(installation_id: int, repo_id: int):
+    LIMITER.wait()
+    gh_request("DELETE", f"{BASE_URL}/user/installations/{installation_id}/repositories/{repo_id}", _pat_headers())
+
+
+def plan(index: AppInstallationIndex, desired: Dict[str, str]) -> List[Dict]:
+    """
+    Minimal add/remove steps to turn the indexed live state into `desired`.
+    A repo found in several apps gets a remove for every installation except
+    the one it is assigned to (or, unassigned, every one in a managed app).
+    """
+    managed = set(desired.values())
+    live = {e["full_name"].lower(): (rid, e) for rid, e in index.repos.items() if e.get("full_name")}
+    steps = []
+
+    for name, (rid, e) in sorted(live.items()):
+        want = desired.get(name)
+        extra = len(e["installations"]) > 1
+        for slug, inst_id in index.installations_of(rid):
+            if (want is None and slug in managed) or (want is not None and want != slug):
+                detail = f"move to {want}" if want else "not in assignments"
+                steps.append({"repo": e["full_name"], "repo_id": rid, "action": "remove",
+                              "app": slug, "installation": inst_id, "status": "planned",
+                              "detail": f"{detail}; repo is in {len(e['installations'])} apps" if extra else detail})
+
+    for name, slug in sorted(desired.items()):
+        current = live.get(name)
+        if current and slug in {s for s, _ in index.installations_of(current[0])}:
+            continue
+        owner = name.split("/", 1)[0]
+        inst_id = index.installation_for_owner(slug, owner)
+        steps.append({"repo": current[1]["full_name"] if current else name,
+                      "repo_id": current[0] if current else "",
+                      "action": "add", "app": slug, "installation": inst_id or "",
+                      "status": "planned" if inst_id else "blocked",
+                      "detail": "" if inst_id else f"{slug} is not installed on '{owner}'"})
+        if not inst_id and current:
+            # don't take a repo out of its current app if it can't land in the new one
+            for s in steps:
+                if s["action"] == "remove" and s["repo_id"] == current[0]:
+                    s["status"], s["detail"] = "blocked", f"target {slug} is not installed on '{owner}'"
+    return steps
+
+
+def apply_repo(steps: List[Dict]) -> List[Dict]:
+    """Run one repo's steps in order (remove before add, so a move never leaves it in two apps)."""
+    repo_id = next((s["repo_id"] for s in steps if s["repo_id"]), None)
+    for s in sorted(steps, key=lambda s: s["action"] != "remove"):
+        if s["status"] != "planned":
+            continue
+        try:
+            if repo_id is None:
+                repo_id = str(repo_id_with_pat(s["repo"]))
+                s["repo_id"] = repo_id
+            if s["action"] == "remove":
+                remove_repo(int(s["installation"]), int(repo_id))
+            else:
+                add_repo(int(s["installation"]), int(repo_id))
+            s["status"] = "done"
+        except Exception as e:
+            s["status"], s["detail"] = "failed", str(e)[:300]
+            # an add after a failed remove would break one-app-per-repo
+            for rest in steps:
+                if rest["status"] == "planned":
+                    rest["status"], rest["detail"] = "skipped", "earlier step for this repo failed"
+            break
+    return steps
+
+
+def write_plan(steps: List[Dict]):
+    PLAN_CSV.parent.mkdir(parents=True, exist_ok=True)
+    with open(PLAN_CSV, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=PLAN_COLUMNS)
+        writer.writeheader()
+        writer.writerows(steps)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    desired = load_assignments()
+    log.info("Desired state: %d repo(s) across %d app(s) from %s",
+             len(desired), len(set(desired.values())), ASSIGNMENTS_FILE)
+
+    # full sweep: a same-count swap done by hand would slip past an incremental refresh
+    index = AppInstallationIndex.load(INDEX_FILE).build(APPS)
+    index.save()
+
+    steps = plan(index, desired)
+    removals = sum(s["action"] == "remove" for s in steps)
+    log.info("Plan: %d add(s), %d removal(s).", len(steps) - removals, removals)
+    for s in steps:
+        log.info("  %-7s %-45s %-26s %s %s", s["action"], s["repo"], s["app"], s["status"], s["detail"])
+
+    if APPLY and steps:
+        if not USER_PAT:
+            raise SystemExit("Set GITHUB_PAT (org admin PAT) to apply the plan.")
+        if index.sweep_failures:
+            # the plan was made against stale entries for these; it may be wrong
+            write_plan(steps)
+            raise SystemExit("Refusing to apply: %d app/installation listing(s) failed: %s"
+                             % (len(index.sweep_failures), "; ".join(index.sweep_failures)))
+        if removals > MAX_REMOVALS:
+            raise SystemExit(f"Refusing to remove {removals} repos (RECONCILE_MAX_REMOVALS={MAX_REMOVALS}).")
+        by_repo: Dict[str, List[Dict]] = {}
+        for s in steps:
+            by_repo.setdefault(s["repo"].lower(), []).append(s)
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            futures = [pool.submit(apply_repo, repo_steps) for repo_steps in by_repo.values()]
+            for fut in as_completed(futures):
+                for s in fut.result():
+                    if s["status"] != "done":
+                        continue
+                    if s["action"] == "remove":
+                        index.record_remove(s["repo_id"], s["app"], s["installation"])
+                    else:
+                        index.record_add(s["repo_id"], s["repo"], s["app"], s["installation"])
+        index.save()
+
+    write_plan(steps)
+    counts: Dict[str, int] = {}
+    for s in steps:
+        counts[s["status"]] = counts.get(s["status"], 0) + 1
+    log.info("Totals: %s  (%s, %s)", counts or "in sync", "applied" if APPLY else "dry run", PLAN_CSV)
+    if counts.get("failed") or counts.get("blocked"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
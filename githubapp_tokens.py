@@ -0,0 +1,212 @@
+# githubapp_tokens.py
+# Expiry-aware cache for GitHub App JWTs and installation tokens.
+#
+#   BROKER.app_jwt(app_id, pem)                      -> JWT, re-signed shortly before it expires
+#   BROKER.installation_token(installation_id, jwt)  -> token, re-minted ahead of expires_at
+#   BROKER.invalidate_for(auth_header)               -> on a 401: drop that token/JWT from the cache
+#   request(method, url, headers, **kwargs)          -> requests.request() that does the above on a 401
+#
+# Thread-safe. If GH_TOKEN_CACHE_FILE is set, tokens are also shared between
+# processes on the same agent through that file (guarded by a .lock file), so
+# back-to-back builds reuse the same installation token for up to an hour.
+
+import os
+import json
+import time
+import hashlib
+import pathlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import requests
+import jwt
+
+import ratelimit_telemetry
+
+# shared by every app script, so their responses are all harvested
+ratelimit_telemetry.install()
+
+try:
+    import fcntl
+except ImportError:  # Windows agents
+    fcntl = None
+    import msvcrt
+
+BASE_URL = "https://api.github.com"
+
+JWT_LIFETIME = 540          # seconds; GitHub caps app JWTs at 10 minutes
+JWT_REFRESH_MARGIN = 60     # re-sign when less than this is left
+TOKEN_REFRESH_MARGIN = 300  # re-mint installation tokens 5 minutes before expires_at
+
+log = logging.getLogger("gh-app-tokens")
+
+
+@contextmanager
+def _file_lock(path: pathlib.Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _parse_expires_at(value: str) -> float:
+    # "2016-07-11T22:14:10Z"
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+class TokenBroker:
+    def __init__(self, cache_file: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._jwts: Dict[str, Tuple[str, float]] = {}
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self.cache_file = pathlib.Path(cache_file) if cache_file else None
+        self.mints = 0  # installation tokens actually requested from GitHub
+
+    # ------- shared file -------
+    def _read_file(self) -> Dict:
+        try:
+            return json.loads(self.cache_file.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+
+    def _write_file(self, data: Dict):
+        tmp = self.cache_file.with_suffix(self.cache_file.suffix + ".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.cache_file)
+
+    @contextmanager
+    def _shared(self):
+        """Yield the shared cache dict (or None without a cache file); written back on exit."""
+        if not self.cache_file:
+            yield None
+            return
+        with _file_lock(self.cache_file.with_suffix(self.cache_file.suffix + ".lock")):
+            data = self._read_file()
+            data.setdefault("jwts", {})
+            data.setdefault("tokens", {})
+            before = json.dumps(data, sort_keys=True)
+            yield data
+            now = time.time()
+            for section in ("jwts", "tokens"):
+                data[section] = {k: v for k, v in data[section].items() if v[1] > now}
+            if json.dumps(data, sort_keys=True) != before:
+                self._write_file(data)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        # one lock per app/installation so unrelated mints don't queue behind each other
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # ------- JWTs -------
+    def app_jwt(self, app_id, private_key_pem: str) -> str:
+        key = f"{int(app_id)}:{hashlib.sha256(private_key_pem.encode()).hexdigest()[:16]}"
+        with self._key_lock("jwt:" + key):
+            cached = self._jwts.get(key)
+            if cached and cached[1] - time.time() > JWT_REFRESH_MARGIN:
+                return cached[0]
+            with self._shared() as shared:
+                if shared is not None:
+                    entry = shared["jwts"].get(key)
+                    if entry and entry[1] - time.time() > JWT_REFRESH_MARGIN:
+                        self._jwts[key] = tuple(entry)
+                        return entry[0]
+                now = int(time.time())
+                payload = {"iat": now - 60, "exp": now + JWT_LIFETIME, "iss": str(int(app_id))}
+                token = jwt.encode(payload, private_key_pem, algorithm="RS256")
+                self._jwts[key] = (token, now + JWT_LIFETIME)
+                if shared is not None:
+                    shared["jwts"][key] = [token, now + JWT_LIFETIME]
+                return token
+
+    # ------- installation tokens -------
+    def installation_token(self, installation_id, jwt_token: str) -> str:
+        key = str(int(installation_id))
+        with self._key_lock("inst:" + key):
+            cached = self._tokens.get(key)
+            if cached and cached[1] - time.time() > TOKEN_REFRESH_MARGIN:
+                return cached[0]
+            with self._shared() as shared:
+                if shared is not None:
+                    entry = shared["tokens"].get(key)
+                    if entry and entry[1] - time.time() > TOKEN_REFRESH_MARGIN:
+                        self._tokens[key] = tuple(entry)
+                        return entry[0]
+                url = f"{BASE_URL}/app/installations/{installation_id}/access_tokens"
+                headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
+                r = requests.post(url, headers=headers, timeout=45)
+                if r.status_code >= 400:
+                    raise RuntimeError(f"POST {url} -> {r.status_code} {r.text[:300]}")
+                data = r.json()
+                expires = _parse_expires_at(data["expires_at"]) if data.get("expires_at") else time.time() + 3600
+                self._tokens[key] = (data["token"], expires)
+                self.mints += 1
+                if shared is not None:
+                    shared["tokens"][key] = [data["token"], expires]
+                return data["token"]
+
+    def installation_for_token(self, token: str) -> Optional[int]:
+        """Installation id a cached token belongs to (used to tag telemetry)."""
+        for key, (cached, _) in list(self._tokens.items()):
+            if cached == token:
+                return int(key)
+        return None
+
+    def invalidate(self, installation_id):
+        """Drop a cached installation token (e.g. after a 401)."""
+        key = str(int(installation_id))
+        with self._key_lock("inst:" + key):
+            self._tokens.pop(key, None)
+            with self._shared() as shared:
+                if shared is not None:
+                    shared["tokens"].pop(key, None)
+
+    def invalidate_for(self, auth_header: Optional[str]):
+        """
+        Forget the cached token or JWT carried by an Authorization header
+        ("token ..." / "Bearer ..."), so the next call mints a fresh one. Call
+        it when GitHub answers 401; credentials not from this broker are ignored.
+        """
+        token = (auth_header or "").split()[-1] if auth_header else ""
+        inst = self.installation_for_token(token)
+        if inst is not None:
+            self.invalidate(inst)
+            return
+        for key, (cached, _) in list(self._jwts.items()):
+            if cached == token:
+                with self._key_lock("jwt:" + key):
+                    self._jwts.pop(key, None)
+                    with self._shared() as shared:
+                        if shared is not None:
+                            shared["jwts"].pop(key, None)
+
+
+BROKER = TokenBroker(os.getenv("GH_TOKEN_CACHE_FILE") or None)
+
+
+def request(method: str, url: str, headers: Dict[str, str], **kwargs) -> requests.Response:
+    """
+    requests.request() for calls made with a broker token or JWT. A 401 means
+    it was revoked or expired early, so it is dropped from the cache and the
+    next call mints a fresh one. The response is returned either way.
+    """
+    resp = requests.request(method, url, headers=headers, **kwargs)
+    if resp.status_code == 401:
+        BROKER.invalidate_for(headers.get("Authorization"))
+    return resp
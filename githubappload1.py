@@ -1,9 +1,17 @@
 # 01_repo_map_auto.py
 # Maps repos in org 'JHDevOps' to each GitHub App by discovering installations automatically.
 # Only needs: app_id + private_key_pem per app. No installation_id required.
+# Apps, installations and repository pages are fetched concurrently; rows are
+# streamed to a temp file as pages arrive and renamed into place at the end --
+# only if every fetch succeeded; otherwise the old map stays and the run fails.
 
-import time, pathlib, logging, requests, jwt
-import pandas as pd
+import os, csv, math, pathlib, logging, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ---------- CONFIG: EDIT THIS ONLY ----------
 ORG = "JHDevOps"
@@ -63,15 +71,19 @@ PASTE_APP_7_PEM_HERE
 
 GITHUB_API = "https://api.github.com"
 DATA_DIR = pathlib.Path("./data"); DATA_DIR.mkdir(exist_ok=True)
+OUT_CSV = DATA_DIR / "repo_app_map.csv"
+OUT_PARQUET = DATA_DIR / "repo_app_map.parquet"
+WRITE_PARQUET = os.getenv("WRITE_PARQUET", "false").lower() == "true"  # needs pyarrow
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
+PER_PAGE = 100
+COLUMNS = ["repo_full_name", "repo_id", "private", "html_url", "app_slug", "app_id", "installation_id"]
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 def make_app_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 540, "iss": int(app_id)}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def req(method: str, url: str, headers: dict, **kw):
-    r = requests.request(method, url, headers=headers, timeout=45, **kw)
+    r = request(method, url, headers=headers, timeout=45, **kw)
     if r.status_code >= 400:
         raise RuntimeError(f"{method} {url} -> {r.status_code} {r.text[:300]}")
     return r
@@ -91,71 +103,150 @@ def list_all_installations(app_jwt_token: str):
     return out
 
 def create_installation_token(app_jwt_token: str, installation_id: int) -> str:
-    headers = {"Authorization": f"Bearer {app_jwt_token}", "Accept": "application/vnd.github+json"}
-    url = f"{GITHUB_API}/app/installations/{installation_id}/access_tokens"
-    return req("POST", url, headers).json()["token"]
+    return BROKER.installation_token(installation_id, app_jwt_token)
 
-def list_repos_for_installation(inst_token: str):
+def get_repos_page(inst_token: str, page: int):
     headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
-    url = f"{GITHUB_API}/installation/repositories"
-    repos = []
-    while url:
-        r = req("GET", url, headers)
-        j = r.json()
-        repos.extend(j.get("repositories", []))
-        url = r.links.get("next", {}).get("url")
-    return repos
+    url = f"{GITHUB_API}/installation/repositories?per_page={PER_PAGE}&page={page}"
+    return req("GET", url, headers).json()
+
+
+class MapWriter:
+    """Thread-safe streaming writer: CSV (+ optional Parquet) to temp files, renamed on close."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.apps = set()
+        self.tmp_csv = OUT_CSV.with_suffix(".csv.tmp")
+        self.fh = open(self.tmp_csv, "w", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.fh, fieldnames=COLUMNS)
+        self.csv.writeheader()
+        self.pq = None
+        if WRITE_PARQUET:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa = pa
+            self.schema = pa.schema([
+                ("repo_full_name", pa.string()), ("repo_id", pa.int64()), ("private", pa.bool_()),
+                ("html_url", pa.string()), ("app_slug", pa.string()), ("app_id", pa.int64()),
+                ("installation_id", pa.int64()),
+            ])
+            self.tmp_parquet = OUT_PARQUET.with_suffix(".parquet.tmp")
+            self.pq = pq.ParquetWriter(self.tmp_parquet, self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        with self.lock:
+            self.csv.writerows(rows)
+            if self.pq is not None:
+                self.pq.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+            self.rows += len(rows)
+            self.apps.update(r["app_slug"] for r in rows)
+
+    def close(self, commit=True):
+        self.fh.close()
+        if self.pq is not None:
+            self.pq.close()
+        if commit:
+            os.replace(self.tmp_csv, OUT_CSV)
+            if self.pq is not None:
+                os.replace(self.tmp_parquet, OUT_PARQUET)
+        else:
+            self.tmp_csv.unlink(missing_ok=True)
+            if self.pq is not None:
+                self.tmp_parquet.unlink(missing_ok=True)
+
+
+def org_rows(repos, slug, app_id, inst_id):
+    # Keep only repos owned by our org
+    return [{
+        "repo_full_name": r.get("full_name"),
+        "repo_id": r.get("id"),
+        "private": r.get("private"),
+        "html_url": r.get("html_url"),
+        "app_slug": slug,
+        "app_id": app_id,
+        "installation_id": inst_id  # recorded for reference, but not required as input
+    } for r in repos if (r.get("owner") or {}).get("login") == ORG]
+
 
 def main():
-    rows = []
-    for app in APPS:
+    writer = MapWriter()
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    per_app = {}
+    per_app_lock = threading.Lock()
+
+    def fetch_page(slug, app_id, inst_id, inst_token, page):
+        rows = org_rows(get_repos_page(inst_token, page).get("repositories", []), slug, app_id, inst_id)
+        writer.write(rows)
+        with per_app_lock:
+            per_app[slug] = per_app.get(slug, 0) + len(rows)
+
+    def fetch_installation(slug, app_id, app_jwt, inst_id):
+        # page 1 carries total_count, so the remaining pages can go out in parallel
+        inst_token = create_installation_token(app_jwt, inst_id)
+        first = get_repos_page(inst_token, 1)
+        rows = org_rows(first.get("repositories", []), slug, app_id, inst_id)
+        writer.write(rows)
+        with per_app_lock:
+            per_app[slug] = per_app.get(slug, 0) + len(rows)
+        pages = math.ceil(int(first.get("total_count", 0)) / PER_PAGE)
+        return [pool.submit(fetch_page, slug, app_id, inst_id, inst_token, p) for p in range(2, pages + 1)]
+
+    def fetch_app(app):
         slug = app["slug"]
         app_id = int(app["app_id"])
-        pem = app["private_key_pem"]
-
-        logging.info(f"[{slug}] Creating App JWT…")
-        app_jwt = make_app_jwt(app_id, pem)
-
         logging.info(f"[{slug}] Listing installations for this App…")
+        app_jwt = make_app_jwt(app_id, app["private_key_pem"])
         installs = list_all_installations(app_jwt)
         if not installs:
             logging.warning(f"[{slug}] No installations found (is the app installed anywhere?).")
-            continue
-
-        # Iterate every installation; collect only repos that belong to ORG
-        total_repos_for_org = 0
-        for ins in installs:
-            inst_id = ins.get("id")
-            acct = ins.get("account", {}) or {}
-            target_login = acct.get("login")
+        return [(slug, app_id, app_jwt, ins.get("id")) for ins in installs]
+
+    # the map is only replaced when every app, installation and page was read;
+    # a partial map would make repos look like they are in no app at all
+    failures = []
+    ok = False
+    try:
+        installs = []
+        app_futures = {pool.submit(fetch_app, app): app["slug"] for app in APPS}
+        for fut in as_completed(app_futures):
+            try:
+                installs.extend(fut.result())
+            except Exception as e:
+                logging.error(f"[{app_futures[fut]}] App listing failed: {e}")
+                failures.append(app_futures[fut])
+
+        inst_futures = {pool.submit(fetch_installation, *i): i for i in installs}
+        page_futures = {}
+        for fut in as_completed(inst_futures):
+            slug, _, _, inst_id = inst_futures[fut]
+            try:
+                for pf in fut.result():
+                    page_futures[pf] = (slug, inst_id)
+            except Exception as e:
+                logging.error(f"[{slug}] installation {inst_id} fetch failed: {e}")
+                failures.append(f"{slug}/{inst_id}")
+        for fut in as_completed(page_futures):
+            slug, inst_id = page_futures[fut]
             try:
-                inst_token = create_installation_token(app_jwt, inst_id)
-                repos = list_repos_for_installation(inst_token)
+                fut.result()
             except Exception as e:
-                logging.warning(f"[{slug}] installation {inst_id} fetch failed: {e}")
-                continue
-
-            # Keep only repos owned by our org
-            for r in repos:
-                owner = (r.get("owner") or {}).get("login")
-                if owner == ORG:
-                    total_repos_for_org += 1
-                    rows.append({
-                        "repo_full_name": r.get("full_name"),
-                        "repo_id": r.get("id"),
-                        "private": r.get("private"),
-                        "html_url": r.get("html_url"),
-                        "app_slug": slug,
-                        "app_id": app_id,
-                        "installation_id": inst_id  # recorded for reference, but not required as input
-                    })
-
-        logging.info(f"[{slug}] repos in org '{ORG}': {total_repos_for_org}")
-
-    df = pd.DataFrame(rows)
-    out = DATA_DIR / "repo_app_map.csv"
-    df.to_csv(out, index=False)
-    logging.info(f"Saved: {out} ({len(df)} rows). Apps discovered in org: {df['app_slug'].nunique() if not df.empty else 0}")
+                logging.error(f"[{slug}] installation {inst_id} page fetch failed: {e}")
+                failures.append(f"{slug}/{inst_id}")
+        ok = not failures
+    finally:
+        pool.shutdown(wait=True)
+        writer.close(commit=ok)
+
+    if failures:
+        raise SystemExit(f"{len(failures)} app/installation fetch(es) failed; kept the previous {OUT_CSV}.")
+
+    for slug in sorted(per_app):
+        logging.info(f"[{slug}] repos in org '{ORG}': {per_app[slug]}")
+    logging.info(f"Saved: {OUT_CSV} ({writer.rows} rows). Apps discovered in org: {len(writer.apps)}")
 
 if __name__ == "__main__":
     main()
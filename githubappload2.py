@@ -1,17 +1,23 @@
 # 02_sample_api_env_append.py
-# Collect GitHub App API usage and append to one growing CSV log.
+# Collect GitHub App API usage and append it to the date-partitioned sample
+# store (data/api_usage_samples/, see usage_sample_store.py).
 # Run this script every hour (cron, Task Scheduler, etc).
 # App IDs and RSA keys are read from env vars: appid1, rsakey1, appid2, rsakey2, ...
 
-import os, time, pathlib, logging, requests, jwt
+import os, pathlib, logging
 from datetime import datetime, timezone
-import pandas as pd
+
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+from usage_sample_store import SampleStore
+
+ratelimit_telemetry.install()
 
 # ---------- CONFIG ----------
 ORG = "JHDevOps"
 NUM_APPS = 7  # how many appid/rsakey pairs to read
 DATA_DIR = pathlib.Path("./data"); DATA_DIR.mkdir(exist_ok=True)
-SAMPLES_FILE = DATA_DIR / "api_usage_samples.csv"
+LEGACY_SAMPLES_FILE = DATA_DIR / "api_usage_samples.csv"  # old single-file log, imported once
 # ---------- END CONFIG ----------
 
 GITHUB_API = "https://api.github.com"
@@ -32,12 +38,10 @@ for i in range(1, NUM_APPS+1):
     })
 
 def make_app_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 540, "iss": int(app_id)}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def req(method: str, url: str, headers: dict, **kw):
-    r = requests.request(method, url, headers=headers, timeout=45, **kw)
+    r = request(method, url, headers=headers, timeout=45, **kw)
     if r.status_code >= 400:
         raise RuntimeError(f"{method} {url} -> {r.status_code} {r.text[:300]}")
     return r
@@ -56,9 +60,7 @@ def list_all_installations(app_jwt_token: str):
     return out
 
 def create_installation_token(app_jwt_token: str, installation_id: int) -> str:
-    headers = {"Authorization": f"Bearer {app_jwt_token}", "Accept": "application/vnd.github+json"}
-    url = f"{GITHUB_API}/app/installations/{installation_id}/access_tokens"
-    return req("POST", url, headers).json()["token"]
+    return BROKER.installation_token(installation_id, app_jwt_token)
 
 def get_rate_limit(inst_token: str):
     headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
@@ -97,6 +99,7 @@ def main():
                 "core_limit": core.get("limit"),
                 "core_used": core.get("used"),
                 "core_remaining": core.get("remaining"),
+                "core_reset": core.get("reset"),
                 "graphql_limit": gql.get("limit"),
                 "graphql_used": gql.get("used"),
                 "graphql_remaining": gql.get("remaining")
@@ -106,16 +109,11 @@ def main():
         logging.info("No rows collected.")
         return
 
-    new_df = pd.DataFrame(rows)
-
-    if SAMPLES_FILE.exists():
-        old_df = pd.read_csv(SAMPLES_FILE)
-        out_df = pd.concat([old_df, new_df], ignore_index=True)
-    else:
-        out_df = new_df
-
-    out_df.to_csv(SAMPLES_FILE, index=False)
-    logging.info(f"Appended {len(new_df)} rows. File now has {len(out_df)} total rows → {SAMPLES_FILE}")
+    store = SampleStore()
+    store.import_legacy(LEGACY_SAMPLES_FILE)
+    n = store.append(rows)
+    store.compact()
+    logging.info(f"Appended {n} rows → {store.root}")
 
 if __name__ == "__main__":
     main()
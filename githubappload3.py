@@ -1,12 +1,21 @@
-import os, time, pathlib, logging, requests, jwt
+import os, pathlib, logging
 from datetime import datetime, timezone
 import pandas as pd
 
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+from keyed_upsert import upsert
+
+ratelimit_telemetry.install()
+
 ORG = "JHDevOps"
 NUM_APPS = 7
 DATA_DIR = pathlib.Path("./data"); DATA_DIR.mkdir(exist_ok=True)
 SAMPLES_FILE = DATA_DIR / "api_usage_samples.csv"
 
+UPDATE_COLS = ["last_timestamp", "core_limit", "core_used", "core_remaining",
+               "graphql_limit", "graphql_used", "graphql_remaining"]
+
 GITHUB_API = "https://api.github.com"
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
@@ -23,12 +32,10 @@ for i in range(1, NUM_APPS+1):
     })
 
 def make_app_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 540, "iss": int(app_id)}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def req(method: str, url: str, headers: dict, **kw):
-    r = requests.request(method, url, headers=headers, timeout=45, **kw)
+    r = request(method, url, headers=headers, timeout=45, **kw)
     if r.status_code >= 400:
         raise RuntimeError(f"{method} {url} -> {r.status_code} {r.text[:300]}")
     return r
@@ -47,9 +54,7 @@ def list_all_installations(app_jwt_token: str):
     return out
 
 def create_installation_token(app_jwt_token: str, installation_id: int) -> str:
-    headers = {"Authorization": f"Bearer {app_jwt_token}", "Accept": "application/vnd.github+json"}
-    url = f"{GITHUB_API}/app/installations/{installation_id}/access_tokens"
-    return req("POST", url, headers).json()["token"]
+    return BROKER.installation_token(installation_id, app_jwt_token)
 
 def get_rate_limit(inst_token: str):
     headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
@@ -132,40 +137,11 @@ def main():
         if "count" not in old_df.columns:
             old_df["count"] = 0
 
-        old_df.set_index(["app_slug", "installation_id"], inplace=True, drop=False)
-        new_df.set_index(["app_slug", "installation_id"], inplace=True)
-
-        for idx, new_row in new_df.iterrows():
-            if idx in old_df.index:
-                for fld in ["core_limit", "core_used", "core_remaining",
-                            "graphql_limit", "graphql_used", "graphql_remaining",
-                            "last_timestamp"]:
-                    old_df.loc[idx, fld] = new_row.get(fld)
-                try:
-                    old_count = int(old_df.loc[idx, "count"])
-                    old_df.loc[idx, "count"] = old_count + 1
-                except Exception:
-                    old_df.loc[idx, "count"] = 1
-            else:
-                insert = {
-                    "app_slug": new_row.get("app_slug"),
-                    "installation_id": new_row.get("installation_id"),
-                    "last_timestamp": new_row.get("last_timestamp"),
-                    "core_limit": new_row.get("core_limit"),
-                    "core_used": new_row.get("core_used"),
-                    "core_remaining": new_row.get("core_remaining"),
-                    "graphql_limit": new_row.get("graphql_limit"),
-                    "graphql_used": new_row.get("graphql_used"),
-                    "graphql_remaining": new_row.get("graphql_remaining"),
-                    "count": 1
-                }
-                old_df.loc[idx] = insert
-
-        out_df = old_df.reset_index(drop=True)
+        out_df = upsert(old_df, new_df, keys=["app_slug", "installation_id"],
+                        update_cols=UPDATE_COLS, count_col="count")
     else:
-        new_df = new_df.reset_index(drop=True)
-        new_df["count"] = 1
-        out_df = new_df
+        out_df = upsert(None, new_df, keys=["app_slug", "installation_id"],
+                        update_cols=UPDATE_COLS, count_col="count")
 
     out_df.to_csv(SAMPLES_FILE, index=False)
     logging.info(f"Updated/created {len(rows)} rows. File now has {len(out_df)} total rows → {SAMPLES_FILE}")
@@ -1,15 +1,24 @@
-import os, time, pathlib, logging, requests, jwt, json
+import os, shutil, pathlib, logging
 from datetime import datetime, timezone, timedelta
-import pandas as pd
+
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+from usage_aggregate_db import UsageAggregateDB, load_legacy_json
+from ratelimit_forecast import Forecaster
+
+ratelimit_telemetry.install()
 
 ORG = os.getenv("ORG", "JHDevOps")
 NUM_APPS = int(os.getenv("NUM_APPS", "8"))
 DATA_DIR = pathlib.Path(os.getenv("DATA_DIR", "./data"))
 DATA_DIR.mkdir(exist_ok=True)
 # output files (can be overridden with env vars)
-AGG_FILE = pathlib.Path(os.getenv("AGG_FILE", str(DATA_DIR / "api_usage_aggregates.json")))
+AGG_DB = pathlib.Path(os.getenv("AGG_DB", str(DATA_DIR / "api_usage_aggregates.sqlite")))
 SUMMARY_CSV = pathlib.Path(os.getenv("SUMMARY_CSV", str(DATA_DIR / "api_usage_30d_summary.csv")))
-# optional: TeamCity artifact dependency can place a previous aggregates file and set its path here
+# optional: TeamCity artifact dependency can place a previous aggregates DB and set its path here
+PREV_AGG_DB = os.getenv("PREV_AGG_DB")
+# old JSON aggregates (AGG_FILE / PREV_AGG_FILE) are imported once into an empty DB
+AGG_FILE = pathlib.Path(os.getenv("AGG_FILE", str(DATA_DIR / "api_usage_aggregates.json")))
 PREV_AGG_FILE = os.getenv("PREV_AGG_FILE")
 
 GITHUB_API = "https://api.github.com"
@@ -24,12 +33,10 @@ for i in range(1, NUM_APPS + 1):
     APPS.append({"slug": f"app-{i}", "app_id": int(app_id), "private_key_pem": rsakey})
 
 def make_app_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 540, "iss": int(app_id)}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def req(method: str, url: str, headers: dict, **kw):
-    r = requests.request(method, url, headers=headers, timeout=45, **kw)
+    r = request(method, url, headers=headers, timeout=45, **kw)
     if r.status_code >= 400:
         raise RuntimeError(f"{method} {url} -> {r.status_code} {r.text[:300]}")
     return r
@@ -48,152 +55,82 @@ def list_all_installations(app_jwt_token: str):
     return out
 
 def create_installation_token(app_jwt_token: str, installation_id: int) -> str:
-    headers = {"Authorization": f"Bearer {app_jwt_token}", "Accept": "application/vnd.github+json"}
-    url = f"{GITHUB_API}/app/installations/{installation_id}/access_tokens"
-    return req("POST", url, headers).json()["token"]
+    return BROKER.installation_token(installation_id, app_jwt_token)
 
 def get_rate_limit(inst_token: str):
     headers = {"Authorization": f"token {inst_token}", "Accept": "application/vnd.github+json"}
     return req("GET", f"{GITHUB_API}/rate_limit", headers).json().get("resources", {})
 
-def _as_int(v):
-    try:
-        return int(v)
-    except Exception:
-        return 0
-
-def load_aggs():
-    # priority: PREV_AGG_FILE (artifact dependency) then AGG_FILE in workspace
-    candidate = None
-    if PREV_AGG_FILE:
-        p = pathlib.Path(PREV_AGG_FILE)
-        if p.exists():
-            candidate = p
-    if candidate is None and AGG_FILE.exists():
-        candidate = AGG_FILE
-    if not candidate:
-        logging.info("No previous aggregates file found; starting fresh.")
-        return {}
-    try:
-        logging.info(f"Loading previous aggregates from: {candidate}")
-        return json.loads(candidate.read_text(encoding="utf-8"))
-    except Exception as e:
-        logging.warning(f"Failed to load previous aggregates ({candidate}): {e}. Starting fresh.")
-        return {}
-
-def save_aggs(obj):
-    AGG_FILE.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
-    logging.info(f"Saved aggregates to: {AGG_FILE}")
-
-def prune_daily_counts(daily_counts):
-    today = datetime.now(timezone.utc).date()
-    cutoff = today - timedelta(days=29)
-    keys = list(daily_counts.keys())
-    for k in keys:
-        try:
-            d = datetime.strptime(k, "%Y-%m-%d").date()
-            if d < cutoff:
-                daily_counts.pop(k, None)
-        except Exception:
-            daily_counts.pop(k, None)
+def open_db() -> UsageAggregateDB:
+    # priority: PREV_AGG_DB (artifact dependency), then the DB in the workspace;
+    # a workspace copy left by an older build on this agent must not win
+    prev = pathlib.Path(PREV_AGG_DB) if PREV_AGG_DB else None
+    if prev and prev.exists() and prev.resolve() != AGG_DB.resolve():
+        logging.info(f"Seeding aggregates DB from artifact: {PREV_AGG_DB}")
+        AGG_DB.parent.mkdir(parents=True, exist_ok=True)
+        for sidecar in ("-wal", "-shm"):
+            # a stale WAL would be replayed onto the copied file
+            pathlib.Path(str(AGG_DB) + sidecar).unlink(missing_ok=True)
+        shutil.copyfile(prev, AGG_DB)
+    db = UsageAggregateDB(AGG_DB)
+    if db.is_empty():
+        for candidate in (PREV_AGG_FILE, AGG_FILE):
+            if candidate and pathlib.Path(candidate).exists():
+                n = db.import_json(load_legacy_json(pathlib.Path(candidate)))
+                logging.info(f"Imported {n} installations from legacy aggregates {candidate}")
+                break
+    return db
 
 def main():
-    ts = datetime.now(timezone.utc).isoformat()
-    today_key = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    aggs = load_aggs()
-    summary_rows = []
-
-    for app in APPS:
-        slug = app["slug"]; app_id = app["app_id"]; pem = app["private_key_pem"]
-        try:
-            app_jwt = make_app_jwt(app_id, pem)
-            installs = list_all_installations(app_jwt)
-        except Exception as e:
-            logging.error(f"[{slug}] list installations failed: {e}")
-            continue
-
-        for ins in installs:
-            inst_id = ins.get("id")
-            acct = (ins.get("account") or {}).get("login")
-            if acct != ORG:
-                continue
+    now = datetime.now(timezone.utc)
+    db = open_db()
+    forecaster = Forecaster.fit_from_db(db, now)
+    collected = 0
+
+    try:
+        for app in APPS:
+            slug = app["slug"]; app_id = app["app_id"]; pem = app["private_key_pem"]
             try:
-                inst_token = create_installation_token(app_jwt, inst_id)
-                resources = get_rate_limit(inst_token)
+                app_jwt = make_app_jwt(app_id, pem)
+                installs = list_all_installations(app_jwt)
             except Exception as e:
-                logging.warning(f"[{slug}] inst {inst_id} failed: {e}")
+                logging.error(f"[{slug}] list installations failed: {e}")
                 continue
 
-            core = resources.get("core", {}) or {}
-            used = _as_int(core.get("used", 0))
-            limit = _as_int(core.get("limit", 0))
-
-            key = f"{slug}|{inst_id}"
-            record = aggs.get(key, {
-                "app_slug": slug,
-                "installation_id": int(inst_id),
-                "last_core_used": None,
-                "last_core_limit": None,
-                "last_ts": None,
-                "last_hour_count": 0,
-                "daily_counts": {},
-                "total_calls_alltime": 0
-            })
-
-            prev_used = record.get("last_core_used")
-            prev_limit = record.get("last_core_limit")
-
-            if prev_used is None:
-                delta = used
-            else:
-                if used >= prev_used:
-                    delta = used - prev_used
-                else:
-                    if prev_limit:
-                        try:
-                            delta = (prev_limit - prev_used) + used
-                            if delta < 0:
-                                delta = used
-                        except Exception:
-                            delta = used
-                    else:
-                        delta = used
-
-            if delta < 0:
-                delta = 0
-
-            record["last_hour_count"] = int(delta)
-            record["last_core_used"] = int(used)
-            record["last_core_limit"] = int(limit)
-            record["last_ts"] = ts
-
-            dc = record.get("daily_counts") or {}
-            dc[today_key] = int(dc.get(today_key, 0)) + int(delta)
-            prune_daily_counts(dc)
-            record["daily_counts"] = dc
-            record["total_calls_alltime"] = int(record.get("total_calls_alltime", 0)) + int(delta)
-
-            aggs[key] = record
-
-            last_30d_total = sum(int(v) for v in dc.values())
-            summary_rows.append({
-                "app_slug": slug,
-                "installation_id": inst_id,
-                "last_timestamp": ts,
-                "last_hour_count": int(delta),
-                "today_total": int(dc.get(today_key, 0)),
-                "last_30d_total": int(last_30d_total)
-            })
-
-    save_aggs(aggs)
-
-    if summary_rows:
-        df = pd.DataFrame(summary_rows)
-        df.to_csv(SUMMARY_CSV, index=False)
-        logging.info(f"Wrote summary for {len(df)} rows → {SUMMARY_CSV}")
-        logging.info(df.to_string(index=False))
-    else:
-        logging.info("No rows collected.")
+            for ins in installs:
+                inst_id = ins.get("id")
+                acct = (ins.get("account") or {}).get("login")
+                if acct != ORG:
+                    continue
+                try:
+                    inst_token = create_installation_token(app_jwt, inst_id)
+                    resources = get_rate_limit(inst_token)
+                except Exception as e:
+                    logging.warning(f"[{slug}] inst {inst_id} failed: {e}")
+                    continue
+
+                core = resources.get("core", {}) or {}
+                db.record_sample(slug, inst_id, core, now)
+                collected += 1
+
+                if core.get("reset"):
+                    f = forecaster.forecast(inst_id, int(core.get("used", 0)), int(core.get("limit", 0)),
+                                            int(core["reset"]), now)
+                    if f.will_exhaust:
+                        logging.warning(f"[{slug}] inst {inst_id} on track to exhaust core limit at "
+                                        f"{f.exhausts_at:%H:%M} UTC ({f.rate_per_min:.0f} calls/min)")
+
+        db.prune(now)
+        if collected:
+            df = db.summary(now)
+            df.to_csv(SUMMARY_CSV, index=False)
+            logging.info(f"Wrote summary for {len(df)} rows → {SUMMARY_CSV}")
+            logging.info(df.to_string(index=False))
+        else:
+            logging.info("No rows collected.")
+    finally:
+        db.close()
+        logging.info(f"Saved aggregates to: {AGG_DB}")
 
 if __name__ == "__main__":
     main()
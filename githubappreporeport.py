@@ -1,95 +1,139 @@
 import os
-import jwt
-import time
-import requests
+import math
+from concurrent.futures import ThreadPoolExecutor
 from openpyxl import Workbook
 
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
 BASE_URL = "https://api.github.com"
+PER_PAGE = 100
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
 
+OUT_XLSX = "GitHub_Apps_Repositories.xlsx"
+# Long-format copy for machine consumers: app, installation_id, repository.
+# Parquet when pyarrow is installed, CSV otherwise.
+OUT_PARQUET = "GitHub_Apps_Repositories.parquet"
+OUT_CSV = "GitHub_Apps_Repositories.csv"
 
-APP_IDS = [os.getenv('appid1'), os.getenv('appid2'), os.getenv('appid3'), os.getenv('appid4'), os.getenv('appid5'), os.getenv('appid6'), os.getenv('appid7'), os.getenv('appid8')]  
-RSA_KEYS = [os.getenv('rsakey1'), os.getenv('rsakey2'), os.getenv('rsakey3'), os.getenv('rsakey4'), os.getenv('rsakey5'), os.getenv('rsakey6'), os.getenv('rsakey7'), os.getenv('rsakey8') ]  
+
+APP_IDS = [os.getenv('appid1'), os.getenv('appid2'), os.getenv('appid3'), os.getenv('appid4'), os.getenv('appid5'), os.getenv('appid6'), os.getenv('appid7'), os.getenv('appid8')]
+RSA_KEYS = [os.getenv('rsakey1'), os.getenv('rsakey2'), os.getenv('rsakey3'), os.getenv('rsakey4'), os.getenv('rsakey5'), os.getenv('rsakey6'), os.getenv('rsakey7'), os.getenv('rsakey8') ]
 
 
 def generate_jwt(app_id, private_key):
-    payload = {
-        "iat": int(time.time()),
-        "exp": int(time.time()) + (10 * 60),
-        "iss": app_id,
-    }
-    token = jwt.encode(payload, private_key, algorithm="RS256")
-    return token
+    return BROKER.app_jwt(app_id, private_key)
 
 
 def get_installation_token(installation_id, jwt_token):
-    url = f"{BASE_URL}/app/installations/{installation_id}/access_tokens"
-    headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
-    response = requests.post(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["token"]
+    return BROKER.installation_token(installation_id, jwt_token)
 
 
 def get_installations(jwt_token):
     url = f"{BASE_URL}/app/installations"
     headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    installations = []
+    while url:
+        response = request("GET", url, headers, params={"per_page": 100}, timeout=45)
+        response.raise_for_status()
+        installations.extend(response.json())
+        url = response.links.get("next", {}).get("url")
+    return installations
 
 
-def get_repositories(installation_token):
+def get_repositories_page(installation_token, page):
     url = f"{BASE_URL}/installation/repositories"
     headers = {"Authorization": f"Bearer {installation_token}", "Accept": "application/vnd.github+json"}
-    all_repositories = []
-    page = 1
+    response = request("GET", url, headers, params={"per_page": PER_PAGE, "page": page}, timeout=45)
+    response.raise_for_status()
+    return response.json()
 
-    while True:
-        response = requests.get(url, headers=headers, params={"per_page": 100, "page": page})
-        response.raise_for_status()
-        repositories = response.json()["repositories"]
-        if not repositories:
-            break
-        all_repositories.extend(repositories)
-        page += 1
 
+def get_repositories(installation_token, page_pool):
+    # page 1 carries total_count, so the remaining pages go out in parallel
+    # and no request is spent on an empty trailing page
+    first = get_repositories_page(installation_token, 1)
+    all_repositories = list(first["repositories"])
+    pages = math.ceil(int(first.get("total_count", 0)) / PER_PAGE)
+    futures = [page_pool.submit(get_repositories_page, installation_token, p) for p in range(2, pages + 1)]
+    for fut in futures:  # in page order
+        all_repositories.extend(fut.result()["repositories"])
     return all_repositories
 
 
 def save_to_excel(data):
-    wb = Workbook()
+    # write-only workbook: rows are streamed to disk instead of held as cell objects
+    wb = Workbook(write_only=True)
     for app_name, repos in data.items():
-        ws = wb.create_sheet(title=app_name[:30]) 
+        ws = wb.create_sheet(title=app_name[:30])
         ws.append(["Repository Name"])
         for repo in repos:
             ws.append([repo])
-    if "Sheet" in wb.sheetnames:
-        wb.remove(wb["Sheet"])
-    wb.save("GitHub_Apps_Repositories.xlsx")
+    wb.save(OUT_XLSX)
+
+
+def save_columnar(data, installation_ids):
+    apps, inst_ids, repos = [], [], []
+    for app_name, names in data.items():
+        apps.extend([app_name] * len(names))
+        inst_ids.extend([installation_ids[app_name]] * len(names))
+        repos.extend(names)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        import csv
+        with open(OUT_CSV, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["app", "installation_id", "repository"])
+            writer.writerows(zip(apps, inst_ids, repos))
+        return OUT_CSV
+    table = pa.table({
+        "app": pa.array(apps, pa.string()),
+        "installation_id": pa.array(inst_ids, pa.int64()),
+        "repository": pa.array(repos, pa.string()),
+    })
+    pq.write_table(table, OUT_PARQUET)
+    return OUT_PARQUET
 
 
 def main():
     if len(APP_IDS) != len(RSA_KEYS):
         raise ValueError("The number of App IDs and RSA private keys must be the same.")
 
-    data = {}
-    #for app_id, private_key in zip(APP_IDS, RSA_KEYS):
-    for idx, (app_id, private_key) in enumerate(zip(APP_IDS, RSA_KEYS), start=1):
+    def fetch_app(idx, app_id, private_key):
         jwt_token = generate_jwt(app_id, private_key)
-        installations = get_installations(jwt_token)
-
-        for installation in installations:
-            app_name = installation.get("account", {}).get("login")
-            installation_id = installation["id"]
-
-            print(f"Fetching repositories for app: {app_name}")
-            installation_token = get_installation_token(installation_id, jwt_token)
-            repos = get_repositories(installation_token)
-            repo_names = [repo["full_name"] for repo in repos]
-            data[f"{app_name}_App{idx}"] = repo_names
+        return [(idx, jwt_token, installation) for installation in get_installations(jwt_token)]
+
+    def fetch_installation(idx, jwt_token, installation):
+        app_name = installation.get("account", {}).get("login")
+        installation_id = installation["id"]
+        print(f"Fetching repositories for app: {app_name}")
+        installation_token = get_installation_token(installation_id, jwt_token)
+        repos = get_repositories(installation_token, page_pool)
+        return f"{app_name}_App{idx}", installation_id, [repo["full_name"] for repo in repos]
+
+    # separate pools so installation workers never wait on their own pool for pages
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as page_pool:
+        app_futures = [pool.submit(fetch_app, idx, app_id, private_key)
+                       for idx, (app_id, private_key) in enumerate(zip(APP_IDS, RSA_KEYS), start=1)]
+        installations = [i for fut in app_futures for i in fut.result()]
+        inst_futures = [pool.submit(fetch_installation, *i) for i in installations]
+
+        # sheets keep the app/installation order of the serial version
+        data, installation_ids = {}, {}
+        for fut in inst_futures:
+            sheet, installation_id, repo_names = fut.result()
+            data[sheet] = repo_names
+            installation_ids[sheet] = installation_id
 
     print("Saving data to Excel...")
     save_to_excel(data)
-    print("Data saved to 'GitHub_Apps_Repositories.xlsx'")
+    print(f"Data saved to '{OUT_XLSX}'")
+    print(f"Columnar copy saved to '{save_columnar(data, installation_ids)}'")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,14 @@
-import time
 import logging
 from typing import Dict, List, Optional, Tuple
 import requests
-import jwt  
 import os
 
+from githubapp_index import AmbiguousInstallation, load_index
+from githubapp_tokens import BROKER, request
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
 
 USER_PAT = os.getenv('GITHUB_PAT') 
 APP_SLUG = os.getenv('githubapp') 
@@ -55,6 +59,8 @@ APPS: Dict[str, Dict[str, str]] = {
 
 READ_TEAM_SLUG = "jh_devops_pipeline_team_acl"
 
+APP_INDEX = None  # repo -> (app, installation) index, loaded in run()
+
 log = logging.getLogger("gh-app-repos")
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -64,7 +70,7 @@ class GitHubError(Exception):
     pass
 
 def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
-    resp = requests.request(method, url, headers=headers, **kwargs)
+    resp = request(method, url, headers=headers, **kwargs)
     if 200 <= resp.status_code < 300:
         return resp
     try:
@@ -74,9 +80,7 @@ def gh_request(method: str, url: str, headers: Dict[str, str], **kwargs):
     raise GitHubError(f"{method} {url} -> {resp.status_code}: {body}")
 
 def generate_jwt(app_id: int, private_key_pem: str) -> str:
-    now = int(time.time())
-    payload = {"iat": now - 60, "exp": now + 600, "iss": app_id}
-    return jwt.encode(payload, private_key_pem, algorithm="RS256")
+    return BROKER.app_jwt(app_id, private_key_pem)
 
 def get_app(jwt_token: str) -> Dict:
     url = f"{BASE_URL}/app"
@@ -89,10 +93,7 @@ def get_installations(jwt_token: str) -> List[Dict]:
     return gh_request("GET", url, headers).json()
 
 def get_installation_token(jwt_token: str, installation_id: int) -> str:
-    url = f"{BASE_URL}/app/installations/{installation_id}/access_tokens"
-    headers = {"Authorization": f"Bearer {jwt_token}", "Accept": "application/vnd.github+json"}
-    r = gh_request("POST", url, headers)
-    return r.json()["token"]
+    return BROKER.installation_token(installation_id, jwt_token)
 
 def installation_has_repo_with_inst_token(inst_token: str, repo_id: int) -> bool:
     headers = {"Authorization": f"Bearer {inst_token}", "Accept": "application/vnd.github+json"}
@@ -154,22 +155,12 @@ def pick_installation(installs: List[Dict], repo_owner: str) -> int:
     raise SystemExit("Disambiguation needed: multiple installations and none/too many match repo owner.")
 
 def find_repo_in_any_app(repo_id: int) -> Optional[Tuple[str, int]]:
-    
-    for slug, cfg in APPS.items():
-        try:
-            jwt_token = generate_jwt(cfg["id"], cfg["private_key"])
-            
-            _ = get_app(jwt_token)
-            installs = get_installations(jwt_token)
-            for inst in installs:
-                inst_id = inst["id"]
-                if installation_has_repo(jwt_token, inst_id, repo_id):
-                    return slug, inst_id
-        except Exception as e:
-            
-            log.debug("Skipping app %s during global check: %s", slug, e)
-            continue
-    return None
+    # local index lookup (refreshed incrementally) instead of scanning every app
+    try:
+        return APP_INDEX.lookup(repo_id)
+    except AmbiguousInstallation as e:
+        # in several apps already: picking one would hide the drift
+        raise GitHubError(f"Ambiguous: {e}")
 
 
 def grant_team_repo_access_read(pat: str, org: str, repo: str, team_slug: str):
@@ -203,6 +194,9 @@ def run():
     repo_id = repo_id_with_pat(USER_PAT, REPO_FULLNAME)
     log.info("Repo id for %s is %s", REPO_FULLNAME, repo_id)
 
+    global APP_INDEX
+    APP_INDEX = load_index(APPS)
+
     
     found = find_repo_in_any_app(repo_id)
     if ACTION == "add" and found:
@@ -230,18 +224,25 @@ def run():
     log.info("Chosen installation %s on owner '%s'", installation_id, owner)
 
     
-    is_member = installation_has_repo(jwt_token, installation_id, repo_id)
+    is_member = found is not None and found == (APP_SLUG, installation_id)
     if ACTION == "add" and is_member:
         log.info("Repo %s is already part of this app installation %s. Skipping.", REPO_FULLNAME, installation_id)
         return
     if ACTION == "remove" and not is_member:
-        log.info("Repo %s is NOT part of this app installation %s (will attempt remove anyway).",
-                 REPO_FULLNAME, installation_id)
+        # the index misses same-count swaps made outside these scripts; ask GitHub
+        if installation_has_repo(jwt_token, installation_id, repo_id):
+            log.warning("Index was stale: %s is in installation %s; index updated.", REPO_FULLNAME, installation_id)
+            APP_INDEX.record_add(repo_id, REPO_FULLNAME, APP_SLUG, installation_id)
+        else:
+            log.info("Repo %s is NOT part of this app installation %s (will attempt remove anyway).",
+                     REPO_FULLNAME, installation_id)
 
     log.info("%s %s to installation %s ...",
              "Adding" if ACTION == "add" else "Removing", REPO_FULLNAME, installation_id)
     if ACTION == "add":
         add_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+        APP_INDEX.record_add(repo_id, REPO_FULLNAME, APP_SLUG, installation_id)
+        APP_INDEX.save()
         # CONDITIONAL: only grant team READ access if TeamCity param says "yes"
         if TEAM_ACL_READ == "yes":
             grant_team_repo_access_read(USER_PAT, repo_owner, REPO_FULLNAME.split("/", 1)[1], READ_TEAM_SLUG)
@@ -249,6 +250,8 @@ def run():
             log.info("Skipping team READ access because team_acl_read is '%s'", TEAM_ACL_READ)
     else:
         remove_repo_with_user_pat(USER_PAT, installation_id, repo_id)
+        APP_INDEX.record_remove(repo_id, APP_SLUG, installation_id)
+        APP_INDEX.save()
 
     log.info("Done.")
 
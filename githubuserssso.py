@@ -1,5 +1,8 @@
 import requests
 import pandas as pd
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ==========================
 # CONFIG
@@ -1,6 +1,9 @@
 import pandas as pd
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # === CONFIG ===
 ORG_NAME = "JHDevOps"
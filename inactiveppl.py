@@ -1,6 +1,9 @@
 import requests
 import datetime
 import pandas as pd
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # ------------- CONFIG -------------
 GITHUB_TOKEN = "ghp_yourPATtoken"  # 🔐 Replace with your PAT token
@@ -3,6 +3,9 @@ import time
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 
 TOKEN = ''  # <<< put your PAT here
@@ -4,6 +4,9 @@ from requests.auth import HTTPBasicAuth
 from requests.adapters import HTTPAdapter, Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 ORG_NAME = "JHDevOps"
 PAT = os.getenv('GITHUB_PAT')
@@ -1,5 +1,4 @@
-import requests
-from datetime import datetime, timezone
+from audit_log_store import AuditLogStore, make_session, parse_github_time
 
 # ---------- CONFIG ----------
 ORG = "JHDevOps"
@@ -7,72 +6,36 @@ USERNAME = "hardcoded-username"   # <- put the target login here (their GitHub u
 TOKEN = "ghp_yourPATtoken"        # <- PAT with admin:org
 # ----------------------------
 
-API_HEADERS = {
-    "Authorization": f"token {TOKEN}",
-    "Accept": "application/vnd.github+json",
-    "X-GitHub-Api-Version": "2022-11-28",
-}
-
-BASE_URL = f"https://api.github.com/orgs/{ORG}/audit-log"
-
-def parse_github_time(value):
-    """
-    Accepts ISO 8601 string, epoch seconds, or epoch milliseconds.
-    Returns a timezone-aware UTC datetime.
-    """
-    if value is None:
-        return None
-    # int/float -> epoch; GitHub often uses milliseconds
-    if isinstance(value, (int, float)):
-        # Heuristic: treat >= 10^12 as ms, else seconds
-        if value >= 1_000_000_000_000:
-            return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc)
-        else:
-            return datetime.fromtimestamp(value, tz=timezone.utc)
-    # str -> ISO 8601
-    if isinstance(value, str):
-        # Normalize trailing Z to +00:00
-        iso = value.replace("Z", "+00:00")
-        try:
-            return datetime.fromisoformat(iso)
-        except Exception:
-            return None
-    return None
+# login-like actions, in order of preference
+LOGIN_ACTIONS = [
+    "user.login",
+    "user.failed_login",
+    "github_app_authentication",
+]
 
 def get_latest_login(org: str, username: str):
     """
     Returns (dt, raw_event, source_action) for the user's latest login-like activity
     or (None, None, None) if not found.
-    """
-    # Try successful login first
-    search_phrases = [
-        f"actor:{username} action:user.login",
-        # Uncomment these if you want to consider other auth events as a fallback:
-        f"actor:{username} action:user.failed_login",
-        f"actor:{username} action:github_app_authentication",
-    ]
 
-    for phrase in search_phrases:
-        params = {
-            "phrase": phrase,
-            "per_page": 1,    # newest first, 1 result
-            "order": "desc",
-            "include": "all"  # include web & API events
-        }
-        resp = requests.get(BASE_URL, headers=API_HEADERS, params=params, timeout=30)
-        if resp.status_code != 200:
-            raise RuntimeError(f"GitHub API error {resp.status_code}: {resp.text}")
-
-        events = resp.json()
-        if not events:
-            continue
-
-        ev = events[0]
-        # Prefer '@timestamp'; also try 'created_at' if present
-        ts = ev.get("@timestamp") or ev.get("created_at") or ev.get("timestamp")
-        dt = parse_github_time(ts)
-        if dt:
-            return dt, ev, phrase
+    Reads the local audit log copy (audit_log_store), after fetching only the
+    events that arrived since the last run.
+    """
+    store = AuditLogStore()
+    try:
+        # logins are web events; git events would only bloat the copy
+        store.ingest(make_session(TOKEN), org, include="web")
+        for action in LOGIN_ACTIONS:
+            ev = store.latest(username, action)
+            if ev is None:
+                continue
+            # Prefer '@timestamp'; also try 'created_at' if present
+            ts = ev.get("@timestamp") or ev.get("created_at") or ev.get("timestamp")
+            dt = parse_github_time(ts)
+            if dt:
+                return dt, ev, f"actor:{username} action:{action}"
+    finally:
+        store.close()
 
     return None, None, None
 
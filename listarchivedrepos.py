@@ -12,6 +12,9 @@ import time
 import requests
 import pandas as pd
 from getpass import getpass
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 ORG = "JHDevOps"
 OUTPUT_XLSX = f"{ORG}_archived_repos.xlsx"
@@ -0,0 +1,269 @@
+# lockdown_planner.py
+# Dry-run planner for bulk lockdown/archive jobs (repo_lockdown).
+#
+# Instead of walking the list one repo at a time and logging what it would do,
+# this reads the current state of every repo up front and writes the exact
+# mutations the engine would send, with a predicted REST call count:
+#   - visibility/archived/direct collaborators: aliased GraphQL queries,
+#     GRAPHQL_BATCH repos per request (GraphQL budget, not the REST one)
+#   - teams and pending invitations (not exposed on Repository in GraphQL):
+#     concurrent REST listings
+#   - steps already recorded in the lockdown journal are left out
+#
+# The predicted calls are then fitted against the token's rate-limit headroom
+# (live /rate_limit reading + ratelimit_forecast for the rest of the window)
+# and split into windows that each fit one reset period:
+#
+#   data/lockdown_plan.csv             window, repo, method, path, reason
+#   data/lockdown_plan_repos.csv       per repo state + predicted calls
+#   data/lockdown_windows/window_N.txt repo list to feed REPOS_TO_PROCESS per window
+#
+#   plan = build_plan(gh, ORG, entries)        # used by the drivers when DRY_RUN = True
+
+import os
+import json
+import math
+import pathlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from ratelimit_forecast import Forecaster, SAFETY_MARGIN, WINDOW_SECONDS
+from repo_lockdown import (JOURNAL_FILE, MAX_WORKERS, MUTATIONS_PER_SECOND, REQUESTS_PER_SECOND, STEPS,
+                           StepJournal, parse_entries)
+
+GRAPHQL_BATCH = int(os.getenv("PLAN_GRAPHQL_BATCH", "50"))
+PER_PAGE = 100
+PLAN_CSV = pathlib.Path(os.getenv("LOCKDOWN_PLAN_CSV", "./data/lockdown_plan.csv"))
+PLAN_REPOS_CSV = pathlib.Path(os.getenv("LOCKDOWN_PLAN_REPOS_CSV", "./data/lockdown_plan_repos.csv"))
+WINDOWS_DIR = pathlib.Path(os.getenv("LOCKDOWN_WINDOWS_DIR", "./data/lockdown_windows"))
+
+REPO_FIELDS = """
+    nameWithOwner visibility isArchived
+    collaborators(affiliation: DIRECT, first: 100) { totalCount nodes { login } }
+"""
+
+log = logging.getLogger("lockdown-planner")
+
+
+def _pages(n: int) -> int:
+    # the engine stops on a short page, so n items cost n // 100 + 1 listing calls
+    return n // PER_PAGE + 1
+
+
+def _list_all(fetch_page) -> List[Dict]:
+    items, page = [], 1
+    while True:
+        batch = fetch_page(page)
+        items.extend(batch)
+        if len(batch) < PER_PAGE:
+            return items
+        page += 1
+
+
+def read_states(gh, targets) -> Dict[str, Dict]:
+    """{owner/repo: {found, visibility, archived, collaborators, teams, invitations}} for all targets."""
+    states: Dict[str, Dict] = {}
+
+    for start in range(0, len(targets), GRAPHQL_BATCH):
+        chunk = targets[start:start + GRAPHQL_BATCH]
+        fields = "\n".join(
+            f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{ {REPO_FIELDS} }}"
+            for i, (owner, repo) in enumerate(chunk))
+        body = gh.graphql("query {\n" + fields + "\n}")
+        if not body or body.get("data") is None:
+            raise SystemExit(f"GraphQL state read failed: {(body or {}).get('errors')}")
+        data = body["data"]
+        for i, (owner, repo) in enumerate(chunk):
+            node = data.get(f"r{i}")
+            key = f"{owner}/{repo}"
+            if node is None:
+                states[key] = {"found": False}
+                continue
+            collabs = node["collaborators"] or {"totalCount": 0, "nodes": []}
+            logins = [n["login"] for n in collabs["nodes"]]
+            if collabs["totalCount"] > len(logins):
+                # more than one GraphQL page: take the full list from REST
+                logins = [c["login"] for c in _list_all(lambda p: gh.list_collaborators(owner, repo, page=p))]
+            states[key] = {"found": True, "visibility": node["visibility"].lower(),
+                           "archived": node["isArchived"], "collaborators": logins}
+        log.info("State read: %d/%d repos", min(start + GRAPHQL_BATCH, len(targets)), len(targets))
+
+    def rest_lists(owner, repo):
+        teams = _list_all(lambda p: gh.list_repo_teams(owner, repo, page=p))
+        invs = _list_all(lambda p: gh.list_repo_invitations(owner, repo, page=p))
+        return [t["slug"] for t in teams if t.get("slug")], [i["id"] for i in invs if i.get("id")]
+
+    found = [(o, r) for o, r in targets if states[f"{o}/{r}"]["found"]]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for (owner, repo), (teams, invs) in zip(found, pool.map(lambda t: rest_lists(*t), found)):
+            states[f"{owner}/{repo}"].update(teams=teams, invitations=invs)
+    return states
+
+
+def repo_mutations(org, owner, repo, state: Dict, done: Dict[str, int]) -> List[Dict]:
+    """The exact requests repo_lockdown would send, journaled steps excluded."""
+    base = f"/repos/{owner}/{repo}"
+    calls = []
+
+    def add(step, method, path, reason):
+        calls.append({"step": step, "method": method, "path": path, "reason": reason})
+
+    if "made_private" not in done or "archived" not in done:
+        add("read", "GET", base, "repo metadata")
+    if "made_private" not in done and state["visibility"] != "private":
+        add("made_private", "PATCH", base, f"visibility {state['visibility']} -> private")
+    if "collab_removed" not in done:
+        for _ in range(_pages(len(state["collaborators"]))):
+            add("collab_removed", "GET", f"{base}/collaborators", "list direct collaborators")
+        for login in state["collaborators"]:
+            add("collab_removed", "DELETE", f"{base}/collaborators/{login}", "direct collaborator")
+    if "teams_removed" not in done:
+        for _ in range(_pages(len(state["teams"]))):
+            add("teams_removed", "GET", f"{base}/teams", "list teams")
+        for slug in state["teams"]:
+            add("teams_removed", "DELETE", f"/orgs/{org}/teams/{slug}/repos/{owner}/{repo}", "team access")
+    if "inv_revoked" not in done:
+        for _ in range(_pages(len(state["invitations"]))):
+            add("inv_revoked", "GET", f"{base}/invitations", "list invitations")
+        for inv_id in state["invitations"]:
+            add("inv_revoked", "DELETE", f"{base}/invitations/{inv_id}", "pending invitation")
+    if "archived" not in done and not state["archived"]:
+        add("archived", "PATCH", base, "archive")
+    return calls
+
+
+def window_budgets(reading: Dict, forecaster: Forecaster, now: datetime):
+    """(budget for the current window, budget for each later full window)."""
+    f = forecaster.forecast(None, int(reading["used"]), int(reading["limit"]), int(reading["reset"]), now)
+    cap = f.limit * (1.0 - SAFETY_MARGIN)
+    first = max(int(cap - f.projected_used), 0)
+    # other traffic on this token is assumed to keep its current pace
+    later = max(int(cap - f.rate_per_min * WINDOW_SECONDS / 60.0), 0)
+    return first, later, f
+
+
+def split_windows(per_repo: List[Dict], fits_first: Callable[[int], bool], later_budget: int) -> List[int]:
+    """
+    Window number for each repo, in list order; a repo never straddles two windows.
+    The current window takes repos while fits_first(calls so far) holds, the
+    later ones up to later_budget calls each.
+    """
+    windows, window, left, used = [], 0, 0, 0
+    for r in per_repo:
+        calls = r["predicted_calls"]
+        fits = fits_first(used + calls) if window == 0 else calls <= left
+        if not fits and (used or window == 0):
+            window, left, used = window + 1, later_budget, 0
+        windows.append(window)
+        left -= calls
+        used += calls
+    return windows
+
+
+def build_plan(gh, org, entries: List[str], journal_file: Optional[pathlib.Path] = JOURNAL_FILE) -> pd.DataFrame:
+    targets = parse_entries(org, entries)
+    now = datetime.now(timezone.utc)
+    # read headroom before our own state reads show up in it
+    reading = gh.rate_limit()
+    if reading is None:
+        raise SystemExit("Could not read /rate_limit for this token.")
+
+    journal = StepJournal(journal_file) if journal_file and pathlib.Path(journal_file).exists() else None
+    states = read_states(gh, targets)
+    read_calls = sum(_pages(len(s["teams"])) + _pages(len(s["invitations"])) for s in states.values() if s["found"])
+
+    mutations, per_repo = [], []
+    for owner, repo in targets:
+        key = f"{owner}/{repo}"
+        state = states[key]
+        if not state["found"]:
+            per_repo.append({"repo": key, "status": "not_found", "predicted_calls": 0})
+            continue
+        done = journal.completed(key) if journal else {}
+        calls = repo_mutations(org, owner, repo, state, done)
+        for c in calls:
+            c["repo"] = key
+        mutations.extend(calls)
+        per_repo.append({
+            "repo": key, "status": "done" if len(done) == len(STEPS) else "planned",
+            "visibility": state["visibility"], "archived": state["archived"],
+            "collaborators": len(state["collaborators"]), "teams": len(state["teams"]),
+            "invitations": len(state["invitations"]),
+            "journaled_steps": len(done),
+            "mutations": sum(c["method"] != "GET" for c in calls),
+            "predicted_calls": len(calls),
+        })
+    if journal:
+        journal.close()
+
+    reading = dict(reading, used=int(reading["used"]) + read_calls)
+    # a PAT has no per-installation history, so only the live pace is used
+    forecaster = Forecaster()
+    first, later, f = window_budgets(reading, forecaster, now)
+    total = sum(r["predicted_calls"] for r in per_repo)
+    if total and not first and not later:
+        raise SystemExit("No rate-limit headroom left for this token; nothing can be scheduled.")
+    if later and any(r["predicted_calls"] > later for r in per_repo):
+        log.warning("Some repos need more calls than one window allows; they get a window of their own.")
+
+    windows = split_windows(per_repo, lambda calls: not forecaster.should_defer(None, reading, calls, now), later)
+    for r, w in zip(per_repo, windows):
+        r["window"] = w
+    window_of = {r["repo"]: r["window"] for r in per_repo}
+    for c in mutations:
+        c["window"] = window_of[c["repo"]]
+
+    _write_outputs(mutations, per_repo)
+    _log_summary(per_repo, total, first, later, f, now)
+    return pd.DataFrame(per_repo)
+
+
+def _write_outputs(mutations: List[Dict], per_repo: List[Dict]):
+    PLAN_CSV.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(mutations, columns=["window", "repo", "step", "method", "path", "reason"]).to_csv(PLAN_CSV, index=False)
+    pd.DataFrame(per_repo).to_csv(PLAN_REPOS_CSV, index=False)
+
+    WINDOWS_DIR.mkdir(parents=True, exist_ok=True)
+    for old in WINDOWS_DIR.glob("window_*.txt"):
+        old.unlink()
+    by_window: Dict[int, List[str]] = {}
+    for r in per_repo:
+        if r["status"] == "planned":
+            by_window.setdefault(r["window"], []).append(r["repo"].split("/", 1)[1])
+    for w, repos in sorted(by_window.items()):
+        (WINDOWS_DIR / f"window_{w}.txt").write_text("\n".join(repos) + "\n", encoding="utf-8")
+
+
+def _log_summary(per_repo, total, first, later, f, now):
+    planned = [r for r in per_repo if r["status"] == "planned"]
+    log.info("==== PLAN ====")
+    log.info("Repos: %d planned, %d already done, %d not found",
+             len(planned), sum(r["status"] == "done" for r in per_repo),
+             sum(r["status"] == "not_found" for r in per_repo))
+    log.info("Predicted REST calls: %d (%d mutations)", total, sum(r.get("mutations", 0) for r in per_repo))
+    reset_at = datetime.fromtimestamp(f.reset, timezone.utc)
+    log.info("Headroom: %d calls until reset at %s UTC, %d per later window (token at %d/%d, %.1f calls/min)",
+             first, reset_at.strftime("%H:%M"), later, f.used, f.limit, f.rate_per_min)
+
+    by_window: Dict[int, int] = {}
+    writes: Dict[int, int] = {}
+    for r in planned:
+        by_window[r["window"]] = by_window.get(r["window"], 0) + r["predicted_calls"]
+        writes[r["window"]] = writes.get(r["window"], 0) + r.get("mutations", 0)
+    finish = now
+    for w, calls in sorted(by_window.items()):
+        start = now if w == 0 else max(finish, reset_at + timedelta(seconds=(w - 1) * WINDOW_SECONDS))
+        # mutations are paced on their own, slower limiter
+        seconds = max(calls / REQUESTS_PER_SECOND, writes[w] / MUTATIONS_PER_SECOND)
+        finish = start + timedelta(seconds=seconds)
+        log.info("  window %d: %5d calls, %3d repos, starts %s, ~%d min",
+                 w, calls, sum(r["window"] == w for r in planned), start.strftime("%H:%M"),
+                 math.ceil(seconds / 60))
+    if by_window:
+        log.info("Estimated finish: %s UTC (%s)", finish.strftime("%Y-%m-%d %H:%M"),
+                 f"{len(by_window)} window(s)" if len(by_window) > 1 else "fits the current window")
+    log.info("Plan written to %s, %s and %s/", PLAN_CSV, PLAN_REPOS_CSV, WINDOWS_DIR)
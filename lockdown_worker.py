@@ -0,0 +1,348 @@
+# lockdown_worker.py
+# Resident worker for archive/lockdown and app-access requests, fed from a
+# durable SQLite queue, so a TeamCity build only enqueues and waits instead of
+# paying checkout + interpreter start + imports + JWT/token minting per request.
+#
+#   python lockdown_worker.py serve                                  # long-running, on one agent
+#   python lockdown_worker.py enqueue archive JHDevOps/repo --wait   # TeamCity step
+#   python lockdown_worker.py enqueue app-add JHDevOps/repo jh-teamcity-githubapp-3 --wait
+#   python lockdown_worker.py enqueue app-remove JHDevOps/repo --wait
+#   python lockdown_worker.py status [job_id]
+#
+# The worker keeps one GitHubClient (pooled keep-alive connections), the token
+# broker cache and the repo -> app index warm for its whole life.
+#
+# Queued jobs for the same repo are coalesced when claimed, but only identical
+# back-to-back requests (same kind and arguments, nothing different queued in
+# between for that repo): they run once and share the result. Anything else
+# runs in the order it was queued.
+# Jobs that were running when the worker died go back to the queue on the next
+# start. Each archive job journals its steps to its own file under
+# data/lockdown_jobs/ (keyed by job id), so a re-queued job resumes, while a new
+# job for the same repo -- e.g. after it was unarchived -- starts from scratch.
+# The file is deleted once the job has finished.
+#
+# Before running a job the worker asks ratelimit_forecast whether its calls
+# still fit the PAT's current window on top of the expected traffic. If not,
+# the job goes back to the queue (keeping its place) and the thread waits for
+# the reset.
+#
+# Env: GITHUB_PAT, LOCKDOWN_QUEUE_DB, LOCKDOWN_JOB_JOURNALS, LOCKDOWN_WORKERS,
+# LOCKDOWN_ARCHIVE_CALLS, appid1..8 / rsakey1..8.
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import pathlib
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import ratelimit_telemetry
+from githubapp_index import load_index
+from githubapp_reconcile import APPS, add_repo, remove_repo, repo_id_with_pat
+from ratelimit_forecast import Forecaster
+from repo_lockdown import GitHubClient, StepJournal, MAX_WORKERS, lockdown_repo
+
+ratelimit_telemetry.install()
+
+QUEUE_DB = pathlib.Path(os.getenv("LOCKDOWN_QUEUE_DB", "./data/lockdown_queue.sqlite"))
+JOB_JOURNALS = pathlib.Path(os.getenv("LOCKDOWN_JOB_JOURNALS", "./data/lockdown_jobs"))
+GITHUB_PAT = os.getenv("GITHUB_PAT", "")
+POLL_SECONDS = float(os.getenv("LOCKDOWN_POLL_SECONDS", "1"))
+INDEX_REFRESH_SECONDS = int(os.getenv("APP_INDEX_REFRESH_SECONDS", "900"))
+WAIT_TIMEOUT = int(os.getenv("LOCKDOWN_WAIT_TIMEOUT", "3600"))
+
+KINDS = ("archive", "app-add", "app-remove")
+# REST calls a job is expected to make on the PAT; an archive with many
+# collaborators/teams makes more, the forecast margin covers the usual spread
+JOB_CALLS = {"archive": int(os.getenv("LOCKDOWN_ARCHIVE_CALLS", "12")), "app-add": 2, "app-remove": 2}
+FINAL = ("done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind           TEXT    NOT NULL,
+    repo           TEXT    NOT NULL,   -- owner/repo, lower-cased
+    args           TEXT    NOT NULL DEFAULT '{}',
+    status         TEXT    NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    coalesced_into INTEGER,
+    result         TEXT,
+    enqueued_at    TEXT    NOT NULL,
+    started_at     TEXT,
+    finished_at    TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_by_repo ON jobs (repo, status);
+"""
+
+log = logging.getLogger("lockdown-worker")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobQueue:
+    def __init__(self, path: pathlib.Path = QUEUE_DB):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; isolation_level=None so BEGIN IMMEDIATE is explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, repo: str, args: Optional[Dict] = None) -> int:
+        cur = self._conn().execute(
+            "INSERT INTO jobs (kind, repo, args, enqueued_at) VALUES (?, ?, ?, ?)",
+            (kind, repo.lower(), json.dumps(args or {}), _now()))
+        return cur.lastrowid
+
+    def requeue_running(self) -> int:
+        return self._conn().execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """
+        Take the oldest queued job whose repo is not already being worked on,
+        and fold into it the queued jobs for that repo that directly follow it
+        with the same kind and args. A different request stops the run, so no
+        job is reported done on the strength of one it was queued against.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            head = conn.execute("""
+                SELECT * FROM jobs q WHERE status = 'queued'
+                  AND NOT EXISTS (SELECT 1 FROM jobs r WHERE r.repo = q.repo AND r.status = 'running')
+                ORDER BY id LIMIT 1
+            """).fetchone()
+            if head is None:
+                conn.execute("COMMIT")
+                return None
+            leader, others = head, []
+            for j in conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND repo = ? AND id > ? ORDER BY id",
+                    (head["repo"], head["id"])):
+                if j["kind"] != head["kind"] or json.loads(j["args"] or "{}") != json.loads(head["args"] or "{}"):
+                    break
+                others.append(j["id"])
+            now = _now()
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (now, leader["id"]))
+            conn.executemany("UPDATE jobs SET status = 'running', started_at = ?, coalesced_into = ? WHERE id = ?",
+                             [(now, leader["id"], i) for i in others])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if others:
+            log.info("Job %d: coalesced %d queued request(s) for %s", leader["id"], len(others), leader["repo"])
+        return leader
+
+    def release(self, job_id: int):
+        """Put a claimed job, and the ones coalesced into it, back in the queue."""
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, coalesced_into = NULL "
+            "WHERE id = ? OR coalesced_into = ?", (job_id, job_id))
+
+    def finish(self, job_id: int, status: str, result: Dict):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ? OR coalesced_into = ?",
+            (status, json.dumps(result, default=str), _now(), job_id, job_id))
+
+    def get(self, job_id: int) -> Optional[sqlite3.Row]:
+        return self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class Worker:
+    def __init__(self, queue: JobQueue, workers: int = MAX_WORKERS):
+        if not GITHUB_PAT:
+            raise SystemExit("Set GITHUB_PAT (org admin PAT) for the worker.")
+        self.queue = queue
+        self.workers = workers
+        self.gh = GitHubClient(GITHUB_PAT, pool_size=workers)
+        self.index = None
+        self.index_at = 0.0
+        self.index_lock = threading.Lock()
+        self.stop = threading.Event()
+        # a PAT has no per-installation history, so only the live pace is used
+        self.forecaster = Forecaster()
+
+    def app_index(self):
+        """
+        The one index object of this worker, refreshed in place. Callers read
+        and mutate it only while holding index_lock.
+        """
+        with self.index_lock:
+            if self.index is None:
+                self.index = load_index(APPS)
+                self.index_at = time.monotonic()
+            elif time.monotonic() - self.index_at > INDEX_REFRESH_SECONDS:
+                self.index.refresh(APPS)   # incremental
+                self.index.save()
+                self.index_at = time.monotonic()
+            return self.index
+
+    def defer_for(self, job) -> float:
+        """Seconds to wait before running `job` (0 if its calls fit the current window)."""
+        try:
+            reading = self.gh.rate_limit()
+        except Exception as e:
+            log.warning("Job %d: could not read /rate_limit (%s); running it unchecked", job["id"], e)
+            return 0.0
+        if reading is None or not self.forecaster.should_defer(None, reading, JOB_CALLS[job["kind"]]):
+            return 0.0
+        return max(int(reading["reset"]) - time.time(), 0.0) + POLL_SECONDS
+
+    def run_job(self, job) -> Dict:
+        owner, repo = job["repo"].split("/", 1)
+        args = json.loads(job["args"] or "{}")
+        if job["kind"] == "archive":
+            journal = StepJournal(JOB_JOURNALS / f"{job['id']}.jsonl")
+            row = lockdown_repo(self.gh, owner, owner, repo, journal)
+            # only a job cut off by a worker restart comes back to this file
+            journal.discard()
+            if row["status"] != "ok":
+                raise RuntimeError(json.dumps(row))
+            return row
+
+        index = self.app_index()
+        repo_id = int(repo_id_with_pat(job["repo"]))
+        with self.index_lock:
+            found = index.lookup(repo_id)
+        if job["kind"] == "app-remove":
+            if not found:
+                return {"repo": job["repo"], "status": "skipped", "detail": "not in any configured app"}
+            remove_repo(found[1], repo_id)
+            with self.index_lock:
+                index.record_remove(repo_id, found[0], found[1])
+                index.save()
+            return {"repo": job["repo"], "status": "removed", "app": found[0], "installation": found[1]}
+
+        slug = args.get("app")
+        if found:
+            if found[0] == slug:
+                return {"repo": job["repo"], "status": "skipped", "detail": f"already in {slug}"}
+            raise RuntimeError(f"{job['repo']} is already in {found[0]}; remove it first")
+        with self.index_lock:
+            inst_id = index.installation_for_owner(slug, owner)
+        if not inst_id:
+            raise RuntimeError(f"{slug} is not installed on '{owner}'")
+        add_repo(inst_id, repo_id)
+        with self.index_lock:
+            index.record_add(repo_id, job["repo"], slug, inst_id)
+            index.save()
+        return {"repo": job["repo"], "status": "added", "app": slug, "installation": inst_id}
+
+    def loop(self):
+        while not self.stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.stop.wait(POLL_SECONDS)
+                continue
+            delay = self.defer_for(job)
+            if delay:
+                self.queue.release(job["id"])
+                log.info("Job %d: deferred %ds, the rate-limit forecast leaves no room for it before the reset",
+                         job["id"], delay)
+                self.stop.wait(delay)
+                continue
+            log.info("Job %d: %s %s", job["id"], job["kind"], job["repo"])
+            try:
+                result = self.run_job(job)
+                self.queue.finish(job["id"], "done", result)
+                log.info("Job %d: done", job["id"])
+            except Exception as e:
+                self.queue.finish(job["id"], "failed", {"error": str(e)[:1000]})
+                log.error("Job %d: failed: %s", job["id"], e)
+
+    def serve(self):
+        requeued = self.queue.requeue_running()
+        if requeued:
+            log.info("Re-queued %d job(s) left running by a previous worker.", requeued)
+        log.info("Worker started: %d threads, queue %s", self.workers, self.queue.path)
+        threads = [threading.Thread(target=self.loop, name=f"lockdown-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for t in threads:
+            t.start()
+        try:
+            while any(t.is_alive() for t in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            log.info("Stopping after the jobs in progress…")
+            self.stop.set()
+            for t in threads:
+                t.join()
+
+
+def wait_for(queue: JobQueue, job_id: int, timeout: int = WAIT_TIMEOUT) -> sqlite3.Row:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.get(job_id)
+        if job is None:
+            raise SystemExit(f"No job {job_id}.")
+        if job["status"] in FINAL:
+            return job
+        if time.monotonic() > deadline:
+            raise SystemExit(f"Job {job_id} still {job['status']} after {timeout}s.")
+        time.sleep(2)
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s",
+                        datefmt="%H:%M:%S")
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve")
+    s.add_argument("--workers", type=int, default=MAX_WORKERS)
+    e = sub.add_parser("enqueue")
+    e.add_argument("kind", choices=KINDS)
+    e.add_argument("repo", help="owner/repo")
+    e.add_argument("app", nargs="?", help="app slug (app-add only)")
+    e.add_argument("--wait", action="store_true", help="block until the job finishes; exit 1 if it failed")
+    st = sub.add_parser("status")
+    st.add_argument("job_id", nargs="?", type=int)
+    a = p.parse_args(argv)
+
+    queue = JobQueue()
+    if a.cmd == "serve":
+        Worker(queue, a.workers).serve()
+    elif a.cmd == "enqueue":
+        if "/" not in a.repo:
+            raise SystemExit("repo must be owner/repo")
+        if a.kind == "app-add" and a.app not in APPS:
+            raise SystemExit(f"app-add needs one of: {', '.join(APPS)}")
+        job_id = queue.enqueue(a.kind, a.repo, {"app": a.app} if a.kind == "app-add" else {})
+        log.info("Enqueued job %d: %s %s", job_id, a.kind, a.repo)
+        if a.wait:
+            job = wait_for(queue, job_id)
+            log.info("Job %d %s: %s", job_id, job["status"], job["result"])
+            if job["status"] != "done":
+                sys.exit(1)
+    else:
+        if a.job_id:
+            job = queue.get(a.job_id)
+            log.info(dict(job) if job else f"No job {a.job_id}.")
+        else:
+            log.info("Queue: %s", queue.counts())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ import datetime
 import pandas as pd
 from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # Load environment variables
 load_dotenv()
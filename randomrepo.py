@@ -1,6 +1,9 @@
 import requests
 import random
 import pandas as pd
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # Replace this with your actual GitHub PAT
 GITHUB_TOKEN = "your_personal_access_token_here"
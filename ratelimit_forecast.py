@@ -0,0 +1,180 @@
+# ratelimit_forecast.py
+# Predict when an installation (or a PAT) will run out of its core rate limit
+# inside the current reset window, so heavy jobs can be deferred before the
+# 403s start instead of after.
+#
+# History: calls per UTC hour per installation from the aggregates DB
+# (githubappload4.py), falling back to the hourly /rate_limit samples
+# (githubappload2.py). The fitted rate for an hour of day is the p75 of the
+# calls seen in that hour over the last LOOKBACK_DAYS.
+#
+# Live reading: used/limit/reset from /rate_limit (or from response headers).
+# The rate used for the forecast is the larger of the historical rate for the
+# current hour and the rate observed so far in this window.
+#
+#   fc = Forecaster.fit_default()
+#   f = fc.forecast(installation_id, used=3200, limit=5000, reset=1718375400)
+#   if fc.should_defer(installation_id, reading, planned_calls=1500): ...
+#
+# Run standalone with a token to print the forecast for a PAT:
+#   GITHUB_TOKEN=... python ratelimit_forecast.py
+
+import os
+import pathlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+import pandas as pd
+import requests
+
+from usage_aggregate_db import UsageAggregateDB
+from usage_sample_store import SampleStore
+
+AGG_DB = pathlib.Path(os.getenv("AGG_DB", "./data/api_usage_aggregates.sqlite"))
+LOOKBACK_DAYS = int(os.getenv("FORECAST_LOOKBACK_DAYS", "28"))
+WINDOW_SECONDS = 3600      # core limit resets hourly
+SAFETY_MARGIN = float(os.getenv("FORECAST_SAFETY_MARGIN", "0.05"))  # keep 5% of the limit spare
+
+log = logging.getLogger("ratelimit-forecast")
+
+
+@dataclass
+class Forecast:
+    used: int
+    limit: int
+    reset: int                  # epoch seconds
+    rate_per_min: float         # calls/minute assumed for the rest of the window
+    projected_used: float       # used + expected calls until reset
+    exhausts_at: Optional[datetime]
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    @property
+    def will_exhaust(self) -> bool:
+        return self.exhausts_at is not None
+
+
+class Forecaster:
+    def __init__(self, hourly_rates: Optional[pd.DataFrame] = None):
+        # hourly_rates: installation_id, hour_of_day, calls_per_hour
+        self.rates: Dict[tuple, float] = {}
+        if hourly_rates is not None:
+            for r in hourly_rates.itertuples():
+                self.rates[(int(r.installation_id), int(r.hour_of_day))] = float(r.calls_per_hour)
+
+    # ------- fitting -------
+    @staticmethod
+    def _fit(hourly: pd.DataFrame) -> pd.DataFrame:
+        """hourly: installation_id, hour (datetime), calls -> p75 calls per hour of day."""
+        if hourly.empty:
+            return pd.DataFrame(columns=["installation_id", "hour_of_day", "calls_per_hour"])
+        hourly = hourly.assign(hour_of_day=hourly["hour"].dt.hour)
+        return (hourly.groupby(["installation_id", "hour_of_day"])["calls"]
+                .quantile(0.75).rename("calls_per_hour").reset_index())
+
+    @classmethod
+    def fit_from_db(cls, db: UsageAggregateDB, now: Optional[datetime] = None) -> "Forecaster":
+        now = now or datetime.now(timezone.utc)
+        df = db.hourly_series(now - timedelta(days=LOOKBACK_DAYS), now + timedelta(hours=1))
+        df["hour"] = pd.to_datetime(df["hour"], format="%Y-%m-%dT%H", utc=True)
+        return cls(cls._fit(df))
+
+    @classmethod
+    def fit_from_samples(cls, store: SampleStore, now: Optional[datetime] = None) -> "Forecaster":
+        # each hourly sample's core_used ~ calls made so far in that hour's window
+        now = now or datetime.now(timezone.utc)
+        df = store.query(start=now - timedelta(days=LOOKBACK_DAYS))
+        df = df.dropna(subset=["timestamp", "core_used"])
+        if df.empty:
+            return cls()
+        df = pd.DataFrame({
+            "installation_id": df["installation_id"].astype("int64"),
+            "hour": df["timestamp"].dt.floor("h"),
+            "calls": pd.to_numeric(df["core_used"], errors="coerce"),
+        })
+        df = df.groupby(["installation_id", "hour"], as_index=False)["calls"].max()
+        return cls(cls._fit(df))
+
+    @classmethod
+    def fit_default(cls) -> "Forecaster":
+        if AGG_DB.exists():
+            db = UsageAggregateDB(AGG_DB)
+            try:
+                fc = cls.fit_from_db(db)
+            finally:
+                db.close()
+            if fc.rates:
+                return fc
+        return cls.fit_from_samples(SampleStore())
+
+    # ------- forecasting -------
+    def historical_rate(self, installation_id: Optional[int], when: datetime) -> float:
+        """Calls per minute expected at `when` for this installation (0 if unknown)."""
+        if installation_id is None:
+            return 0.0
+        return self.rates.get((int(installation_id), when.hour), 0.0) / 60.0
+
+    def forecast(self, installation_id: Optional[int], used: int, limit: int, reset: int,
+                 now: Optional[datetime] = None) -> Forecast:
+        now = now or datetime.now(timezone.utc)
+        secs_left = max(reset - now.timestamp(), 0.0)
+        elapsed_min = max((WINDOW_SECONDS - secs_left) / 60.0, 1.0)
+        observed = used / elapsed_min
+        rate = max(self.historical_rate(installation_id, now), observed)
+
+        projected = used + rate * secs_left / 60.0
+        exhausts_at = None
+        if rate > 0 and projected >= limit:
+            exhausts_at = now + timedelta(minutes=max(limit - used, 0) / rate)
+        return Forecast(used, limit, reset, rate, projected, exhausts_at)
+
+    def should_defer(self, installation_id: Optional[int], reading: Dict, planned_calls: int = 0,
+                     now: Optional[datetime] = None) -> bool:
+        """
+        True if `planned_calls` on top of the expected traffic would not fit
+        before the window resets. `reading` is a /rate_limit resource dict
+        (used/limit/reset), e.g. resources["core"].
+        """
+        f = self.forecast(installation_id, int(reading["used"]), int(reading["limit"]),
+                          int(reading["reset"]), now)
+        budget = f.limit * (1.0 - SAFETY_MARGIN)
+        return f.projected_used + planned_calls > budget
+
+
+def forecast_token(token: str, forecaster: Optional[Forecaster] = None) -> Forecast:
+    """Forecast for a PAT/installation token from one live /rate_limit call."""
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+    r = requests.get("https://api.github.com/rate_limit", headers=headers, timeout=45)
+    r.raise_for_status()
+    core = r.json()["resources"]["core"]
+    return (forecaster or Forecaster()).forecast(None, core["used"], core["limit"], core["reset"])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    fc = Forecaster.fit_default()
+    token = os.getenv("GITHUB_TOKEN")
+    if token:
+        f = forecast_token(token, fc)
+        reset_at = datetime.fromtimestamp(f.reset, timezone.utc).strftime("%H:%M:%S")
+        log.info(f"used {f.used}/{f.limit}, resets {reset_at} UTC, rate {f.rate_per_min:.1f}/min, "
+                 f"projected {f.projected_used:.0f} at reset")
+        log.info(f"EXHAUSTS at {f.exhausts_at:%H:%M:%S} UTC" if f.will_exhaust else "Will not exhaust this window.")
+        return
+
+    rows = [{"installation_id": i, "hour_of_day": h, "calls_per_hour": round(c)}
+            for (i, h), c in sorted(fc.rates.items())]
+    if not rows:
+        log.info("No usage history yet.")
+        return
+    df = pd.DataFrame(rows).pivot(index="hour_of_day", columns="installation_id", values="calls_per_hour")
+    log.info("p75 calls per hour of day (UTC) per installation:")
+    log.info(df.fillna(0).astype(int).to_string())
+
+
+if __name__ == "__main__":
+    main()
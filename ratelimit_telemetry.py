@@ -0,0 +1,199 @@
+# ratelimit_telemetry.py
+# Passive rate-limit telemetry: every GitHub response already carries
+# X-RateLimit-Limit/Used/Remaining/Reset/Resource, so record those instead of
+# spending extra /rate_limit calls.
+#
+#   import ratelimit_telemetry
+#   ratelimit_telemetry.install()      # once, at the top of a script
+#
+# The shared modules (githubapp_tokens, gh_throttle, team_repo_index,
+# collaborator_crawl, audit_log_store) call install() on import, so anything
+# built on them is covered too; standalone scripts call it themselves.
+#
+# install() wraps requests.Session.send, so plain requests.get/post calls and
+# Session-based clients are both covered. Readings are tagged by
+# "installation:<id>" when the token came from githubapp_tokens.BROKER, or
+# "token:<sha256 prefix>" otherwise (tokens themselves are never stored),
+# buffered in memory and flushed in batches to a SQLite minute rollup:
+#
+#   usage(minute, tag, resource) -> requests, max used, min remaining, limit, reset
+#
+# Disable with GH_TELEMETRY=off. DB path: GH_TELEMETRY_DB.
+
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import pathlib
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+TELEMETRY_DB = pathlib.Path(os.getenv("GH_TELEMETRY_DB", "./data/ratelimit_telemetry.sqlite"))
+ENABLED = os.getenv("GH_TELEMETRY", "on").lower() not in ("off", "0", "false")
+FLUSH_EVERY = int(os.getenv("GH_TELEMETRY_FLUSH_EVERY", "200"))        # readings
+FLUSH_INTERVAL = float(os.getenv("GH_TELEMETRY_FLUSH_SECONDS", "30"))  # seconds
+
+log = logging.getLogger("ratelimit-telemetry")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    minute        TEXT    NOT NULL,   -- 2025-06-14T13:05 (UTC)
+    tag           TEXT    NOT NULL,
+    resource      TEXT    NOT NULL,
+    requests      INTEGER NOT NULL,
+    max_used      INTEGER,
+    min_remaining INTEGER,
+    rate_limit    INTEGER,
+    reset         INTEGER,
+    PRIMARY KEY (minute, tag, resource)
+);
+CREATE INDEX IF NOT EXISTS usage_by_tag ON usage (tag, minute);
+"""
+
+_lock = threading.Lock()
+_buffer: List[Tuple] = []
+_last_flush = time.monotonic()
+_installed = False
+_tag_cache: Dict[str, str] = {}
+
+
+def _token_tag(auth_header: Optional[str]) -> str:
+    if not auth_header:
+        return "anonymous"
+    token = auth_header.split(" ", 1)[-1].strip()
+    tag = _tag_cache.get(token)
+    if tag:
+        return tag
+    try:
+        from githubapp_tokens import BROKER
+        inst = BROKER.installation_for_token(token)
+    except Exception:
+        inst = None
+    if inst is not None:
+        tag = f"installation:{inst}"
+    else:
+        tag = "token:" + hashlib.sha256(token.encode()).hexdigest()[:12]
+    _tag_cache[token] = tag
+    return tag
+
+
+def harvest(resp: requests.Response):
+    """Record the X-RateLimit-* headers of one response (no-op if absent)."""
+    h = resp.headers
+    if "X-RateLimit-Remaining" not in h:
+        return
+    try:
+        reading = (
+            datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M"),
+            _token_tag(resp.request.headers.get("Authorization") if resp.request is not None else None),
+            h.get("X-RateLimit-Resource", "core"),
+            int(h.get("X-RateLimit-Used", 0)),
+            int(h["X-RateLimit-Remaining"]),
+            int(h.get("X-RateLimit-Limit", 0)),
+            int(h.get("X-RateLimit-Reset", 0)),
+        )
+    except (TypeError, ValueError):
+        return
+    with _lock:
+        _buffer.append(reading)
+        due = len(_buffer) >= FLUSH_EVERY or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def _connect() -> sqlite3.Connection:
+    TELEMETRY_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(TELEMETRY_DB, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def flush():
+    """Write buffered readings as one transaction of minute-rollup upserts."""
+    global _last_flush
+    with _lock:
+        batch = list(_buffer)
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not batch:
+        return
+
+    rollup: Dict[Tuple[str, str, str], List] = {}
+    for minute, tag, resource, used, remaining, limit, reset in batch:
+        r = rollup.get((minute, tag, resource))
+        if r is None:
+            rollup[(minute, tag, resource)] = [1, used, remaining, limit, reset]
+        else:
+            r[0] += 1
+            r[1] = max(r[1], used)
+            r[2] = min(r[2], remaining)
+            r[3], r[4] = limit, reset
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany("""
+                INSERT INTO usage (minute, tag, resource, requests, max_used, min_remaining, rate_limit, reset)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (minute, tag, resource) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    max_used = MAX(max_used, excluded.max_used),
+                    min_remaining = MIN(min_remaining, excluded.min_remaining),
+                    rate_limit = excluded.rate_limit,
+                    reset = excluded.reset
+            """, [(m, t, res, *vals) for (m, t, res), vals in rollup.items()])
+        conn.close()
+    except Exception as e:
+        # telemetry must never break the script it rides along with
+        log.debug("Telemetry flush failed: %s", e)
+
+
+def install():
+    """Hook every requests Session in this process. Safe to call more than once."""
+    global _installed
+    if _installed or not ENABLED:
+        return
+    original_send = requests.Session.send
+
+    def send(self, request, **kwargs):
+        resp = original_send(self, request, **kwargs)
+        try:
+            harvest(resp)
+        except Exception as e:
+            log.debug("Telemetry harvest failed: %s", e)
+        return resp
+
+    requests.Session.send = send
+    atexit.register(flush)
+    _installed = True
+
+
+def query(tag: Optional[str] = None, resource: str = "core", since: Optional[datetime] = None):
+    """Minute rows (pandas DataFrame) for one tag or all tags since `since` (default: 24h)."""
+    import pandas as pd
+    since = since or datetime.now(timezone.utc) - timedelta(hours=24)
+    sql = "SELECT * FROM usage WHERE resource = ? AND minute >= ?"
+    params = [resource, since.strftime("%Y-%m-%dT%H:%M")]
+    if tag:
+        sql += " AND tag = ?"
+        params.append(tag)
+    conn = _connect()
+    try:
+        return pd.read_sql_query(sql + " ORDER BY tag, minute", conn, params=params)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    df = query()
+    if df.empty:
+        log.info("No telemetry in the last 24h.")
+    else:
+        summary = df.groupby("tag").agg(requests=("requests", "sum"), peak_used=("max_used", "max"),
+                                        low_remaining=("min_remaining", "min"), last_minute=("minute", "max"))
+        log.info(summary.to_string())
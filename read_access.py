@@ -3,6 +3,8 @@ import time
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from team_repo_index import INDEX_FILE as TEAM_INDEX_FILE, PERMISSION_TO_ROLE, TeamRepoIndex
+
 DEFAULT_ORG = "JHDevOps"
 DEFAULT_PERMISSION = "pull"
 DEFAULT_WORKERS = 8
@@ -85,6 +87,10 @@ def main():
     print("dry_run:", dry_run)
     print("-" * 60)
 
+    # every repo gets its PUT (it is idempotent, and the index can be stale);
+    # an existing team index is only kept in step with the grants made here
+    team_index = TeamRepoIndex.load(org, TEAM_INDEX_FILE) if TEAM_INDEX_FILE.exists() else None
+
     results = []
 
     if dry_run:
@@ -104,6 +110,10 @@ def main():
         print(repo, "->", msg)
         if ok:
             ok_count += 1
+            if team_index:
+                team_index.record_grant(team_slug, repo, PERMISSION_TO_ROLE.get(permission, permission))
+    if team_index:
+        team_index.save()
 
     print("-" * 60)
     print("completed:", ok_count, "/", len(repos))
@@ -1,6 +1,9 @@
 import requests
 import openpyxl
 import time
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 
 GITHUB_TOKEN = "ghp_your_personal_access_token_here"  # replace with your PAT
@@ -20,40 +23,50 @@ def read_repo_names(file_path):
     ws = wb.active
     return [cell.value for cell in ws[2] if cell.value]
 
+def list_all(url, params=None):
+    """GET every page of a list endpoint; None if the first page fails."""
+    items = []
+    params = dict(params or {}, per_page=100)
+    while url:
+        resp = requests.get(url, headers=headers, params=params)
+        if resp.status_code != 200:
+            print(f"Failed to list {url}: {resp.text}")
+            return items or None
+        items.extend(resp.json())
+        url = resp.links.get("next", {}).get("url")
+        params = None  # the next link already carries them
+    return items
+
 def remove_individual_collaborators(repo):
     url = f"https://api.github.com/repos/{ORG_NAME}/{repo}/collaborators"
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        print(f"Failed to list collaborators for {repo}: {resp.text}")
+    collabs = list_all(url, {"affiliation": "direct"})
+    if collabs is None:
         return
 
-    for collab in resp.json():
+    for collab in collabs:
         username = collab["login"]
         del_url = f"https://api.github.com/repos/{ORG_NAME}/{repo}/collaborators/{username}"
         del_resp = requests.delete(del_url, headers=headers)
         if del_resp.status_code in [204, 404]:
-            print(f"Removed individual: {username} from {repo}")
+            print(f"Removed individual: {username} ({collab.get('role_name', 'unknown')}) from {repo}")
         else:
             print(f"Failed to remove {username} from {repo}: {del_resp.text}")
 
 def remove_teams(repo):
-    url = f"https://api.github.com/orgs/{ORG_NAME}/teams"
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        print(f"Failed to list teams: {resp.text}")
+    # only the teams that actually have this repo, instead of probing every org team
+    url = f"https://api.github.com/repos/{ORG_NAME}/{repo}/teams"
+    teams = list_all(url)
+    if teams is None:
         return
 
-    for team in resp.json():
+    for team in teams:
         team_slug = team["slug"]
-        check_url = f"https://api.github.com/orgs/{ORG_NAME}/teams/{team_slug}/repos/{ORG_NAME}/{repo}"
-        check_resp = requests.get(check_url, headers=headers)
-        if check_resp.status_code == 204:
-            del_url = f"https://api.github.com/orgs/{ORG_NAME}/teams/{team_slug}/repos/{ORG_NAME}/{repo}"
-            del_resp = requests.delete(del_url, headers=headers)
-            if del_resp.status_code == 204:
-                print(f"Removed team: {team_slug} from {repo}")
-            else:
-                print(f"Failed to remove team {team_slug} from {repo}: {del_resp.text}")
+        del_url = f"https://api.github.com/orgs/{ORG_NAME}/teams/{team_slug}/repos/{ORG_NAME}/{repo}"
+        del_resp = requests.delete(del_url, headers=headers)
+        if del_resp.status_code == 204:
+            print(f"Removed team: {team_slug} from {repo}")
+        else:
+            print(f"Failed to remove team {team_slug} from {repo}: {del_resp.text}")
 
 def archive_repo(repo):
     url = f"https://api.github.com/repos/{ORG_NAME}/{repo}"
@@ -1,6 +1,9 @@
 import requests
 import openpyxl
 from openpyxl.utils import get_column_letter
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # === CONFIG ===
 GITHUB_TOKEN = "your_token_here"
@@ -0,0 +1,580 @@
+# repo_lockdown.py
+# Shared lockdown/archive engine for teamcity-github-archive.py and
+# archivingrepos.py.
+#
+# Per repo, in this order:
+#   1. make private (public/internal -> private)
+#   2. remove direct/outside collaborators
+#   3. remove team access
+#   4. revoke pending invitations
+#   5. archive  (last: skipped if any earlier step failed, so a rerun can finish the job)
+#
+# Requests per repo: one GET for the repo, one listing per access type (per
+# 100 entries) whose role data is reused for logging, the DELETEs that are
+# actually needed, and the two PATCHes.
+#
+# Every finished (repo, step) is appended to a fsync'd journal
+# (data/lockdown_journal.jsonl); rerunning with the same journal skips what is
+# already done, so an interrupted or partly failed bulk run picks up where it
+# stopped. A run in which every repo finished cleanly deletes the journal, so
+# the next run (a re-lockdown after an unarchive, say) starts from scratch.
+# Pass journal_file=None to force a full pass regardless.
+#
+# Repos are processed concurrently on a bounded pool; every request from every
+# worker draws on one shared RateLimiter, and every mutation (PATCH/DELETE) also
+# on a second one paced at about one per second, as GitHub asks of writes.
+# 429s and secondary-limit 403s are retried after Retry-After, or the primary
+# reset, or else an exponential backoff starting at a minute. run() returns one
+# result row per repo and writes them to a CSV.
+#
+#   gh = GitHubClient(token, dry_run=False)
+#   results = run(gh, ORG, ["repo-a", "repo-b"], workers=8)
+
+import os
+import csv
+import json
+import time
+import pathlib
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gh_throttle import RateLimiter
+
+API_URL = "https://api.github.com"
+MAX_RETRIES = int(os.getenv("LOCKDOWN_MAX_RETRIES", "5"))
+MAX_WORKERS = int(os.getenv("LOCKDOWN_WORKERS", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("LOCKDOWN_REQUESTS_PER_SECOND", "10"))
+# writes separately: GitHub's secondary limits want about one per second
+MUTATIONS_PER_SECOND = float(os.getenv("LOCKDOWN_MUTATIONS_PER_SECOND", "1"))
+MUTATING = ("POST", "PATCH", "PUT", "DELETE")
+RESULTS_CSV = pathlib.Path(os.getenv("LOCKDOWN_RESULTS_CSV", "./data/lockdown_results.csv"))
+
+JOURNAL_FILE = pathlib.Path(os.getenv("LOCKDOWN_JOURNAL", "./data/lockdown_journal.jsonl"))
+
+STEPS = ["made_private", "collab_removed", "teams_removed", "inv_revoked", "archived"]
+RESULT_COLUMNS = ["repo", "status", "made_private", "collab_removed", "teams_removed",
+                  "inv_revoked", "archived", "failed_steps", "detail"]
+
+
+class RepoLog(logging.LoggerAdapter):
+    """Prefix every line with the repo, so interleaved worker output stays readable."""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['repo']}] {msg}", kwargs
+
+
+def repo_log(owner, repo):
+    return RepoLog(logging.getLogger("repo-lockdown"), {"repo": f"{owner}/{repo}"})
+
+
+class GitHubClient:
+    def __init__(self, token, api_url=API_URL, dry_run=False, limiter: Optional[RateLimiter] = None,
+                 pool_size=MAX_WORKERS, mutation_limiter: Optional[RateLimiter] = None):
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+            "User-Agent": "repo-lockdown-script/SpyderFix"
+        })
+        # one keep-alive connection per worker instead of urllib3's default 10
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount("https://", adapter)
+        self.api_url = api_url.rstrip("/")
+        self.dry_run = dry_run
+        self.limiter = limiter or RateLimiter(per_second=REQUESTS_PER_SECOND)
+        self.mutation_limiter = mutation_limiter or RateLimiter(per_second=MUTATIONS_PER_SECOND, burst=1)
+
+    def _url(self, path):
+        return f"{self.api_url}{path}"
+
+    @staticmethod
+    def _rate_limited(r) -> bool:
+        if r.status_code == 429:
+            return True
+        if r.status_code != 403:
+            return False
+        return (bool(r.headers.get("Retry-After")) or r.headers.get("X-RateLimit-Remaining") == "0"
+                or "rate limit" in (r.text or "").lower())
+
+    @staticmethod
+    def _backoff(r, attempt) -> float:
+        """Seconds to wait after a rate-limited response, per GitHub's guidance."""
+        retry_after = r.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        reset = r.headers.get("X-RateLimit-Reset")
+        if r.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+            return max(int(reset) - time.time(), 0) + 1
+        # secondary limit without a hint: at least a minute, doubling each time
+        return min(60 * 2 ** (attempt - 1), 600)
+
+    def _req(self, method, url, **kwargs):
+        # GraphQL POSTs are reads here; only real writes take the mutation pace
+        mutation = method in MUTATING and not url.endswith("/graphql")
+        for attempt in range(1, MAX_RETRIES + 1):
+            if mutation:
+                self.mutation_limiter.wait()
+            self.limiter.wait()
+            r = self.session.request(method, url, timeout=60, **kwargs)
+            if self._rate_limited(r):
+                delay = self._backoff(r, attempt)
+                logging.warning("Rate limited (%s) on %s %s; waiting %ds (attempt %d/%d)",
+                                r.status_code, method, url, delay, attempt, MAX_RETRIES)
+                if attempt < MAX_RETRIES:
+                    time.sleep(delay)
+                continue
+            if r.status_code in (502, 503, 504):
+                logging.warning(
+                    "Transient %s on %s %s (attempt %d/%d)",
+                    r.status_code, method, url, attempt, MAX_RETRIES
+                )
+                if attempt < MAX_RETRIES:
+                    time.sleep(min(2 ** attempt, 10))
+                continue
+            return r
+        return r
+
+    def graphql(self, query, variables=None):
+        """POST a GraphQL query; returns the JSON body (data + errors), or None on HTTP failure."""
+        r = self._req("POST", self._url("/graphql"), json={"query": query, "variables": variables or {}})
+        if r.status_code == 200:
+            return r.json()
+        logging.error("graphql -> %s %s", r.status_code, r.text[:300])
+        return None
+
+    def rate_limit(self):
+        """core resource of /rate_limit (does not count against the limit)."""
+        r = self._req("GET", self._url("/rate_limit"))
+        return r.json()["resources"]["core"] if r.status_code == 200 else None
+
+    # ------- Repo -------
+    def get_repo(self, owner, repo):
+        r = self._req("GET", self._url(f"/repos/{owner}/{repo}"))
+        if r.status_code == 200:
+            return r.json()
+        logging.error("get_repo %s/%s -> %s %s", owner, repo, r.status_code, r.text)
+        return None
+
+    def update_repo(self, owner, repo, payload):
+        if self.dry_run:
+            logging.info("[DRY-RUN] PATCH /repos/%s/%s %s", owner, repo, payload)
+            return True, 200, {}
+        r = self._req("PATCH", self._url(f"/repos/{owner}/{repo}"), json=payload)
+        ok = (r.status_code == 200)
+        if not ok:
+            logging.error("update_repo %s/%s -> %s %s", owner, repo, r.status_code, r.text)
+        return ok, r.status_code, (
+            r.json() if "application/json" in r.headers.get("Content-Type", "") else {}
+        )
+
+    # ------- Collaborators -------
+    def list_collaborators(self, owner, repo, page=1):
+        # affiliation=direct: team/org-base access is handled by the team step;
+        # each entry already carries role_name/permissions, so no per-user lookup
+        r = self._req(
+            "GET",
+            self._url(f"/repos/{owner}/{repo}/collaborators"),
+            params={"per_page": 100, "page": page, "affiliation": "direct"},
+        )
+        if r.status_code == 200:
+            return r.json()
+        logging.error("list_collaborators %s/%s -> %s %s", owner, repo, r.status_code, r.text)
+        return []
+
+    def remove_collaborator(self, owner, repo, username):
+        if self.dry_run:
+            logging.info("[DRY-RUN] DELETE collaborator %s from %s/%s", username, owner, repo)
+            return True
+        r = self._req(
+            "DELETE",
+            self._url(f"/repos/{owner}/{repo}/collaborators/{username}"),
+        )
+        if r.status_code in (204, 404):  # 404 if already gone
+            return True
+        logging.error(
+            "remove_collaborator %s %s/%s -> %s %s",
+            username, owner, repo, r.status_code, r.text,
+        )
+        return False
+
+    # ------- Teams -------
+    def list_repo_teams(self, owner, repo, page=1):
+        r = self._req(
+            "GET",
+            self._url(f"/repos/{owner}/{repo}/teams"),
+            params={"per_page": 100, "page": page},
+        )
+        if r.status_code == 200:
+            return r.json()
+        logging.error("list_repo_teams %s/%s -> %s %s", owner, repo, r.status_code, r.text)
+        return []
+
+    def remove_team_access(self, org, repo_owner, repo, team_slug):
+        if self.dry_run:
+            logging.info("[DRY-RUN] DELETE team %s from %s/%s", team_slug, repo_owner, repo)
+            return True
+        r = self._req(
+            "DELETE",
+            self._url(f"/orgs/{org}/teams/{team_slug}/repos/{repo_owner}/{repo}"),
+        )
+        if r.status_code in (204, 404):
+            return True
+        logging.error(
+            "remove_team_access %s %s/%s -> %s %s",
+            team_slug, repo_owner, repo, r.status_code, r.text,
+        )
+        return False
+
+    # ------- Invitations (pending access) -------
+    def list_repo_invitations(self, owner, repo, page=1):
+        r = self._req(
+            "GET",
+            self._url(f"/repos/{owner}/{repo}/invitations"),
+            params={"per_page": 100, "page": page},
+        )
+        if r.status_code == 200:
+            return r.json()
+        logging.error("list_repo_invitations %s/%s -> %s %s", owner, repo, r.status_code, r.text)
+        return []
+
+    def revoke_invitation(self, owner, repo, invitation_id):
+        if self.dry_run:
+            logging.info("[DRY-RUN] DELETE invitation %s on %s/%s", invitation_id, owner, repo)
+            return True
+        r = self._req(
+            "DELETE",
+            self._url(f"/repos/{owner}/{repo}/invitations/{invitation_id}"),
+        )
+        if r.status_code in (204, 404):
+            return True
+        logging.error(
+            "revoke_invitation %s %s/%s -> %s %s",
+            invitation_id, owner, repo, r.status_code, r.text,
+        )
+        return False
+
+
+def _highest_permission(perms):
+    for p in ("admin", "maintain", "push", "triage", "pull"):
+        if (perms or {}).get(p):
+            return p
+    return None
+
+
+# ------- Steps: each returns (changed_count, failed_count) -------
+def make_private_if_needed(gh, owner, repo, meta, log):
+    visibility = meta.get("visibility")
+    is_private_flag = meta.get("private", False)
+
+    log.info("Current visibility=%s private=%s", visibility, is_private_flag)
+
+    # If visibility is already private, no change needed
+    if visibility == "private":
+        log.info("Already visibility=private.")
+        return 0, 0
+
+    # For public or internal, force to private
+    payload = {"private": True, "visibility": "private"}
+    ok, status, body = gh.update_repo(owner, repo, payload)
+    if ok:
+        log.info("→ Changed visibility to private")
+        return 1, 0
+
+    if status in (403, 422):
+        # org policy can forbid the change; not a reason to hold back the archive
+        msg = body.get("message") if isinstance(body, dict) else str(body)
+        log.warning("Could not change visibility to private: %s", msg)
+        return 0, 0
+
+    return 0, 1
+
+
+def remove_all_collaborators(gh, owner, repo, log):
+    total_removed = failed = 0
+    page = 1
+    seen = set()
+    while True:
+        collabs = gh.list_collaborators(owner, repo, page=page)
+        if not collabs:
+            break
+        for c in collabs:
+            login = c.get("login")
+            if not login or login in seen:
+                continue
+            seen.add(login)
+            perm = c.get("role_name") or _highest_permission(c.get("permissions"))
+            log.info("  collaborator %-25s role=%s", login, perm or "unknown")
+            if gh.remove_collaborator(owner, repo, login):
+                total_removed += 1
+            else:
+                failed += 1
+        if len(collabs) < 100:
+            break
+        page += 1
+    if total_removed > 0:
+        log.info("→ Removed %d collaborators", total_removed)
+    else:
+        log.info("→ No direct/outside collaborators found")
+    return total_removed, failed
+
+
+def remove_all_teams(gh, org, owner, repo, log):
+    total_removed = failed = 0
+    page = 1
+    while True:
+        teams = gh.list_repo_teams(owner, repo, page=page)
+        if not teams:
+            break
+        for t in teams:
+            slug = t.get("slug")
+            perm = t.get("permission") or _highest_permission(t.get("permissions"))
+            log.info("  team %-25s role=%s", slug, perm or "unknown")
+            if not slug:
+                continue
+            if gh.remove_team_access(org, owner, repo, slug):
+                total_removed += 1
+            else:
+                failed += 1
+        if len(teams) < 100:
+            break
+        page += 1
+    if total_removed > 0:
+        log.info("→ Removed %d team mappings", total_removed)
+    else:
+        log.info("→ No team mappings on this repo")
+    return total_removed, failed
+
+
+def revoke_all_invitations(gh, owner, repo, log):
+    total_revoked = failed = 0
+    page = 1
+    while True:
+        invs = gh.list_repo_invitations(owner, repo, page=page)
+        if not invs:
+            break
+        for inv in invs:
+            inv_id = inv.get("id")
+            login = (inv.get("invitee") or {}).get("login")
+            log.info("  pending invite %-25s id=%s", login or "unknown", inv_id)
+            if not inv_id:
+                continue
+            if gh.revoke_invitation(owner, repo, inv_id):
+                total_revoked += 1
+            else:
+                failed += 1
+        if len(invs) < 100:
+            break
+        page += 1
+    if total_revoked > 0:
+        log.info("→ Revoked %d pending invitations", total_revoked)
+    else:
+        log.info("→ No pending invitations")
+    return total_revoked, failed
+
+
+def archive_if_needed(gh, owner, repo, meta, log):
+    if meta.get("archived", False):
+        log.info("Already archived.")
+        return 1, 0
+    ok, _, _ = gh.update_repo(owner, repo, {"archived": True})
+    if ok:
+        log.info("→ Archived")
+        return 1, 0
+    return 0, 1
+
+
+class StepJournal:
+    """
+    Append-only JSON-lines log of finished (repo, step) pairs, fsync'd per
+    line, so a run killed at any point can be resumed without repeating work:
+
+        {"ts": "...", "repo": "JHDevOps/foo", "step": "teams_removed", "outcome": "ok", "changed": 2}
+
+    Only "ok" entries count as done; failed steps are retried on the next run.
+    A torn last line from a crash is ignored. discard() drops the file once the
+    work it covers is finished, so it never outlives the run that wrote it.
+    """
+
+    def __init__(self, path: pathlib.Path = JOURNAL_FILE):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._done: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue
+                    steps = self._done.setdefault(e["repo"].lower(), {})
+                    if e.get("outcome") == "ok":
+                        steps[e["step"]] = int(e.get("changed") or 0)
+                    else:
+                        steps.pop(e["step"], None)
+        torn = False
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as fh:
+                fh.seek(-1, os.SEEK_END)
+                torn = fh.read(1) != b"\n"
+        self._fh = open(self.path, "a", encoding="utf-8")
+        if torn:
+            self._fh.write("\n")  # start after a torn line, not inside it
+
+    def completed(self, repo: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._done.get(repo.lower(), {}))
+
+    def record(self, repo: str, step: str, outcome: str, changed: int = 0):
+        line = json.dumps({"ts": datetime.now(timezone.utc).isoformat(), "repo": repo,
+                           "step": step, "outcome": outcome, "changed": changed})
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            if outcome == "ok":
+                self._done.setdefault(repo.lower(), {})[step] = changed
+
+    def close(self):
+        self._fh.close()
+
+    def discard(self):
+        """Close and delete the journal; the next run starts with nothing done."""
+        with self._lock:
+            self._fh.close()
+            self._done.clear()
+            self.path.unlink(missing_ok=True)
+
+
+def lockdown_repo(gh, org, owner, repo, journal: Optional["StepJournal"] = None) -> Dict:
+    """Run all steps for one repo, in order. Never raises; errors end up in the row."""
+    log = repo_log(owner, repo)
+    full_name = f"{owner}/{repo}"
+    row = {c: 0 for c in RESULT_COLUMNS}
+    row.update(repo=full_name, status="ok", failed_steps="", detail="")
+    failed_steps = []
+
+    # steps a previous (interrupted) run already finished are not repeated
+    done = journal.completed(full_name) if journal else {}
+    for name, changed in done.items():
+        row[name] = changed
+    if done:
+        row["detail"] = f"resumed: {len(done)} step(s) from journal"
+    if len(done) == len(STEPS):
+        log.info("All steps already done (journal); skipping.")
+        return row
+
+    try:
+        meta = None
+        if "made_private" not in done or "archived" not in done:
+            meta = gh.get_repo(owner, repo)
+            if not meta:
+                row.update(status="not_found", detail="get_repo failed")
+                return row
+
+        steps = {
+            "made_private": lambda: make_private_if_needed(gh, owner, repo, meta, log),
+            "collab_removed": lambda: remove_all_collaborators(gh, owner, repo, log),
+            "teams_removed": lambda: remove_all_teams(gh, org, owner, repo, log),
+            "inv_revoked": lambda: revoke_all_invitations(gh, owner, repo, log),
+            # the steps above don't touch `archived`, so the first read is still current
+            "archived": lambda: archive_if_needed(gh, owner, repo, meta, log),
+        }
+        for name in STEPS:
+            if name in done:
+                continue
+            if name == "archived" and failed_steps:
+                log.warning("Not archiving: %s had failures", ", ".join(failed_steps))
+                break
+            changed, failed = steps[name]()
+            row[name] = changed
+            if failed:
+                failed_steps.append(name)
+            if journal:
+                journal.record(full_name, name, "failed" if failed else "ok", changed)
+    except Exception as e:
+        row["detail"] = str(e)[:300]
+        failed_steps.append("exception")
+    if failed_steps:
+        row.update(status="partial", failed_steps=";".join(failed_steps))
+    log.info("Done: %s", row["status"])
+    return row
+
+
+def parse_entries(org, entries: List[str]):
+    """'repo', 'owner/repo' or 'path/repo' -> (owner, repo), de-duplicated, order kept."""
+    seen = set()
+    out = []
+    for entry in entries:
+        repo = entry.strip().rstrip("/").split("/")[-1]  # allow 'repo' or 'path/repo'
+        if repo and repo.lower() not in seen:
+            seen.add(repo.lower())
+            out.append((org, repo))
+    return out
+
+
+def write_results(rows: List[Dict], path: pathlib.Path = RESULTS_CSV):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(gh, org, entries: List[str], workers: int = MAX_WORKERS,
+        results_csv: pathlib.Path = RESULTS_CSV, journal_file: Optional[pathlib.Path] = JOURNAL_FILE) -> List[Dict]:
+    """
+    journal_file=None disables resume; dry runs never use the journal. The
+    journal is deleted when every repo finished cleanly.
+    """
+    targets = parse_entries(org, entries)
+    logging.info("Locking down %d repos with %d workers%s", len(targets), workers,
+                 " (DRY-RUN)" if gh.dry_run else "")
+
+    journal = StepJournal(journal_file) if journal_file and not gh.dry_run else None
+    rows = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = [pool.submit(lockdown_repo, gh, org, owner, repo, journal) for owner, repo in targets]
+        for fut in as_completed(futures):
+            row = fut.result()
+            rows.append(row)
+            logging.info("Progress %d/%d  %-45s %s", len(rows), len(targets), row["repo"], row["status"])
+
+    if journal:
+        if all(r["status"] in ("ok", "not_found") for r in rows):
+            # nothing left to resume; don't let these entries skip a later run
+            journal.discard()
+        else:
+            journal.close()
+            logging.info("Journal kept for a resume: %s", journal.path)
+    rows.sort(key=lambda r: r["repo"].lower())
+    write_results(rows, results_csv)
+
+    logging.info("==== RESULT ====")
+    logging.info("%-45s %-10s %4s %4s %4s %4s %4s", "repo", "status", "priv", "coll", "team", "inv", "arch")
+    for r in rows:
+        logging.info("%-45s %-10s %4d %4d %4d %4d %4d", r["repo"], r["status"], r["made_private"],
+                     r["collab_removed"], r["teams_removed"], r["inv_revoked"], r["archived"])
+
+    logging.info("==== SUMMARY ====")
+    summary = {
+        "processed": sum(r["status"] != "not_found" for r in rows),
+        "made_private": sum(r["made_private"] for r in rows),
+        "archived": sum(r["archived"] for r in rows),
+        "collab_removed": sum(r["collab_removed"] for r in rows),
+        "teams_removed": sum(r["teams_removed"] for r in rows),
+        "inv_revoked": sum(r["inv_revoked"] for r in rows),
+        "errors": sum(r["status"] != "ok" for r in rows),
+    }
+    for k, v in summary.items():
+        logging.info("%s: %d", k, v)
+    logging.info("Per-repo results saved to %s", results_csv)
+    return rows
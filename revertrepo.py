@@ -3,6 +3,9 @@ import shutil
 import subprocess
 import requests
 from datetime import datetime
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # === CONFIGURATION ===
 GITHUB_PAT = ""
@@ -2,6 +2,9 @@ import os
 import time
 import json
 import requests
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # -----------------------------------------
 # CONFIG
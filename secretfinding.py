@@ -1,6 +1,9 @@
 import requests
 import re
 import pandas as pd
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # GitHub organization and personal access token
 ORG_NAME = "JHDevOps"
@@ -1,6 +1,9 @@
 import requests
 import pandas as pd
 import os
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 
 GITHUB_PAT = os.getenv('GITHUB_PAT')   
@@ -1,6 +1,9 @@
 import time
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 ORG = "JHDevOps"
 TOKEN = ""
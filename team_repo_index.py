@@ -0,0 +1,281 @@
+# team_repo_index.py
+# Persistent team <-> repo index for the org, with each team's permission level.
+#
+# Replaces the "for every team, page through its repos" walks in
+# checkaccess.py / checkaccess1.py / remove_access_and_archive.py /
+# read_access.py with one local JSON file:
+#   - build()            : every team's repo list, all teams fetched concurrently
+#                          (page count known up front, so pages go out in parallel)
+#   - refresh()          : one GraphQL call per 100 teams for repo counts; only teams
+#                          whose count changed (or are new) are re-listed
+#                          (a same-count swap or permission change is only picked
+#                          up by record_* from our own scripts or a full build)
+#   - teams_for_repo()   : {team_slug: role} for a repo, no API call
+#   - repos_for_team()   : {repo: role} for a team, no API call
+#   - record_grant / record_revoke after every change we make ourselves
+#
+# Roles are GitHub's role names: read, triage, write, maintain, admin (or a
+# custom repository role name).
+#
+# File: data/team_repo_index.json (env TEAM_INDEX_FILE). In TeamCity, publish it
+# as an artifact and pull it back with an artifact dependency.
+
+import os
+import json
+import math
+import pathlib
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
+
+API_BASE = "https://api.github.com"
+INDEX_FILE = pathlib.Path(os.getenv("TEAM_INDEX_FILE", "./data/team_repo_index.json"))
+MAX_WORKERS = int(os.getenv("TEAM_INDEX_WORKERS", "16"))
+PER_PAGE = 100
+
+# REST permission parameter -> role name used in the index
+PERMISSION_TO_ROLE = {"pull": "read", "triage": "triage", "push": "write", "maintain": "maintain", "admin": "admin"}
+
+TEAM_COUNTS_QUERY = """
+query($org: String!, $cursor: String) {
+  organization(login: $org) {
+    teams(first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes { slug repositories { totalCount } }
+    }
+  }
+}
+"""
+
+log = logging.getLogger("team-repo-index")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def role_of(repo: Dict) -> str:
+    """Role name from a team-repos listing entry (role_name, or the highest permissions flag)."""
+    if repo.get("role_name"):
+        return repo["role_name"]
+    perms = repo.get("permissions") or {}
+    for flag, role in (("admin", "admin"), ("maintain", "maintain"), ("push", "write"),
+                       ("triage", "triage"), ("pull", "read")):
+        if perms.get(flag):
+            return role
+    return "read"
+
+
+def make_session(token: str, pool_size: int = MAX_WORKERS) -> requests.Session:
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    })
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+class TeamRepoIndex:
+    """
+    teams: {"<slug>": {"name", "parent", "repo_count", "refreshed_at", "repos": {"<repo>": "<role>"}}}
+    repos: {"<repo>": {"<slug>": "<role>"}}      (repo names lower-cased, org-local)
+    """
+
+    def __init__(self, org: str, path: pathlib.Path = INDEX_FILE):
+        self.org = org
+        self.path = pathlib.Path(path)
+        self.teams: Dict[str, Dict] = {}
+        self.repos: Dict[str, Dict[str, str]] = {}
+        self.built_at: Optional[str] = None
+        # teams the last build/refresh could not list; their entries are stale
+        self.sweep_failures: List[str] = []
+
+    # ------- persistence -------
+    @classmethod
+    def load(cls, org: str, path: pathlib.Path = INDEX_FILE) -> "TeamRepoIndex":
+        index = cls(org, path)
+        if index.path.exists():
+            try:
+                data = json.loads(index.path.read_text(encoding="utf-8"))
+                if data.get("org", org).lower() == org.lower():
+                    index.teams = data.get("teams", {})
+                    index.repos = data.get("repos", {})
+                    index.built_at = data.get("built_at")
+            except Exception as e:
+                log.warning("Could not read index %s (%s); starting empty.", index.path, e)
+        return index
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        # compact: no indentation, the file is read by code, not people
+        tmp.write_text(json.dumps({
+            "org": self.org,
+            "built_at": self.built_at,
+            "teams": self.teams,
+            "repos": self.repos,
+        }, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.teams
+
+    # ------- queries -------
+    def teams_for_repo(self, repo: str) -> Dict[str, str]:
+        return dict(self.repos.get(repo.split("/")[-1].lower(), {}))
+
+    def repos_for_team(self, slug: str) -> Dict[str, str]:
+        return dict((self.teams.get(slug.lower()) or {}).get("repos", {}))
+
+    # ------- updates -------
+    def record_grant(self, slug: str, repo: str, role: str):
+        slug, repo = slug.lower(), repo.split("/")[-1].lower()
+        team = self.teams.setdefault(slug, {"name": slug, "parent": None, "repo_count": 0,
+                                            "refreshed_at": None, "repos": {}})
+        team["repos"][repo] = role
+        team["repo_count"] = len(team["repos"])
+        self.repos.setdefault(repo, {})[slug] = role
+
+    def record_revoke(self, slug: str, repo: str):
+        slug, repo = slug.lower(), repo.split("/")[-1].lower()
+        team = self.teams.get(slug)
+        if team is not None:
+            team["repos"].pop(repo, None)
+            team["repo_count"] = len(team["repos"])
+        teams = self.repos.get(repo)
+        if teams is not None:
+            teams.pop(slug, None)
+            if not teams:
+                self.repos.pop(repo, None)
+
+    def _replace_team(self, team: Dict, repos: Dict[str, str]):
+        slug = team["slug"].lower()
+        for repo in (self.teams.get(slug) or {}).get("repos", {}):
+            (self.repos.get(repo) or {}).pop(slug, None)
+            if repo in self.repos and not self.repos[repo]:
+                self.repos.pop(repo)
+        self.teams[slug] = {
+            "name": team.get("name") or slug,
+            "parent": (team.get("parent") or {}).get("slug"),
+            "repo_count": len(repos),
+            "refreshed_at": _now(),
+            "repos": repos,
+        }
+        for repo, role in repos.items():
+            self.repos.setdefault(repo, {})[slug] = role
+
+    # ------- fetching -------
+    def _org_teams(self, session) -> List[Dict]:
+        url = f"{API_BASE}/orgs/{self.org}/teams?per_page={PER_PAGE}"
+        teams = []
+        while url:
+            r = session.get(url, timeout=60)
+            r.raise_for_status()
+            teams.extend(r.json())
+            url = r.links.get("next", {}).get("url")
+        return teams
+
+    def _repo_counts(self, session) -> Dict[str, int]:
+        counts, cursor = {}, None
+        while True:
+            r = session.post(f"{API_BASE}/graphql", timeout=60,
+                             json={"query": TEAM_COUNTS_QUERY, "variables": {"org": self.org, "cursor": cursor}})
+            r.raise_for_status()
+            teams = r.json()["data"]["organization"]["teams"]
+            counts.update({t["slug"].lower(): t["repositories"]["totalCount"] for t in teams["nodes"]})
+            if not teams["pageInfo"]["hasNextPage"]:
+                return counts
+            cursor = teams["pageInfo"]["endCursor"]
+
+    def _team_repos_page(self, session, slug: str, page: int) -> List[Dict]:
+        r = session.get(f"{API_BASE}/orgs/{self.org}/teams/{slug}/repos",
+                        params={"per_page": PER_PAGE, "page": page}, timeout=60)
+        r.raise_for_status()
+        return r.json()
+
+    def _sweep(self, session, full: bool) -> int:
+        teams = self._org_teams(session)
+        counts = self._repo_counts(session)
+        live = {t["slug"].lower() for t in teams}
+
+        stale = []
+        for t in teams:
+            slug = t["slug"].lower()
+            known = self.teams.get(slug)
+            if full or known is None or known.get("refreshed_at") is None \
+                    or known.get("repo_count") != counts.get(slug):
+                stale.append(t)
+
+        # every page of every stale team goes into one pool
+        pages = {}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            for t in stale:
+                n = max(math.ceil(counts.get(t["slug"].lower(), 0) / PER_PAGE), 1)
+                for p in range(1, n + 1):
+                    pages[pool.submit(self._team_repos_page, session, t["slug"], p)] = t["slug"].lower()
+            results: Dict[str, List[Dict]] = {t["slug"].lower(): [] for t in stale}
+            failed = set()
+            for fut in as_completed(pages):
+                slug = pages[fut]
+                try:
+                    results[slug].extend(fut.result())
+                except Exception as e:
+                    failed.add(slug)
+                    log.warning("Team %s: listing repos failed: %s", slug, e)
+
+        for t in stale:
+            slug = t["slug"].lower()
+            if slug in failed:
+                continue
+            repos = {r["name"].lower(): role_of(r) for r in results[slug]
+                     if (r.get("owner") or {}).get("login", self.org).lower() == self.org.lower()}
+            self._replace_team(t, repos)
+
+        for slug in [s for s in self.teams if s not in live]:
+            self._replace_team({"slug": slug}, {})
+            self.teams.pop(slug)
+
+        self.built_at = _now()
+        self.sweep_failures = sorted(failed)
+        return len(stale) - len(failed)
+
+    def build(self, session) -> "TeamRepoIndex":
+        relisted = self._sweep(session, full=True)
+        log.info("Team index built: %d teams, %d repos.", relisted, len(self.repos))
+        return self
+
+    def refresh(self, session) -> "TeamRepoIndex":
+        if self.is_empty:
+            return self.build(session)
+        relisted = self._sweep(session, full=False)
+        log.info("Team index refreshed: %d team(s) re-listed, %d repos indexed.", relisted, len(self.repos))
+        return self
+
+
+def load_team_index(token: str, org: str, path: pathlib.Path = INDEX_FILE) -> TeamRepoIndex:
+    """Load the persisted index, bring it up to date and save it back."""
+    index = TeamRepoIndex.load(org, path).refresh(make_session(token))
+    index.save()
+    return index
+
+
+if __name__ == "__main__":
+    # Standalone full rebuild (e.g. nightly): GITHUB_TOKEN / GH_ORG from env.
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    org = os.getenv("GH_ORG", "JHDevOps")
+    idx = TeamRepoIndex(org, INDEX_FILE).build(make_session(os.environ["GITHUB_TOKEN"]))
+    idx.save()
+    log.info("Saved %s", INDEX_FILE)
@@ -0,0 +1,179 @@
+# teamcity_app_preflight.py
+# Preflight for TeamCity builds that push with a GitHub App token (auto-merge).
+#
+# A merge build whose repo is not in the app's installation, or whose
+# installation lacks contents:write, only fails at the very end with
+#   remote: Write access to repository not granted.
+# This checks every such build configuration up front, in one pass:
+#   1. two paged TeamCity REST calls: all build types (params, VCS root
+#      entries, features) and all VCS roots (url, auth method)
+#   2. the repo -> (app, installation) index and the installation permissions
+#      cached in it (githubapp_index, incrementally refreshed), so the GitHub
+#      side costs one total_count call per installation, not one per repo
+#
+# A build config is checked if it sets GHApp.Id or one of its VCS roots uses
+# a GitHub App / refreshable token connection. With PREFLIGHT_ONLY_MERGE=true
+# (default) only configs with an auto-merge feature or "merge" in the name.
+#
+# Output: data/teamcity_app_preflight.csv; exits 1 if anything is not "ok".
+#
+# Env: TC_URL, TC_PAT, appid1..8 / rsakey1..8, NUM_APPS.
+
+import os
+import re
+import csv
+import pathlib
+import logging
+from typing import Dict, List, Optional
+
+import requests
+import urllib3
+
+from githubapp_index import load_index
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+TEAMCITY_URL = os.getenv("TC_URL", "https://teamcity.jhancock.com")
+TEAMCITY_PAT = os.getenv("TC_PAT", "")
+VERIFY_SSL = os.getenv("TC_VERIFY_SSL", "false").lower() == "true"
+PAGE_SIZE = 500
+
+ONLY_MERGE = os.getenv("PREFLIGHT_ONLY_MERGE", "true").lower() == "true"
+MERGE_FEATURE_TYPES = {t.strip() for t in os.getenv("PREFLIGHT_MERGE_FEATURES", "merge,AutoMerge").split(",")}
+APP_ID_PARAM = os.getenv("PREFLIGHT_APP_ID_PARAM", "GHApp.Id")
+# VCS root authMethod values that mean "token from a TeamCity connection"
+APP_AUTH_METHODS = {"ACCESS_TOKEN", "GITHUB_APP"}
+OUT_CSV = pathlib.Path(os.getenv("PREFLIGHT_CSV", "./data/teamcity_app_preflight.csv"))
+
+APPS = {
+    f"jh-teamcity-githubapp-{i}": {"id": os.getenv(f"appid{i}"), "private_key": os.getenv(f"rsakey{i}")}
+    for i in range(1, int(os.getenv("NUM_APPS", "8")) + 1)
+}
+
+GITHUB_REPO_RE = re.compile(r"github\.com[:/]+([^/\s]+)/([^/\s]+?)(?:\.git)?/?$", re.IGNORECASE)
+COLUMNS = ["build_type", "build_name", "project", "vcs_root", "repo",
+           "app_id", "expected_app", "actual_app", "installation", "contents", "status", "detail"]
+
+log = logging.getLogger("tc-app-preflight")
+
+
+def teamcity_headers():
+    if not TEAMCITY_PAT:
+        raise SystemExit("TeamCity PAT missing. Set env TC_PAT.")
+    return {"Accept": "application/json", "Authorization": f"Bearer {TEAMCITY_PAT}"}
+
+
+def tc_get_all(path: str, fields: str, key: str) -> List[Dict]:
+    """Page through a TeamCity collection endpoint with start/count locators."""
+    out = []
+    start = 0
+    while True:
+        url = f"{TEAMCITY_URL}{path}?locator=start:{start},count:{PAGE_SIZE}&fields={key}({fields})"
+        r = requests.get(url, headers=teamcity_headers(), verify=VERIFY_SSL, timeout=120)
+        r.raise_for_status()
+        data = r.json()
+        items = data.get(key) or []
+        out.extend(items)
+        if len(items) < PAGE_SIZE:
+            return out
+        start += PAGE_SIZE
+
+
+def _props(obj: Dict, section: str = "properties") -> Dict[str, str]:
+    return {p.get("name"): p.get("value", "") for p in (obj.get(section) or {}).get("property", [])}
+
+
+def parse_github_repo(url: str) -> Optional[str]:
+    m = GITHUB_REPO_RE.search((url or "").strip())
+    return f"{m.group(1)}/{m.group(2)}" if m else None
+
+
+def load_targets() -> List[Dict]:
+    """One entry per (build type, GitHub VCS root) that pushes with an app token."""
+    roots = {r["id"]: r for r in tc_get_all(
+        "/app/rest/vcs-roots", "id,name,properties(property(name,value))", "vcs-root")}
+    build_types = tc_get_all(
+        "/app/rest/buildTypes",
+        "id,name,projectId,parameters(property(name,value)),"
+        "vcs-root-entries(vcs-root-entry(id)),features(feature(type))",
+        "buildType")
+    log.info("TeamCity: %d build types, %d VCS roots.", len(build_types), len(roots))
+
+    targets = []
+    for bt in build_types:
+        params = _props(bt, "parameters")
+        features = {f.get("type") for f in (bt.get("features") or {}).get("feature", [])}
+        is_merge = bool(features & MERGE_FEATURE_TYPES) or "merge" in (bt.get("name") or "").lower()
+        if ONLY_MERGE and not is_merge:
+            continue
+        app_id = (params.get(APP_ID_PARAM) or "").strip()
+        for entry in (bt.get("vcs-root-entries") or {}).get("vcs-root-entry", []):
+            root = roots.get(entry.get("id"))
+            if root is None:
+                continue
+            props = _props(root)
+            uses_app = bool(app_id) or props.get("authMethod") in APP_AUTH_METHODS or "tokenId" in props
+            repo = parse_github_repo(props.get("url"))
+            if not uses_app or not repo:
+                continue
+            targets.append({"build_type": bt["id"], "build_name": bt.get("name"), "project": bt.get("projectId"),
+                            "vcs_root": root["id"], "repo": repo, "app_id": app_id})
+    return targets
+
+
+def check(targets: List[Dict], index) -> List[Dict]:
+    slug_by_app_id = {str(cfg["id"]): slug for slug, cfg in APPS.items() if cfg.get("id")}
+    by_name = {(e.get("full_name") or "").lower(): e for e in index.repos.values()}
+    rows = []
+    for t in targets:
+        row = dict(t, expected_app=slug_by_app_id.get(t["app_id"], ""), actual_app="",
+                   installation="", contents="", status="ok", detail="")
+        entry = by_name.get(t["repo"].lower())
+        if t["app_id"] and not row["expected_app"]:
+            row.update(status="unknown_app", detail=f"{APP_ID_PARAM}={t['app_id']} is not one of the configured apps")
+        elif entry is None:
+            row.update(status="not_installed", detail="repo is not in any GitHub App installation")
+        else:
+            apps = [(i["app_slug"], int(i["installation_id"])) for i in entry["installations"]]
+            # with the expected app among several, check that one; the extra is still reported
+            slug, inst_id = next((a for a in apps if a[0] == row["expected_app"]), apps[0])
+            row.update(actual_app=";".join(a[0] for a in apps), installation=inst_id)
+            contents = index.installation_permissions(slug, inst_id).get("contents", "")
+            row["contents"] = contents
+            if row["expected_app"] and slug != row["expected_app"]:
+                row.update(status="wrong_app",
+                           detail=f"repo is in {row['actual_app']}, build uses {row['expected_app']}")
+            elif len(apps) > 1:
+                row.update(status="multiple_apps", detail=f"repo is in {len(apps)} apps: {row['actual_app']}")
+            elif contents != "write":
+                row.update(status="no_write", detail=f"installation has contents:{contents or 'none'}")
+        rows.append(row)
+    return rows
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%H:%M:%S")
+    targets = load_targets()
+    log.info("Checking %d build/VCS root pair(s) that push with a GitHub App token.", len(targets))
+    index = load_index(APPS)
+    rows = check(targets, index)
+
+    rows.sort(key=lambda r: (r["status"] == "ok", r["project"] or "", r["build_type"]))
+    OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUT_CSV, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    bad = [r for r in rows if r["status"] != "ok"]
+    for r in bad:
+        log.warning("%-12s %-50s %-40s %s", r["status"], r["build_type"], r["repo"], r["detail"])
+    log.info("%d ok, %d misconfigured (table saved to %s)", len(rows) - len(bad), len(bad), OUT_CSV)
+    if bad:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import pytest
+
+import githubapp_index
+from githubapp_index import AmbiguousInstallation, AppInstallationIndex
+from githubapp_reconcile import plan
+
+
+def _inst(inst_id, account="JHDevOps"):
+    return {"id": inst_id, "account": {"login": account}, "permissions": {"contents": "write"}}
+
+
+def _repo(repo_id, name):
+    return {"id": repo_id, "full_name": f"JHDevOps/{name}"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = AppInstallationIndex(tmp_path / "index.json")
+    idx._replace_installation("b", _inst(20), [_repo(1, "shared"), _repo(2, "only-b")])
+    idx._replace_installation("a", _inst(10), [_repo(1, "shared")])
+    return idx
+
+
+def test_repo_in_two_installations_keeps_both(index):
+    assert sorted(index.installations_of(1)) == [("a", 10), ("b", 20)]
+    assert index.installations["b|20"]["repo_count"] == 2
+    assert index.installations["a|10"]["repo_count"] == 1
+    with pytest.raises(AmbiguousInstallation):
+        index.lookup(1)
+    assert index.lookup(2) == ("b", 20)
+    assert list(index.ambiguous()) == ["1"]
+
+
+def test_relisting_one_installation_leaves_the_other(index):
+    index._replace_installation("a", _inst(10), [])
+    assert index.lookup(1) == ("b", 20)
+    assert index.repos_for_installation("a", 10) == []
+
+
+def test_record_remove_drops_only_that_installation(index):
+    index.record_remove(1, "b", 20)
+    assert index.lookup(1) == ("a", 10)
+    assert index.installations["b|20"]["repo_count"] == 1
+    index.record_remove(1)
+    assert index.lookup(1) is None
+
+
+def test_plan_removes_every_extra_installation(index):
+    steps = plan(index, {"jhdevops/shared": "a", "jhdevops/only-b": "b"})
+    assert [(s["action"], s["app"], s["installation"]) for s in steps] == [("remove", "b", 20)]
+
+
+def test_load_upgrades_single_installation_entries(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_text('{"installations": {}, "repos": {"7": {"full_name": "JHDevOps/x", '
+                    '"app_slug": "a", "installation_id": 10}}}', encoding="utf-8")
+    assert AppInstallationIndex.load(path).lookup(7) == ("a", 10)
+
+
+def test_sweep_fails_for_app_without_usable_credentials(index, monkeypatch):
+    monkeypatch.setattr(githubapp_index, "generate_jwt", lambda app_id, pem: "jwt")
+    monkeypatch.setattr(githubapp_index, "get_installations", lambda jwt: [_inst(20)])
+    monkeypatch.setattr(githubapp_index, "get_installation_token", lambda jwt, inst_id: "token")
+    monkeypatch.setattr(githubapp_index, "list_installation_repos", lambda token: [_repo(2, "only-b")])
+    index.build({"a": {"id": None, "private_key": None}, "b": {"id": "2", "private_key": "pem"}})
+    assert index.sweep_failures == ["app a: id/private key not configured"]
+    # what is known about a is kept, not trusted
+    assert index.installations_of(1) == [("a", 10)]
@@ -0,0 +1,54 @@
+import math
+import warnings
+
+import pandas as pd
+
+from keyed_upsert import upsert
+
+KEYS = ["app_slug", "installation_id"]
+
+
+def test_missing_values_upcast_int_columns():
+    old = pd.DataFrame({"app_slug": ["a", "b"], "installation_id": [1, 2],
+                        "core_used": [10, 20], "graphql_used": [5, 6], "count": [3, 1]})
+    new = pd.DataFrame({"app_slug": ["a", "b"], "installation_id": [1, 2],
+                        "core_used": [12.0, float("nan")], "graphql_used": [7, 8]})
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        out = upsert(old, new, KEYS, update_cols=["core_used", "graphql_used"], count_col="count")
+    assert out["core_used"].iloc[0] == 12.0
+    assert math.isnan(out["core_used"].iloc[1])
+    assert out["graphql_used"].tolist() == [7, 8]
+    assert out["graphql_used"].dtype == "int64"
+    assert out["count"].tolist() == [4, 2]
+
+
+def test_mixed_update_cols_with_missing_number():
+    # strings alongside numbers: the whole update block used to go in as an object array
+    old = pd.DataFrame({"app_slug": ["a", "b", "c"], "installation_id": [1, 2, 3],
+                        "last_timestamp": ["t1", "t2", "t3"], "core_used": [10, 20, 30], "count": [1, 1, 1]})
+    new = pd.DataFrame({"app_slug": ["a", "b"], "installation_id": [1, 2],
+                        "last_timestamp": ["t4", "t5"], "core_used": [12.0, float("nan")]})
+    out = upsert(old, new, KEYS, update_cols=["last_timestamp", "core_used"], count_col="count")
+    assert out["last_timestamp"].tolist() == ["t4", "t5", "t3"]
+    assert out["core_used"].iloc[0] == 12.0
+    assert math.isnan(out["core_used"].iloc[1])
+    assert out["core_used"].iloc[2] == 30
+    assert out["count"].tolist() == [2, 2, 1]
+
+
+def test_inserts_new_keys_and_keeps_order():
+    old = pd.DataFrame({"app_slug": ["a"], "installation_id": [1], "core_used": [1], "count": [1]})
+    new = pd.DataFrame({"app_slug": ["c", "a"], "installation_id": [3, 1], "core_used": [None, 2]})
+    out = upsert(old, new, KEYS, update_cols=["core_used"], count_col="count")
+    assert out["app_slug"].tolist() == ["a", "c"]
+    assert out["core_used"].iloc[0] == 2
+    assert math.isnan(out["core_used"].iloc[1])
+    assert out["count"].tolist() == [2, 1]
+
+
+def test_string_column_receives_missing_value():
+    old = pd.DataFrame({"app_slug": ["a"], "installation_id": [1], "last_timestamp": ["2025-01-01"]})
+    new = pd.DataFrame({"app_slug": ["a"], "installation_id": [1], "last_timestamp": [None]})
+    out = upsert(old, new, KEYS, update_cols=["last_timestamp"])
+    assert pd.isna(out["last_timestamp"].iloc[0])
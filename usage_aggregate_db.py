@@ -0,0 +1,191 @@
+# usage_aggregate_db.py
+# SQLite store for per-installation API usage aggregates (githubappload4.py).
+#
+# Tables
+#   installations : last /rate_limit reading per (app_slug, installation_id)
+#   hourly        : calls per installation per UTC hour  ('2025-06-14T13')
+#   daily         : calls per installation per UTC day   ('2025-06-14')
+#
+# Deltas are reset-window aware: while core.reset is unchanged, calls since the
+# last sample are used - prev_used; once the window has rolled over, the calls
+# made so far in the new window are simply `used`.
+#
+# The .sqlite file replaces api_usage_aggregates.json as the TeamCity artifact;
+# it is updated in place and old rows are removed with indexed DELETEs.
+
+import os
+import json
+import sqlite3
+import pathlib
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+import pandas as pd
+
+HOURLY_RETENTION_DAYS = int(os.getenv("HOURLY_RETENTION_DAYS", "35"))
+DAILY_RETENTION_DAYS = int(os.getenv("DAILY_RETENTION_DAYS", "400"))
+
+log = logging.getLogger("usage-aggregates")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS installations (
+    app_slug            TEXT    NOT NULL,
+    installation_id     INTEGER NOT NULL,
+    last_core_used      INTEGER,
+    last_core_limit     INTEGER,
+    last_core_reset     INTEGER,
+    last_ts             TEXT,
+    last_delta          INTEGER NOT NULL DEFAULT 0,
+    total_calls_alltime INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (app_slug, installation_id)
+);
+CREATE TABLE IF NOT EXISTS hourly (
+    app_slug        TEXT    NOT NULL,
+    installation_id INTEGER NOT NULL,
+    hour            TEXT    NOT NULL,
+    calls           INTEGER NOT NULL,
+    PRIMARY KEY (app_slug, installation_id, hour)
+);
+CREATE TABLE IF NOT EXISTS daily (
+    app_slug        TEXT    NOT NULL,
+    installation_id INTEGER NOT NULL,
+    day             TEXT    NOT NULL,
+    calls           INTEGER NOT NULL,
+    PRIMARY KEY (app_slug, installation_id, day)
+);
+CREATE INDEX IF NOT EXISTS hourly_by_hour ON hourly (hour);
+CREATE INDEX IF NOT EXISTS daily_by_day ON daily (day);
+"""
+
+
+def _as_int(v):
+    try:
+        return int(v)
+    except Exception:
+        return 0
+
+
+class UsageAggregateDB:
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        # fold the WAL back so the single .sqlite file is a complete artifact
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT COUNT(*) FROM installations").fetchone()[0] == 0
+
+    # ------- write -------
+    def record_sample(self, app_slug: str, installation_id: int, core: Dict, ts: datetime) -> int:
+        """Store one /rate_limit `core` reading and return the calls attributed since the last one."""
+        used = _as_int(core.get("used", 0))
+        limit = _as_int(core.get("limit", 0))
+        reset = _as_int(core.get("reset", 0)) or None
+        installation_id = int(installation_id)
+
+        prev = self.conn.execute(
+            "SELECT last_core_used, last_core_reset FROM installations WHERE app_slug=? AND installation_id=?",
+            (app_slug, installation_id)).fetchone()
+        if prev is None or prev[0] is None:
+            delta = used
+        elif reset is not None and prev[1] is not None and reset != prev[1]:
+            delta = used                      # new reset window
+        elif used >= prev[0]:
+            delta = used - prev[0]            # same window
+        else:
+            delta = used                      # counter went down without a known reset
+        delta = max(int(delta), 0)
+
+        hour = ts.strftime("%Y-%m-%dT%H")
+        day = ts.strftime("%Y-%m-%d")
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO installations (app_slug, installation_id, last_core_used, last_core_limit,
+                                           last_core_reset, last_ts, last_delta, total_calls_alltime)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (app_slug, installation_id) DO UPDATE SET
+                    last_core_used = excluded.last_core_used,
+                    last_core_limit = excluded.last_core_limit,
+                    last_core_reset = excluded.last_core_reset,
+                    last_ts = excluded.last_ts,
+                    last_delta = excluded.last_delta,
+                    total_calls_alltime = total_calls_alltime + excluded.last_delta
+            """, (app_slug, installation_id, used, limit, reset, ts.isoformat(), delta, delta))
+            for table, col, key in (("hourly", "hour", hour), ("daily", "day", day)):
+                self.conn.execute(f"""
+                    INSERT INTO {table} (app_slug, installation_id, {col}, calls) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (app_slug, installation_id, {col}) DO UPDATE SET calls = calls + excluded.calls
+                """, (app_slug, installation_id, key, delta))
+        return delta
+
+    def prune(self, now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        hour_cutoff = (now - timedelta(days=HOURLY_RETENTION_DAYS)).strftime("%Y-%m-%dT%H")
+        day_cutoff = (now - timedelta(days=DAILY_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        with self.conn:
+            h = self.conn.execute("DELETE FROM hourly WHERE hour < ?", (hour_cutoff,)).rowcount
+            d = self.conn.execute("DELETE FROM daily WHERE day < ?", (day_cutoff,)).rowcount
+        if h or d:
+            log.info(f"Pruned {h} hourly and {d} daily rows.")
+
+    def import_json(self, aggs: Dict) -> int:
+        """One-off import of the old api_usage_aggregates.json structure."""
+        n = 0
+        with self.conn:
+            for rec in aggs.values():
+                slug, inst = rec["app_slug"], int(rec["installation_id"])
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO installations (app_slug, installation_id, last_core_used,
+                        last_core_limit, last_core_reset, last_ts, last_delta, total_calls_alltime)
+                    VALUES (?, ?, ?, ?, NULL, ?, ?, ?)
+                """, (slug, inst, rec.get("last_core_used"), rec.get("last_core_limit"), rec.get("last_ts"),
+                      _as_int(rec.get("last_hour_count")), _as_int(rec.get("total_calls_alltime"))))
+                for day, calls in (rec.get("daily_counts") or {}).items():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO daily (app_slug, installation_id, day, calls) VALUES (?, ?, ?, ?)",
+                        (slug, inst, day, _as_int(calls)))
+                n += 1
+        return n
+
+    # ------- read -------
+    def summary(self, now: Optional[datetime] = None, days: int = 30) -> pd.DataFrame:
+        """Same columns as the old api_usage_30d_summary.csv."""
+        now = now or datetime.now(timezone.utc)
+        today = now.strftime("%Y-%m-%d")
+        since = (now.date() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        return pd.read_sql_query("""
+            SELECT i.app_slug, i.installation_id, i.last_ts AS last_timestamp,
+                   i.last_delta AS last_hour_count,
+                   COALESCE(SUM(CASE WHEN d.day = ? THEN d.calls END), 0) AS today_total,
+                   COALESCE(SUM(CASE WHEN d.day >= ? THEN d.calls END), 0) AS last_30d_total
+            FROM installations i
+            LEFT JOIN daily d ON d.app_slug = i.app_slug AND d.installation_id = i.installation_id
+                              AND d.day >= ?
+            GROUP BY i.app_slug, i.installation_id
+            ORDER BY i.app_slug, i.installation_id
+        """, self.conn, params=(today, since, since))
+
+    def hourly_series(self, start: datetime, end: Optional[datetime] = None,
+                      installation_id: Optional[int] = None) -> pd.DataFrame:
+        end = end or datetime.now(timezone.utc) + timedelta(hours=1)
+        sql = "SELECT app_slug, installation_id, hour, calls FROM hourly WHERE hour >= ? AND hour < ?"
+        params = [start.strftime("%Y-%m-%dT%H"), end.strftime("%Y-%m-%dT%H")]
+        if installation_id is not None:
+            sql += " AND installation_id = ?"
+            params.append(int(installation_id))
+        return pd.read_sql_query(sql + " ORDER BY hour, app_slug, installation_id", self.conn, params=params)
+
+
+def load_legacy_json(path: pathlib.Path) -> Dict:
+    try:
+        return json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+    except Exception as e:
+        log.warning(f"Failed to read legacy aggregates {path}: {e}")
+        return {}
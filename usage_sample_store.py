@@ -0,0 +1,144 @@
+# usage_sample_store.py
+# Append-only, date-partitioned storage for the hourly /rate_limit samples.
+#
+#   data/api_usage_samples/
+#       day=2025-06-14.csv        <- current days, appended to (never re-read on write)
+#       month=2025-05.csv.gz      <- closed days, compacted once per month
+#
+#   store = SampleStore()
+#   store.append(rows)                           # O(rows), regardless of history size
+#   df = store.query(start, end)                 # reads only partitions overlapping [start, end)
+#   store.compact()                              # fold finished months into one gzip file
+#   store.import_legacy(old_csv)                 # one-off split of api_usage_samples.csv
+
+import os
+import csv
+import pathlib
+import logging
+from datetime import datetime, timezone, date
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+SAMPLES_DIR = pathlib.Path(os.getenv("SAMPLES_DIR", "./data/api_usage_samples"))
+COLUMNS = [
+    "timestamp", "app_slug", "installation_id",
+    "core_limit", "core_used", "core_remaining",
+    "graphql_limit", "graphql_used", "graphql_remaining",
+    "core_reset",
+]
+
+log = logging.getLogger("usage-samples")
+
+
+def _day_of(ts: str) -> str:
+    return ts[:10]
+
+
+class SampleStore:
+    def __init__(self, root: pathlib.Path = SAMPLES_DIR):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _day_path(self, day: str) -> pathlib.Path:
+        return self.root / f"day={day}.csv"
+
+    def _month_path(self, month: str) -> pathlib.Path:
+        return self.root / f"month={month}.csv.gz"
+
+    # ------- write -------
+    def append(self, rows: Iterable[Dict]) -> int:
+        by_day: Dict[str, List[Dict]] = {}
+        for r in rows:
+            by_day.setdefault(_day_of(str(r["timestamp"])), []).append(r)
+        for day, day_rows in by_day.items():
+            path = self._day_path(day)
+            new_file = not path.exists()
+            fieldnames = COLUMNS
+            if not new_file:
+                # keep the header a partition was started with (columns may be added later)
+                with open(path, newline="", encoding="utf-8") as fh:
+                    fieldnames = next(csv.reader(fh), None) or COLUMNS
+            with open(path, "a", newline="", encoding="utf-8") as fh:
+                writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore")
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(day_rows)
+                fh.flush()
+                os.fsync(fh.fileno())
+        return sum(len(v) for v in by_day.values())
+
+    # ------- read -------
+    def partitions(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[pathlib.Path]:
+        """Partition files that can hold samples in [start, end)."""
+        lo = start.date() if start else date.min
+        hi = end.date() if end else date.max
+        out = []
+        for p in sorted(self.root.iterdir()):
+            name = p.name
+            if name.startswith("day=") and name.endswith(".csv"):
+                d = date.fromisoformat(name[4:14])
+                if lo <= d <= hi:
+                    out.append(p)
+            elif name.startswith("month=") and name.endswith(".csv.gz"):
+                y, m = (int(x) for x in name[6:13].split("-"))
+                first = date(y, m, 1)
+                last = date(y + (m == 12), m % 12 + 1, 1)
+                if first <= hi and last > lo:
+                    out.append(p)
+        return out
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              installation_id: Optional[int] = None) -> pd.DataFrame:
+        parts = self.partitions(start, end)
+        if not parts:
+            return pd.DataFrame(columns=COLUMNS)
+        df = pd.concat([pd.read_csv(p) for p in parts], ignore_index=True)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
+        if start is not None:
+            df = df[df["timestamp"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["timestamp"] < pd.Timestamp(end)]
+        if installation_id is not None:
+            df = df[df["installation_id"] == int(installation_id)]
+        return df.sort_values("timestamp").reset_index(drop=True)
+
+    # ------- maintenance -------
+    def compact(self, today: Optional[date] = None) -> int:
+        """Fold daily partitions of finished months into month=YYYY-MM.csv.gz. Returns files folded."""
+        today = today or datetime.now(timezone.utc).date()
+        current = today.strftime("%Y-%m")
+        by_month: Dict[str, List[pathlib.Path]] = {}
+        for p in self.root.glob("day=*.csv"):
+            month = p.name[4:11]
+            if month < current:
+                by_month.setdefault(month, []).append(p)
+
+        folded = 0
+        for month, days in sorted(by_month.items()):
+            target = self._month_path(month)
+            frames = [pd.read_csv(target)] if target.exists() else []
+            frames += [pd.read_csv(p) for p in sorted(days)]
+            df = pd.concat(frames, ignore_index=True).sort_values("timestamp")
+            tmp = target.with_name(target.name + ".tmp")
+            df.to_csv(tmp, index=False, compression="gzip")
+            os.replace(tmp, target)
+            for p in days:
+                p.unlink()
+            folded += len(days)
+            log.info(f"Compacted {len(days)} day partition(s) into {target.name}")
+        return folded
+
+    def import_legacy(self, legacy_csv: pathlib.Path) -> int:
+        """Split an old single-file api_usage_samples.csv into partitions, then rename it *.imported."""
+        legacy_csv = pathlib.Path(legacy_csv)
+        if not legacy_csv.exists():
+            return 0
+        df = pd.read_csv(legacy_csv)
+        if "timestamp" not in df.columns:
+            log.warning(f"{legacy_csv} has no 'timestamp' column; not a samples log, leaving it alone.")
+            return 0
+        n = self.append(df.to_dict("records"))
+        legacy_csv.rename(legacy_csv.with_name(legacy_csv.name + ".imported"))
+        log.info(f"Imported {n} legacy samples from {legacy_csv}")
+        return n
@@ -2,6 +2,9 @@ import requests
 import pandas as pd
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import ratelimit_telemetry
+
+ratelimit_telemetry.install()
 
 # -------- CONFIG --------
 GITHUB_TOKEN = "ghp_yourPAT"